@@ -0,0 +1,145 @@
+"""End-to-end benchmark of the task graph against a local stub LLM server.
+
+Starts `benchmarks.stub_server.StubLLMServer`, points the agents at it through
+MY_AGENT_LLM_ENDPOINTS and runs the full `src.graph.graph.graph` `--runs` times
+with `--concurrency` runs in flight. Reports latency percentiles, throughput,
+LLM calls per run, the estimated shared prompt-prefix ratio and peak RSS, so
+that performance changes can be compared against a fixed, reproducible baseline.
+
+    python -m benchmarks.bench_graph --runs 32 --concurrency 8 --tps 100 --ttft 0.1
+    python -m benchmarks.bench_graph --mode sync --json
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from benchmarks.stub_server import StubLLMServer
+from src.log import logger
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+async def run_async(graph, runs: int, concurrency: int, state_cls) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            state = await graph.ainvoke(state_cls(user_task=f'基准任务 {i}'))
+            assert state['task_finish'], state
+            return time.perf_counter() - start
+
+    return list(await asyncio.gather(*(one(i) for i in range(runs))))
+
+
+def run_sync(graph, runs: int, concurrency: int, state_cls) -> List[float]:
+    def one(i: int) -> float:
+        start = time.perf_counter()
+        state = graph.invoke(state_cls(user_task=f'基准任务 {i}'))
+        assert state['task_finish'], state
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(runs)))
+
+
+def benchmark(args) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix='bench_graph_')
+    for name in ('a.txt', 'b.txt', 'c.txt'):
+        open(os.path.join(workdir, name), 'w').close()
+    with StubLLMServer(tps=args.tps, ttft=args.ttft, think_tokens=args.think_tokens, tool_calls=args.tool_calls,
+                       subtasks=args.subtasks, tool_path=workdir) as server:
+        # 图模块在导入时创建各个智能体，需在导入前设置服务地址
+        os.environ['MY_AGENT_LLM_ENDPOINTS'] = server.base_url
+        os.environ.setdefault('MY_AGENT_PREFIX_STATS', '1')
+        graph_module = importlib.import_module('src.graph.graph')
+        state_cls = importlib.import_module('src.agent.agent_state').AgentState
+        graph = graph_module.graph
+        prefix = importlib.import_module('src.assistant.prefix').get_prefix_estimator(force=True)
+
+        if args.mode == 'async':
+            async def measure():
+                # 共享的异步 HTTP 客户端绑定在事件循环上，预热与测量需在同一个事件循环中执行
+                for _ in range(args.warmup):
+                    await run_async(graph, 1, 1, state_cls)
+                server.reset()
+                prefix.reset()
+                started = time.perf_counter()
+                return await run_async(graph, args.runs, args.concurrency, state_cls), time.perf_counter() - started
+
+            latencies, wall = asyncio.run(measure())
+        else:
+            # 预热：建立连接、加载工具等一次性开销不计入结果
+            for _ in range(args.warmup):
+                run_sync(graph, 1, 1, state_cls)
+            server.reset()
+            prefix.reset()
+            start = time.perf_counter()
+            latencies = run_sync(graph, args.runs, args.concurrency, state_cls)
+            wall = time.perf_counter() - start
+        requests, tokens = server.requests, server.completion_tokens
+
+    return {
+        'mode': args.mode,
+        'runs': args.runs,
+        'concurrency': args.concurrency,
+        'wall_s': round(wall, 3),
+        'runs_per_s': round(args.runs / wall, 3),
+        'p50_s': round(percentile(latencies, 50), 3),
+        'p95_s': round(percentile(latencies, 95), 3),
+        'mean_s': round(statistics.mean(latencies), 3),
+        'llm_calls_per_run': round(requests / args.runs, 2),
+        'completion_tokens_per_run': round(tokens / args.runs, 1),
+        'prefix_ratio': prefix.stats()['ratio'],
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=16)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--mode', choices=['async', 'sync'], default='async',
+                        help='async 使用 graph.ainvoke，sync 在线程池中使用 graph.invoke')
+    parser.add_argument('--tps', type=float, default=200, help='stub 服务每秒输出的 token 数，0 表示不限速')
+    parser.add_argument('--ttft', type=float, default=0.05, help='stub 服务首 token 延迟（秒）')
+    parser.add_argument('--think-tokens', type=int, default=32)
+    parser.add_argument('--tool-calls', type=int, default=1, help='知识与执行智能体每次调用的工具轮数')
+    parser.add_argument('--subtasks', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果，便于保存为基线')
+    args = parser.parse_args()
+
+    if not os.getenv('MY_AGENT_DEBUG'):
+        logger.setLevel(logging.WARNING)
+    result = benchmark(args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        for key, value in result.items():
+            print(f'{key:>26}: {value}')
+
+
+if __name__ == '__main__':
+    main()
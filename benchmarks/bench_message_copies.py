@@ -0,0 +1,66 @@
+"""Allocation benchmark for preparing messages before each LLM turn.
+
+Measures the tracemalloc peak and time of `BaseAssistant._prepare_messages`
+on a history carrying large tool outputs, against the previous behaviour that
+deep-copied the message list in `_prepare_messages` and again in
+`_preprocess_messages`.
+
+    python -m benchmarks.bench_message_copies --turns 20 --tool-kb 256
+"""
+import argparse
+import copy
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from src.assistant.qwen_assistant import QwenAssistant
+from src.tools import all_tools
+
+
+def make_history(turns: int, tool_kb: int) -> List[BaseMessage]:
+    """系统提示 + 若干条携带大段工具输出的用户消息，内容按 1KB 拆分为多个文本片段"""
+    messages: List[BaseMessage] = [SystemMessage('你是执行智能体。\n\n{tools}')]
+    for i in range(turns):
+        parts = [{'type': 'text', 'text': f'{i}:{j}:' + 'x' * 1016} for j in range(tool_kb)]
+        messages.append(HumanMessage(content=parts))
+    return messages
+
+
+def legacy_prepare(assistant: QwenAssistant, messages: List[BaseMessage]) -> List[BaseMessage]:
+    """旧实现的复制次数：_prepare_messages 与 _preprocess_messages 各深拷贝一次"""
+    return assistant._prepare_messages(copy.deepcopy(copy.deepcopy(messages)), usetool=True)
+
+
+def measure(fn: Callable[[], object], repeat: int = 5) -> Tuple[float, float]:
+    """返回 (峰值分配 MB, 单次耗时 ms)"""
+    fn()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return peak / 2 ** 20, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, nargs='+', default=[5, 20, 50], help='携带工具输出的消息数')
+    parser.add_argument('--tool-kb', type=int, default=256, help='每条消息中工具输出的大小（KB）')
+    args = parser.parse_args()
+
+    assistant = QwenAssistant(function_list=all_tools, llm=None, system='系统提示')
+    print(f"{'msgs':>6} {'history(MB)':>12} {'legacy peak(MB)':>16} {'peak(MB)':>9} {'legacy(ms)':>11} {'ms':>8}")
+    for turns in args.turns:
+        history = make_history(turns, args.tool_kb)
+        size = turns * args.tool_kb / 1024
+        legacy_peak, legacy_ms = measure(lambda: legacy_prepare(assistant, history))
+        peak, ms = measure(lambda: assistant._prepare_messages(history, usetool=True))
+        print(f"{turns:>6} {size:>12.1f} {legacy_peak:>16.2f} {peak:>9.2f} {legacy_ms:>11.2f} {ms:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Microbenchmark for the streaming tool-call parser.
+
+Compares the incremental StreamParser with the old approach of re-running
+`_postprocess_messages` on the accumulated response after every chunk.
+
+    python -m benchmarks.bench_stream_parser --tokens 6250 12500 25000 50000 --baseline
+"""
+import argparse
+import json
+import random
+import time
+from typing import List
+
+from langchain_core.messages import AIMessage
+
+from src.assistant.qwen_assistant import QwenAssistant
+from src.assistant.stream_parser import StreamParser
+
+WORDS = ['模型', '推理', 'token', '的', 'vLLM', '缓存', 'tool', '调用', 'step', '结果', ' ', '\n']
+
+
+def make_chunks(tokens: int, tool_calls: int = 4, seed: int = 0) -> List[str]:
+    """生成一个 tokens 长度的流式响应：长 think 块 + 正文 + 若干工具调用，每个分块约一个 token"""
+    rng = random.Random(seed)
+    body = tokens - tool_calls * 20
+    chunks = ['<think>'] + [rng.choice(WORDS) for _ in range(int(body * 0.8))] + ['</think>']
+    chunks += [rng.choice(WORDS) for _ in range(body - int(body * 0.8))]
+    for i in range(tool_calls):
+        call = json.dumps({"name": "search_web", "arguments": {"keyword": f"q{i}"}})
+        # 标签与 json 按小分块输出，模拟真实的 token 边界
+        text = f'<tool_call>\n{call}\n</tool_call>\n'
+        chunks += [text[j:j + 3] for j in range(0, len(text), 3)]
+    return chunks
+
+
+def run_incremental(assistant: QwenAssistant, chunks: List[str]) -> int:
+    parser = StreamParser(assistant._parse_tool_call)
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return len(parser.to_messages()[-1].tool_calls)
+
+
+def run_baseline(assistant: QwenAssistant, chunks: List[str]) -> int:
+    full_resp = ''
+    output = []
+    for chunk in chunks:
+        full_resp += chunk
+        output = assistant._postprocess_messages(AIMessage(content=full_resp))
+    return len(output[-1].tool_calls)
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, nargs='+', default=[6250, 12500, 25000, 50000])
+    parser.add_argument('--baseline', action='store_true', help='同时测量旧的全量重解析方式（较慢）')
+    args = parser.parse_args()
+
+    assistant = QwenAssistant(llm=None)
+    print(f"{'tokens':>8} {'incremental(s)':>15} {'us/token':>9}" + (f" {'baseline(s)':>12} {'speedup':>8}" if args.baseline else ''))
+    for tokens in args.tokens:
+        chunks = make_chunks(tokens)
+        assert run_incremental(assistant, chunks) == 4
+        inc = min(timed(run_incremental, assistant, chunks) for _ in range(3))
+        line = f"{tokens:>8} {inc:>15.4f} {inc / tokens * 1e6:>9.2f}"
+        if args.baseline:
+            base = timed(run_baseline, assistant, chunks)
+            line += f" {base:>12.3f} {base / inc:>7.0f}x"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""A local OpenAI-compatible `/v1/chat/completions` server for benchmarks.
+
+Replies are scripted from the system prompt of each agent, so the full graph
+(knowledge -> plan -> execute) runs end to end without a real model:
+
+- 前置知识智能体: calls `tree_dir` `tool_calls` times, then returns a markdown background block
+- PlannerAgent: returns `subtasks` independent subtasks with finish=true
+- 执行智能体: calls `list_dir` `tool_calls` times, then returns a success result
+
+Output is paced by `ttft` (seconds before the first chunk) and `tps` (chunks per
+second, one chunk per token), and each reply starts with a `<think>` block of
+`think_tokens` filler tokens.
+
+    python -m benchmarks.stub_server --port 8000 --tps 50 --ttft 0.2
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+FILLER = ['分析', '任务', '需要', 'the', '结果', '工具', '目录', 'step', '，', '然后']
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭空闲的 keep-alive 连接时会出现连接重置，不需要打印
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class StubLLMServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, tps: float = 0, ttft: float = 0,
+                 think_tokens: int = 32, tool_calls: int = 1, subtasks: int = 3, tool_path: str = '.'):
+        self.tps = tps
+        self.ttft = ttft
+        self.think_tokens = think_tokens
+        self.tool_calls = tool_calls
+        self.subtasks = subtasks
+        self.tool_path = tool_path
+        self.requests = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self) -> 'StubLLMServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-llm', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.completion_tokens = 0
+
+    def reply(self, messages: List[Dict[str, Any]]) -> List[str]:
+        """按请求中的 system prompt 选择脚本，返回按 token 切分的回复"""
+        system = next((m.get('content') or '' for m in messages if m.get('role') == 'system'), '')
+        system = system if isinstance(system, str) else json.dumps(system, ensure_ascii=False)
+        called = sum(1 for m in messages if m.get('role') == 'tool' or '<tool_response>' in str(m.get('content')))
+        chunks = ['<think>'] + [FILLER[i % len(FILLER)] for i in range(self.think_tokens)] + ['</think>\n']
+        if '前置知识智能体' in system:
+            if called < self.tool_calls:
+                return chunks + _split(_tool_call('tree_dir', {'path': self.tool_path}))
+            body = '``` markdown\n# 背景知识\n- 涉及领域：基准测试\n- 已知事实：目录结构已获取\n- 潜在难点：无\n```'
+        elif 'PlannerAgent' in system:
+            items = [{'index': i, 'task': f'子任务{i}', 'goal': '检查目录', 'desc': '列出目录内容', 'correlation': '3',
+                      'extra_info': '', 'depends': []} for i in range(1, self.subtasks + 1)]
+            body = '```json\n' + json.dumps({'finish': True, 'taskItems': items}, ensure_ascii=False) + '\n```'
+        elif '执行智能体' in system:
+            if called < self.tool_calls:
+                return chunks + _split(_tool_call('list_dir', {'path': self.tool_path}))
+            body = '```json\n' + json.dumps({'status': 'success', 'result': '目录内容已列出'}, ensure_ascii=False) + '\n```'
+        else:
+            body = 'ok'
+        return chunks + _split(body)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._send_json({'object': 'list', 'data': [{'id': 'stub', 'object': 'model'}]})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                chunks = stub.reply(body.get('messages', []))
+                with stub._lock:
+                    stub.requests += 1
+                    stub.completion_tokens += len(chunks)
+                usage = {'prompt_tokens': len(json.dumps(body.get('messages', []), ensure_ascii=False)) // 4,
+                         'completion_tokens': len(chunks)}
+                usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+                if stub.ttft:
+                    time.sleep(stub.ttft)
+                if not body.get('stream'):
+                    if stub.tps:
+                        time.sleep(len(chunks) / stub.tps)
+                    return self._send_json({
+                        'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': 'stub',
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': ''.join(chunks)}}],
+                        'usage': usage})
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for i, piece in enumerate(chunks):
+                    if stub.tps and i:
+                        time.sleep(1 / stub.tps)
+                    self._event({'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]})
+                self._event({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+                if (body.get('stream_options') or {}).get('include_usage'):
+                    self._event({'choices': [], 'usage': usage})
+                self._write(b'data: [DONE]\n\n')
+                self._write(b'')
+
+            def _event(self, payload: Dict[str, Any]):
+                chunk = {'id': 'stub', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'stub', **payload}
+                self._write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode())
+
+            def _write(self, data: bytes):
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+
+            def _send_json(self, payload: Dict[str, Any]):
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def _tool_call(name: str, arguments: Dict[str, Any]) -> str:
+    return f'<tool_call>\n{json.dumps({"name": name, "arguments": arguments}, ensure_ascii=False)}\n</tool_call>'
+
+
+def _split(text: str, size: int = 4) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--tps', type=float, default=50, help='每秒输出的 token 数，0 表示不限速')
+    parser.add_argument('--ttft', type=float, default=0.2, help='首 token 延迟（秒）')
+    parser.add_argument('--think-tokens', type=int, default=32)
+    parser.add_argument('--tool-calls', type=int, default=1, help='知识与执行智能体每次调用的工具轮数')
+    parser.add_argument('--subtasks', type=int, default=3)
+    args = parser.parse_args()
+    server = StubLLMServer(args.host, args.port, tps=args.tps, ttft=args.ttft, think_tokens=args.think_tokens,
+                           tool_calls=args.tool_calls, subtasks=args.subtasks)
+    print(f'listening on {server.base_url}')
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,11 @@ class TaskItem:
     desc: Optional[str] = None
     correlation: Optional[int] = None
     extra_info: Optional[str] = None
+    # 依赖的子任务index，为空表示可与其他子任务并行执行
+    depends: Optional[List[int]] = None
     result: Optional[str] = None
+    # 执行状态：success / failed，未执行为 None
+    status: Optional[str] = None
 
 
 @dataclass
@@ -27,11 +31,13 @@ class AgentState:
     knowledge: Any = ""
     # planner相关
     task_finish: bool = False
-    executed_index = []
+    executed_index: List[int] = field(default_factory=list)
     task_list: List[TaskItem] = field(default_factory=list)
 
     messages: List[Any] = field(default_factory=list)
     response: Any = ""
+    # 开启追踪时各节点结束后的耗时与 token 汇总
+    trace_summary: Dict[str, Any] = field(default_factory=dict)
 
 class ModelMode(Enum):
     REMOTE_DS = "remote_deepseek",
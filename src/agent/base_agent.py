@@ -1,14 +1,21 @@
+import logging
+import os
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import List, Optional, Union, Iterator
+from typing import List, Optional, Union, Iterator, Iterable, AsyncIterator
 
 from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.runnables.config import run_in_executor
 
 from src.agent.agent_state import ModelMode, AgentState
+from src.agent.schema import guided_json, structured_output_enabled
 from src.assistant.assistant import BaseAssistant
+from src.assistant.cache import is_deterministic
 from src.assistant.qwen_assistant import QwenAssistant
+from src.assistant.stream_parser import StreamParser, StreamEvent, THINK, CONTENT
 from src.log import logger
 from src.tools import all_tools
+from src.trace import AGENT, span as trace_span, trace_iter
 
 
 @dataclass
@@ -17,6 +24,32 @@ class Response:
     think: Optional[str] = ''
     tool_calls: dict = field(default_factory=dict)
 
+    @classmethod
+    def join(cls, response: Union['Response', Iterable['Response']]) -> 'Response':
+        """
+        将流式输出的增量 Response 合并为完整的 Response，非流式的 Response 原样返回。
+        工具结果之后的内容属于新一轮 LLM 输出，与非流式一致，仅保留最后一轮的 think/content。
+        """
+        if isinstance(response, Response):
+            return response
+        r = cls()
+        new_turn = False
+        for delta in response:
+            for call_id, (call, result) in delta.tool_calls.items():
+                merged = r.tool_calls.setdefault(call_id, [None, None])
+                merged[0] = call or merged[0]
+                merged[1] = result or merged[1]
+                new_turn = new_turn or result is not None
+            if delta.think or delta.content:
+                if new_turn:
+                    r.think, r.content = '', ''
+                    new_turn = False
+                r.think += delta.think
+                r.content += delta.content
+        r.think = r.think.strip()
+        r.content = r.content.strip()
+        return r
+
 
 @dataclass
 class BaseAgent(ABC):
@@ -25,14 +58,17 @@ class BaseAgent(ABC):
     stream: bool = False
 
     def __init__(self, mode: ModelMode, llm: BaseAssistant = None, llm_cfg: dict = {}, system_prompt: str = None,
-                 stream: bool = False):
+                 stream: bool = False, context_budget: Union[int, dict, None] = None,
+                 structured_output: Optional[bool] = None):
         if llm_cfg is None:
             llm_cfg = {}
+        self.mode = mode
+        self.stream = stream
+        # 结构化输出：通过 guided_json 约束模型输出 JSON，默认读取环境变量 MY_AGENT_STRUCTURED_OUTPUT
+        self.structured_output = structured_output_enabled(structured_output)
         if llm:
             self.llm = llm
             return
-        self.mode = mode
-        self.stream = stream
         if mode == ModelMode.LOCAL_QWEN:
             default_cfg = {
                 # 使用与 OpenAI API 兼容的模型服务，例如 vLLM 或 Ollama：
@@ -48,52 +84,170 @@ class BaseAgent(ABC):
                     },
                 }
             }
+            if os.getenv('MY_AGENT_LLM_ENDPOINTS'):
+                # 多个 LLM 服务副本，逗号分隔，按负载路由并自动故障转移
+                default_cfg['model_type'] = 'router'
+                default_cfg['endpoints'] = [url.strip() for url in os.getenv('MY_AGENT_LLM_ENDPOINTS').split(',')
+                                            if url.strip()]
+            if os.getenv('MY_AGENT_LLM_SEED'):
+                default_cfg['generate_cfg']['seed'] = int(os.getenv('MY_AGENT_LLM_SEED'))
+            if os.getenv('MY_AGENT_LLM_CACHE'):
+                # 开启 LLM 响应缓存，值为 SQLite 缓存文件路径；缓存只用于确定的采样，未指定 seed 时固定为 0
+                default_cfg['cache'] = {'path': os.getenv('MY_AGENT_LLM_CACHE'),
+                                        'ttl': float(os.getenv('MY_AGENT_LLM_CACHE_TTL', '86400'))}
+                default_cfg['generate_cfg'].setdefault('seed', 0)
             if llm_cfg:
                 llm_cfg = {**default_cfg, **llm_cfg}
             else:
                 llm_cfg = default_cfg
-            self.llm = QwenAssistant(function_list=all_tools, llm=llm_cfg, name='qwen', system=system_prompt)
+            if llm_cfg.get('cache') and not is_deterministic(llm_cfg.get('generate_cfg')):
+                logger.warning('[BASE_AGENT] 已开启 LLM 响应缓存，但 generate_cfg 中没有 seed 且 temperature 不为 0，缓存不会命中')
+            if context_budget is None:
+                # 工具循环的上下文 token 预算，0 表示不限制
+                context_budget = int(os.getenv('MY_AGENT_CONTEXT_TOKENS', '32768'))
+            self.llm = QwenAssistant(function_list=all_tools, llm=llm_cfg, name='qwen', system=system_prompt,
+                                     context_budget=context_budget)
 
-    def invoke_llm(self, messages: List[BaseMessage], tools: [str] = None, use_tool: bool = True) -> Union[Response, Iterator[Response]]:
+    def invoke_llm(self, messages: List[BaseMessage], tools: [str] = None, use_tool: bool = True,
+                   generate_cfg: Optional[dict] = None) -> Union[Response, Iterator[Response]]:
         if self.stream:
-            response = self.llm.run(messages, stream=self.stream)
-            r = Response()
-            # TODO: yield
-            # yield r
+            return trace_iter(type(self).__name__, AGENT, self.stream_llm(messages, tools=tools, use_tool=use_tool,
+                                                                          generate_cfg=generate_cfg))
         else:
-            r = Response()
-            raw = ''
-            fn_call = {}
-            fn_resp = {}
-            for msg_batch in self.llm.run(messages, stream=self.stream, tool_names=tools, usetool=use_tool):
-                for response in msg_batch:
-                    logger.debug(f"输入消息: {messages}; 响应: {response}")
-                    if isinstance(response, ToolMessage):
-                        fn_resp[response.tool_call_id] = response
-                    elif hasattr(response, "tool_calls") and response.tool_calls:
-                        for tool_call in response.tool_calls:
-                            if hasattr(tool_call, "id") and tool_call.id:
-                                fn_call[tool_call.id] = response
-                    raw = response.content
-            start_tag = "<think>"
-            end_tag = "</think>"
-            start_idx = raw.find(start_tag)
-            end_idx = raw.find(end_tag)
-            if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                think = raw[start_idx + len(start_tag):end_idx].strip()
-                content = raw[end_idx + len(end_tag):].lstrip()
-            else:
-                think = ""
-                content = raw.strip()
-            r.think = think
-            r.content = content
-            for call_id in set(fn_call) | set(fn_resp):  # 并集，保证两个字典都能覆盖
-                r.tool_calls[call_id] = [
-                    fn_call.get(call_id),
-                    fn_resp.get(call_id),
-                ]
-            return r
+            with trace_span(type(self).__name__, AGENT):
+                collector = _ResponseCollector(messages)
+                for msg_batch in self.llm.run(messages, stream=self.stream, tool_names=tools, usetool=use_tool,
+                                              generate_cfg=generate_cfg):
+                    collector.add(msg_batch)
+                return collector.response()
+
+    def stream_llm(self, messages: List[BaseMessage], tools: [str] = None, use_tool: bool = True,
+                   generate_cfg: Optional[dict] = None) -> Iterator[Response]:
+        """
+        流式调用 LLM，逐个返回增量 Response：think/content 为本次新增的文本，tool_calls 为本次新增的工具调用或结果。
+        在 LangGraph 节点中调用时，token 同时会通过 stream_mode="messages" 输出。
+        """
+        collector = _StreamCollector(messages)
+        for msg_batch in self.llm.run(messages, stream=True, tool_names=tools, usetool=use_tool,
+                                      generate_cfg=generate_cfg):
+            yield from collector.add(msg_batch)
+        yield from collector.flush()
+
+    async def ainvoke_llm(self, messages: List[BaseMessage], tools: [str] = None, use_tool: bool = True,
+                          generate_cfg: Optional[dict] = None) -> Response:
+        """invoke_llm 的异步版本，LLM 与工具调用均不阻塞事件循环"""
+        with trace_span(type(self).__name__, AGENT):
+            if self.stream:
+                deltas = self.astream_llm(messages, tools=tools, use_tool=use_tool, generate_cfg=generate_cfg)
+                return Response.join([delta async for delta in deltas])
+            collector = _ResponseCollector(messages)
+            async for msg_batch in self.llm.arun(messages, stream=self.stream, tool_names=tools, usetool=use_tool,
+                                                 generate_cfg=generate_cfg):
+                collector.add(msg_batch)
+            return collector.response()
+
+    async def astream_llm(self, messages: List[BaseMessage], tools: [str] = None, use_tool: bool = True,
+                          generate_cfg: Optional[dict] = None) -> AsyncIterator[Response]:
+        """stream_llm 的异步版本"""
+        collector = _StreamCollector(messages)
+        async for msg_batch in self.llm.arun(messages, stream=True, tool_names=tools, usetool=use_tool,
+                                             generate_cfg=generate_cfg):
+            for delta in collector.add(msg_batch):
+                yield delta
+        for delta in collector.flush():
+            yield delta
+
+    def guided_cfg(self, schema: dict) -> Optional[dict]:
+        """开启结构化输出时按 schema 约束解码的生成参数，未开启时为 None"""
+        return guided_json(schema) if self.structured_output else None
 
     @abstractmethod
     def run(self, state: AgentState, **kwargs) -> AgentState:
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    async def arun(self, state: AgentState, **kwargs) -> AgentState:
+        """run 的异步版本，未实现异步逻辑的 Agent 在线程池中执行 run"""
+        return await run_in_executor(None, self.run, state, **kwargs)
+
+
+class _ResponseCollector:
+    """汇总 BaseAssistant.run 输出的消息批次，生成最终的 Response"""
+
+    def __init__(self, messages: List[BaseMessage]):
+        self.messages = messages
+        self.raw = ''
+        self.fn_call = {}
+        self.fn_resp = {}
+
+    def add(self, msg_batch: List[BaseMessage]):
+        for response in msg_batch:
+            if logger.isEnabledFor(logging.DEBUG):
+                # 格式化整个上下文的开销与历史长度成正比，仅在开启调试日志时执行
+                logger.debug(f"输入消息: {self.messages}; 响应: {response}")
+            if isinstance(response, ToolMessage):
+                self.fn_resp[response.tool_call_id] = response
+            elif hasattr(response, "tool_calls") and response.tool_calls:
+                for tool_call in response.tool_calls:
+                    if hasattr(tool_call, "id") and tool_call.id:
+                        self.fn_call[tool_call.id] = response
+            self.raw = response.content
+
+    def response(self) -> Response:
+        r = Response()
+        raw = self.raw
+        start_tag = "<think>"
+        end_tag = "</think>"
+        start_idx = raw.find(start_tag)
+        end_idx = raw.find(end_tag)
+        if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
+            think = raw[start_idx + len(start_tag):end_idx].strip()
+            content = raw[end_idx + len(end_tag):].lstrip()
+        else:
+            think = ""
+            content = raw.strip()
+        r.think = think
+        r.content = content
+        for call_id in set(self.fn_call) | set(self.fn_resp):  # 并集，保证两个字典都能覆盖
+            r.tool_calls[call_id] = [
+                self.fn_call.get(call_id),
+                self.fn_resp.get(call_id),
+            ]
+        return r
+
+
+class _StreamCollector:
+    """将 BaseAssistant.run(stream=True) 输出的消息批次转换为增量 Response"""
+
+    def __init__(self, messages: List[BaseMessage]):
+        self.messages = messages
+        # 工具调用由 QwenAssistant 解析后单独输出，这里只关心 think/content
+        self.parser = StreamParser(lambda text, complete=True: None)
+
+    def add(self, msg_batch: List[BaseMessage]) -> List[Response]:
+        deltas = []
+        for msg in msg_batch:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"输入消息: {self.messages}; 增量响应: {msg}")
+            if isinstance(msg, ToolMessage):
+                # 工具结果意味着本轮 LLM 输出结束
+                deltas.extend(self.flush())
+                deltas.append(Response(tool_calls={msg.tool_call_id: [None, msg]}))
+                continue
+            if msg.content:
+                deltas.extend(self._to_responses(self.parser.feed(msg.content)))
+            for tool_call in getattr(msg, 'tool_calls', None) or []:
+                deltas.append(Response(tool_calls={tool_call.get('id'): [msg, None]}))
+        return deltas
+
+    def flush(self) -> List[Response]:
+        deltas = self._to_responses(self.parser.close())
+        self.parser = StreamParser(self.parser.parse_tool_call)
+        return deltas
+
+    @staticmethod
+    def _to_responses(events: List[StreamEvent]) -> List[Response]:
+        think = ''.join(e.text for e in events if e.type == THINK)
+        content = ''.join(e.text for e in events if e.type == CONTENT)
+        if think or content:
+            return [Response(content=content, think=think)]
+        return []
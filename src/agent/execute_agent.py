@@ -1,13 +1,19 @@
-import json
-import re
-from dataclasses import asdict
+import asyncio
+import os
+from concurrent.futures import wait, FIRST_COMPLETED
+from typing import Dict, Optional
 
 import json5
-from langchain_core.messages import SystemMessage, HumanMessage
-
-from src.agent.agent_state import AgentState
-from src.agent.base_agent import BaseAgent
+from langchain_core.messages import SystemMessage
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+from src.agent.agent_state import AgentState, ModelMode, TaskItem
+from src.agent.base_agent import BaseAgent, Response
+from src.agent.prompt import assemble, system_message
+from src.agent.schema import RESULT_SCHEMA, has_keys
+from src.agent.task_graph import TaskScheduler
 from src.log import logger
+from src.utils.json_repair import parse_json
 
 system_prompt = """
 
@@ -97,55 +103,113 @@ system_prompt = """
 
 ---
 
-"""
-
-human_prompt = """
-## 原始任务
-
-{task}
-
-## 背景知识
-
-{knowledge}
-
-## 子任务信息
-
-{subTask}
-
-
 """
 
 class GeneralExecuteAgent(BaseAgent):
     """
     通用任务执行Agent
+
+    子任务按依赖关系组成DAG，无依赖关系的子任务在有界线程池中并行执行。
+    并发数可通过 max_workers 或环境变量 MY_AGENT_EXECUTE_WORKERS 配置。
     """
 
+    def __init__(self, mode: ModelMode, max_workers: Optional[int] = None, dependency_mode: str = 'explicit',
+                 **kwargs):
+        super().__init__(mode, **kwargs)
+        if max_workers is None:
+            max_workers = int(os.getenv('MY_AGENT_EXECUTE_WORKERS', '4'))
+        self.max_workers = max(1, max_workers)
+        self.dependency_mode = dependency_mode
+
     def getSystemMessage(self) -> SystemMessage:
-        return SystemMessage(content=system_prompt)
+        return system_message(system_prompt)
 
     def run(self, state: AgentState, **kwargs) -> AgentState:
-        task_list = state.task_list
-        for task in task_list:
-            if task.index not in state.executed_index:
-                self.executeTask(state, task)
-                state.executed_index.append(task.index)
-
-    def executeTask(self, state, task):
-        human_message = HumanMessage(
-            content=human_prompt.format(task=state.user_task, knowledge=state.knowledge, subTask=json.dumps(asdict(task), ensure_ascii=False, indent=0)))
-        messages = [self.getSystemMessage()] + [human_message]
-        response = self.invoke_llm(messages)
-        content = response.content
-        match = re.search(r'```json\s*(\[.*?\]|\{.*?\})\s*```', content, re.DOTALL)
-        if match:
+        scheduler = TaskScheduler(state.task_list, state.executed_index, self.dependency_mode)
+        if not scheduler.pending:
+            return state
+        # 使用 ContextThreadPoolExecutor 传递上下文，子任务中的 LLM 输出同样可以被 LangGraph 流式捕获
+        with ContextThreadPoolExecutor(max_workers=min(self.max_workers, len(scheduler.pending)),
+                                       thread_name_prefix='execute_agent') as pool:
+            futures = {}
+            while scheduler.active:
+                for task, results in scheduler.ready():
+                    futures[pool.submit(self.executeTask, state, task, results)] = task
+                completed, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    scheduler.complete(futures.pop(future), future.exception())
+        state.executed_index.extend(scheduler.executed())
+        return state
+
+    async def arun(self, state: AgentState, **kwargs) -> AgentState:
+        """run 的异步版本，使用信号量限制同时执行的子任务数"""
+        scheduler = TaskScheduler(state.task_list, state.executed_index, self.dependency_mode)
+        if not scheduler.pending:
+            return state
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def execute(task: TaskItem, results: Dict[int, str]):
+            async with semaphore:
+                await self.aexecuteTask(state, task, results)
+
+        futures = {}
+        while scheduler.active:
+            for task, results in scheduler.ready():
+                futures[asyncio.ensure_future(execute(task, results))] = task
+            completed, _ = await asyncio.wait(futures, return_when=asyncio.FIRST_COMPLETED)
+            for future in completed:
+                scheduler.complete(futures.pop(future), future.exception())
+        state.executed_index.extend(scheduler.executed())
+        return state
+
+    def executeTask(self, state: AgentState, task: TaskItem, depend_results: Optional[Dict[int, str]] = None):
+        response = Response.join(self.invoke_llm(self._build_messages(state, task, depend_results)))
+        if not self._apply_result(task, response) and self.structured_output:
+            response = Response.join(self.invoke_llm(self._format_messages(task, response), tools=[], use_tool=False,
+                                                     generate_cfg=self.guided_cfg(RESULT_SCHEMA)))
+            self._apply_result(task, response)
+
+    async def aexecuteTask(self, state: AgentState, task: TaskItem, depend_results: Optional[Dict[int, str]] = None):
+        response = await self.ainvoke_llm(self._build_messages(state, task, depend_results))
+        if not self._apply_result(task, response) and self.structured_output:
+            response = await self.ainvoke_llm(self._format_messages(task, response), tools=[], use_tool=False,
+                                              generate_cfg=self.guided_cfg(RESULT_SCHEMA))
+            self._apply_result(task, response)
+
+    def _build_messages(self, state: AgentState, task: TaskItem, depend_results: Optional[Dict[int, str]] = None):
+        # 同一任务的所有子任务共享系统提示、原始任务与背景知识，子任务信息与依赖结果放在最后
+        return assemble(system_prompt, [
+            ('原始任务', state.user_task),
+            ('背景知识', state.knowledge),
+            ('子任务信息', task),
+            ('前置子任务结果', depend_results or None),
+        ])
+
+    def _format_messages(self, task: TaskItem, response: Response):
+        """
+        执行过程需要调用工具，无法全程约束解码；本地修复后仍无法解析结果时，
+        以约束解码将已有的回答整理为结果 JSON，不重新执行子任务
+        """
+        return assemble(system_prompt, [('子任务信息', task), ('执行结果', response.content)],
+                        instruction='以下是子任务的执行结果，请按输出格式整理为 JSON，不要调用工具：')
+
+    def _apply_result(self, task: TaskItem, response) -> bool:
+        """解析执行结果并写入子任务，无法解析时返回 False"""
+        loads = parse_json(response.content, accept=has_keys('status'))
+        if loads is not None:
             try:
-                loads = json.loads(match.group(1))
-                status = loads.get('status', False)
-                if not status:
+                status = str(loads.get('status', '')).lower()
+                if status not in ('success', 'true'):
                     result = loads.get('reason', '未知原因失败')
+                    task.status = 'failed'
                 else:
                     result = loads.get('result', '无结果')
+                    task.status = 'success'
                 task.result = result
                 logger.info(f"[EXECUTE_AGENT]子任务: {task.task}; 结果: {task.result}")
+                return True
             except Exception as e:
                 logger.error(f"[EXECUTE_AGENT] 解析execute_result失败: {e}")
+        else:
+            logger.error(f"[EXECUTE_AGENT] 未能从输出中解析出子任务 {task.index} 的结果")
+        return False
@@ -1,9 +1,11 @@
 import re
+from typing import List
 
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage
 
 from .agent_state import AgentState
-from .base_agent import BaseAgent
+from .base_agent import BaseAgent, Response
+from .prompt import assemble
 from ..log import logger
 
 system_prompt = """# 职责说明
@@ -36,23 +38,34 @@ ReviewerAgent（评审总结智能体）：判断任务是否完成，并反馈
 """
 
 
+tools = ['execute_command', 'list_sessions', 'read_output', 'wait_output', 'human_assistance', 'tree_dir', 'query_url', 'search_web']
+
+
 class KnowledgeAgent(BaseAgent):
 
 
     def run(self, state: AgentState, **kwargs) -> AgentState:
         return self.acquire_knowledge(state)
 
+    async def arun(self, state: AgentState, **kwargs) -> AgentState:
+        return await self.aacquire_knowledge(state)
+
     def acquire_knowledge(self, state: AgentState) -> AgentState:
         state.node = 'knowledge'
+        response = Response.join(self.invoke_llm(self._build_messages(state), tools=tools))
+        return self._apply_response(state, response)
+
+    async def aacquire_knowledge(self, state: AgentState) -> AgentState:
+        state.node = 'knowledge'
+        response = await self.ainvoke_llm(self._build_messages(state), tools=tools)
+        return self._apply_response(state, response)
 
+    def _build_messages(self, state: AgentState) -> List[BaseMessage]:
         # 1. 先用 LLM 获取 tool_calls
-        messages = [SystemMessage(content=system_prompt)]
-        messages.append(
-            HumanMessage(content=f"请为任务提供前置知识或必要准备，并调用工具获取相关信息：\n任务：{state.user_task}"))
-        response = self.invoke_llm(messages,
-                                   tools=['execute_command', 'list_sessions', 'read_output', 'human_assistance',
-                                          'tree_dir', 'query_url', 'search_web'])
+        return assemble(system_prompt, [('任务', state.user_task)],
+                        instruction='请为任务提供前置知识或必要准备，并调用工具获取相关信息：')
 
+    def _apply_response(self, state: AgentState, response) -> AgentState:
         # 将知识内容写入 state
         pattern = r"```markdown(.*?)```"
         matches = re.findall(pattern, response.content, re.DOTALL)
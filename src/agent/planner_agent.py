@@ -1,12 +1,16 @@
-import json
-import re
+from dataclasses import fields
 from typing import Any, Dict, List
 
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import AIMessage, SystemMessage
 
 from .agent_state import AgentState, TaskItem
-from .base_agent import BaseAgent
+from .base_agent import BaseAgent, Response
+from .prompt import assemble
+from .schema import PLAN_SCHEMA, has_keys
 from ..log import logger
+from ..utils.json_repair import parse_json
+
+TASK_ITEM_FIELDS = {f.name for f in fields(TaskItem)}
 
 systemMessage = SystemMessage(content="""
 你是 **PlannerAgent**，唯一职责是 **制定任务计划**。在你之前存在一个 **背景知识专家**（KnowledgeAgent），他提供与用户需求相关的所有已知事实。  
@@ -21,7 +25,7 @@ systemMessage = SystemMessage(content="""
    - 子任务制定标准：**子任务必须独立可执行且服务于最终任务目标**，清楚并充分的表达子任务目标和补充信息，确保可以根据你提供的子任务相关信息直接执行。  
    - 子任务制定完成的标准：**根据所有子任务执行结果，可以推导出最终答案**。  
 3. **ExecutorAgent**  
-   - 只能看到分配给它的子任务信息：`task`、`goal`、`desc`、`extra_info`。  
+   - 只能看到分配给它的子任务信息：`task`、`goal`、`desc`、`extra_info`，以及 `depends` 中所列子任务的执行结果。  
    - **无法感知其他子任务或其结果**。  
    - 如果需要背景知识或用户原始任务信息，必须在 `task`、`goal`、`desc`、`extra_info` 中明确提供。  
 ---
@@ -34,7 +38,8 @@ systemMessage = SystemMessage(content="""
    - `desc`：详细补充说明  
    - `correlation`：该子任务与最终答案的重要程度（1-5，5表示最关键）  
    - `extra_info`：附加信息或说明（可为空）  
-2. 子任务索引 `index` 严格递增，表示执行顺序。  
+   - `depends`：该子任务依赖的子任务 `index` 列表，依赖的子任务执行完成后才会执行本任务，并将其结果提供给本任务；无依赖则为空列表  
+2. 子任务索引 `index` 严格递增，表示执行顺序。没有依赖关系的子任务会被并行执行。  
 3. 子任务必须直接服务于最终任务目标，不得加入无关内容。  
 4. 输出结构**必须**为：
 
@@ -48,7 +53,8 @@ systemMessage = SystemMessage(content="""
       "goal": "任务目标",
       "desc": "任务详细描述或说明",
       "correlation": "相关性数值（1-5）",
-      "extra_info": "附加说明或信息"
+      "extra_info": "附加说明或信息",
+      "depends": [依赖的子任务index]
     }
   ]
 }
@@ -75,7 +81,8 @@ systemMessage = SystemMessage(content="""
       "goal": "生成待分析的核心关键词列表",
       "desc": "从背景知识专家提供的文本中，找出对最终分析最相关的名词和术语，注意名词必须准确提取",
       "correlation": "5",
-      "extra_info": "确保文本中的专有名词、术语和重要实体都被提取"
+      "extra_info": "确保文本中的专有名词、术语和重要实体都被提取",
+      "depends": []
     },
     {
       "index": 2,
@@ -83,7 +90,8 @@ systemMessage = SystemMessage(content="""
       "goal": "将关键词按照主题或类别进行归类",
       "desc": "根据第一步提取的关键词，给每个关键词打上主题标签，以便后续统计和分析",
       "correlation": "4",
-      "extra_info": ""
+      "extra_info": "",
+      "depends": [1]
     },
     {
       "index": 3,
@@ -91,7 +99,8 @@ systemMessage = SystemMessage(content="""
       "goal": "生成关键词统计表",
       "desc": "统计每个关键词在文本中的出现次数，生成可用于分析的频率表",
       "correlation": "5",
-      "extra_info": "确保结果格式可直接用于后续数据分析"
+      "extra_info": "确保结果格式可直接用于后续数据分析",
+      "depends": [1]
     }
   ]
 }
@@ -104,28 +113,28 @@ class PlannerAgent(BaseAgent):
     def run(self, state: AgentState, **kwargs) -> AgentState:
         return self.plan(state)
 
+    async def arun(self, state: AgentState, **kwargs) -> AgentState:
+        return await self.aplan(state)
+
     def plan(self, state: AgentState) -> AgentState:
         state.node = 'plan'
+        plan_result = self._decompose_task(self._build_messages(state))
+        return self._apply_plan(state, plan_result)
 
-        # 如果是第一次规划，分解任务
-        messages = [HumanMessage(
-                content=f"""
-                ## 用户任务
-                {state.user_task}
-                ---
-                
-                ## 已规划并执行的子任务
-                {state.task_list if state.task_list else '无'}
-                """)]
-        if state.knowledge:
-            systemMessage.content = systemMessage.content + """
-            ---
-
-以下是由KnowledgeAgent提供的内容：
-{knowledge}
----
-            """.format(knowledge=state.knowledge)
-        plan_result = self._decompose_task([systemMessage] + messages)
+    async def aplan(self, state: AgentState) -> AgentState:
+        state.node = 'plan'
+        plan_result = await self._adecompose_task(self._build_messages(state))
+        return self._apply_plan(state, plan_result)
+
+    def _build_messages(self, state: AgentState) -> List[Any]:
+        # 系统提示保持不变以复用服务端的前缀缓存，背景知识、用户任务与已规划的子任务依次放在用户消息中
+        return assemble(systemMessage.content, [
+            ('以下是由KnowledgeAgent提供的内容', state.knowledge),
+            ('用户任务', state.user_task),
+            ('已规划并执行的子任务', state.task_list or '无'),
+        ])
+
+    def _apply_plan(self, state: AgentState, plan_result: Dict) -> AgentState:
         task_list = self.merge_task_items(state.task_list, plan_result.get("task_list", []))
         state.task_list = task_list
         state.task_finish = plan_result.get("finish", [])
@@ -140,7 +149,16 @@ class PlannerAgent(BaseAgent):
         调用 deepseek 大模型自动分解任务。
         返回结构包含content、tool_calls等
         """
-        response = self.invoke_llm(messages, tools=[], use_tool=False)
+        response = Response.join(self.invoke_llm(messages, tools=[], use_tool=False,
+                                                 generate_cfg=self.guided_cfg(PLAN_SCHEMA)))
+        return self._parse_plan(response)
+
+    async def _adecompose_task(self, messages: List[Any]) -> Dict:
+        """_decompose_task 的异步版本"""
+        response = await self.ainvoke_llm(messages, tools=[], use_tool=False, generate_cfg=self.guided_cfg(PLAN_SCHEMA))
+        return self._parse_plan(response)
+
+    def _parse_plan(self, response) -> Dict:
         # 提取content
         if hasattr(response, "content"):
             content = getattr(response, "content", "")
@@ -151,16 +169,18 @@ class PlannerAgent(BaseAgent):
         # 提取task_list
         task_list = []
         finish = False
-        match = re.search(r'```json\s*(\[.*?\]|\{.*?\})\s*```', content, re.DOTALL)
-        if match:
+        # 结构化输出时 content 即为 JSON，否则从代码块中提取，格式有误时在本地修复
+        loads = parse_json(content, accept=has_keys('taskItems'))
+        if loads is not None:
             try:
-                loads = json.loads(match.group(1))
                 finish = loads.get('finish', False)
                 task_list = loads.get('taskItems', [])
-                # 转换为 List[TaskItem]
-                task_list = [TaskItem(**item) for item in task_list]
+                # 转换为 List[TaskItem]，忽略模型输出的多余字段
+                task_list = [TaskItem(**{k: v for k, v in item.items() if k in TASK_ITEM_FIELDS}) for item in task_list]
             except Exception as e:
                 logger.error(f"[DECOMPOSE_TASK] 解析task_list失败: {e}")
+        else:
+            logger.error(f"[DECOMPOSE_TASK] 未能从输出中解析出任务计划: {content[-200:]}")
         # 返回结构中带task_list
         return {
             "task_list": task_list,
@@ -0,0 +1,48 @@
+"""Prompt 组装。
+
+vLLM 的前缀缓存（automatic prefix caching）只复用与之前请求逐字节相同的开头部分，因此各智能体按以下顺序组装消息：
+1. 静态的系统提示（工具说明由 Assistant 填入，同样保持不变），同一段文本始终复用同一个 SystemMessage
+2. 变化的部分放在最后的用户消息中，按变化频率从低到高排列，例如 背景知识 → 用户任务 → 子任务 → 依赖结果，
+   同一任务的多个子任务或多次规划可以继续共享前面的部分
+
+系统提示在运行中不可修改，需要附加的内容放到用户消息中。
+"""
+import json
+import threading
+from dataclasses import asdict, is_dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+_system_messages: Dict[str, SystemMessage] = {}
+_system_messages_lock = threading.Lock()
+
+
+def system_message(prompt: str) -> SystemMessage:
+    """静态系统提示对应的消息，相同文本返回同一个对象"""
+    message = _system_messages.get(prompt)
+    if message is None:
+        with _system_messages_lock:
+            message = _system_messages.setdefault(prompt, SystemMessage(content=prompt))
+    return message
+
+
+def render_section(title: str, content: Any) -> str:
+    if is_dataclass(content) and not isinstance(content, type):
+        content = json.dumps(asdict(content), ensure_ascii=False, indent=0)
+    elif isinstance(content, list) and content and all(is_dataclass(item) for item in content):
+        content = json.dumps([asdict(item) for item in content], ensure_ascii=False, indent=0)
+    elif isinstance(content, (dict, list)):
+        content = json.dumps(content, ensure_ascii=False, indent=0)
+    return f'## {title}\n\n{str(content).strip()}\n'
+
+
+def assemble(system: str, sections: List[Tuple[str, Any]], instruction: Optional[str] = None) -> List[BaseMessage]:
+    """
+    组装 [静态系统消息, 用户消息]。
+    sections 为 (标题, 内容) 列表，调用方按变化频率从低到高排列；内容为 None 或空字符串的段落省略。
+    instruction 为放在用户消息开头的固定说明。
+    """
+    parts = [instruction.strip() + '\n'] if instruction else []
+    parts += [render_section(title, content) for title, content in sections if content not in (None, '')]
+    return [system_message(system), HumanMessage(content='\n'.join(parts))]
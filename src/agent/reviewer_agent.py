@@ -5,7 +5,7 @@ import json5
 from langchain_core.messages import SystemMessage, AIMessage
 
 from .agent_state import AgentState
-from .base_agent import BaseAgent
+from .base_agent import BaseAgent, Response
 
 systemMessage = SystemMessage(content="""
 你是一个代码开发任务的审查专家，你要对当前任务的执行结果进行审核。你禁止回答问题或帮助执行工具，你仅被允许根据上下文做出审查。
@@ -53,7 +53,7 @@ class ReviewerAgent(BaseAgent):
         try:
             messages = [systemMessage]
             messages.extend(state.messages + [AIMessage(content=getattr(state.response, "response", "我已完成规划，但根据上下文可以推断出答案，因此无子任务"))])
-            response = self.invoke_llm(messages)
+            response = Response.join(self.invoke_llm(messages))
             review_content = getattr(response, "content", "审查完成")
             print(f"[REVIEWER] response {response}")
             # 提取json代码块
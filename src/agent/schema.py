@@ -0,0 +1,57 @@
+"""
+规划与执行结果的 JSON Schema，开启结构化输出时通过 extra_body 发送给 vLLM 做约束解码（guided_json），
+使模型输出始终是可解析的 JSON。
+"""
+import os
+from typing import Any, Callable, Dict, Optional
+
+TASK_ITEM_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'index': {'type': 'integer'},
+        'task': {'type': 'string'},
+        'goal': {'type': 'string'},
+        'desc': {'type': 'string'},
+        'correlation': {'type': 'integer', 'minimum': 1, 'maximum': 5},
+        'extra_info': {'type': 'string'},
+        'depends': {'type': 'array', 'items': {'type': 'integer'}},
+    },
+    'required': ['index', 'task', 'goal', 'desc', 'depends'],
+}
+
+PLAN_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'finish': {'type': 'boolean'},
+        'taskItems': {'type': 'array', 'items': TASK_ITEM_SCHEMA},
+    },
+    'required': ['finish', 'taskItems'],
+}
+
+RESULT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'task_index': {'type': 'string'},
+        'status': {'type': 'string', 'enum': ['success', 'failed']},
+        'result': {'type': 'string'},
+        'reason': {'type': 'string'},
+    },
+    'required': ['task_index', 'status', 'result'],
+}
+
+
+def structured_output_enabled(structured_output: Optional[bool] = None) -> bool:
+    """是否开启结构化输出，未指定时读取环境变量 MY_AGENT_STRUCTURED_OUTPUT"""
+    if structured_output is not None:
+        return structured_output
+    return os.getenv('MY_AGENT_STRUCTURED_OUTPUT', '0').strip().lower() in ('1', 'true')
+
+
+def guided_json(schema: Dict) -> Dict:
+    """约束解码的生成参数，与 llm 配置中的 extra_body 合并"""
+    return {'extra_body': {'guided_json': schema}}
+
+
+def has_keys(*keys: str) -> Callable[[Any], bool]:
+    """parse_json 的 accept 参数：只接受包含指定字段的对象，跳过输出中夹杂的其他 JSON"""
+    return lambda value: isinstance(value, dict) and all(key in value for key in keys)
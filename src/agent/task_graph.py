@@ -0,0 +1,147 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .agent_state import TaskItem
+from ..log import logger
+
+# 依赖推导方式
+# explicit: 仅使用子任务显式声明的 depends，未声明则视为无依赖（可并行）；
+#           所有子任务都未声明 depends 时（旧版规划或模型省略了该字段）按 sequential 处理
+# sequential: 未声明 depends 的子任务依赖所有 index 更小的子任务（等价于串行执行）
+DEPENDENCY_MODES = ('explicit', 'sequential')
+
+
+def resolve_dependencies(task_list: List[TaskItem], mode: str = 'explicit') -> Dict[int, Set[int]]:
+    """
+    计算每个子任务的依赖集合（index -> 依赖的index集合）。
+    依赖不存在的子任务会被忽略，避免因规划错误导致任务无法调度。
+    """
+    if mode not in DEPENDENCY_MODES:
+        raise ValueError(f'Invalid dependency mode: {mode}')
+    _fill_missing_indices(task_list)
+    if mode == 'explicit' and len(task_list) > 1 and all(task.depends is None for task in task_list):
+        logger.warning('[TASK_GRAPH] 所有子任务均未声明 depends，按 index 顺序串行执行')
+        mode = 'sequential'
+    indices = [task.index for task in task_list]
+    known = set(indices)
+    deps: Dict[int, Set[int]] = {}
+    for task in task_list:
+        if task.depends is not None:
+            declared = set(_as_index_list(task.depends))
+        elif mode == 'sequential':
+            declared = {i for i in indices if i < task.index}
+        else:
+            declared = set()
+        unknown = declared - known
+        if unknown:
+            logger.warning(f"[TASK_GRAPH] 子任务 {task.index} 依赖了不存在的子任务 {sorted(unknown)}，已忽略")
+        declared.discard(task.index)
+        deps[task.index] = declared & known
+    return deps
+
+
+def _fill_missing_indices(task_list: List[TaskItem]):
+    """规划输出中缺少 index 的子任务以其位置（从 1 开始，已被占用时顺延）作为 index，保证调度与执行记录可用"""
+    used = {task.index for task in task_list if task.index is not None}
+    for position, task in enumerate(task_list, start=1):
+        if task.index is None:
+            while position in used:
+                position += 1
+            task.index = position
+            used.add(position)
+            logger.warning(f"[TASK_GRAPH] 子任务 {task.task} 缺少 index，使用 {position}")
+
+
+def dependents_of(task_list: List[TaskItem], indices: Iterable[int], mode: str = 'explicit') -> Set[int]:
+    """
+    返回给定子任务及所有（直接或间接）依赖它们的子任务index。
+    """
+    deps = resolve_dependencies(task_list, mode)
+    result = set(indices)
+    changed = True
+    while changed:
+        changed = False
+        for index, required in deps.items():
+            if index not in result and required & result:
+                result.add(index)
+                changed = True
+    return result
+
+
+def _as_index_list(value) -> List[int]:
+    # 模型输出的 depends 可能是 int、字符串或列表
+    if value in (None, '', []):
+        return []
+    if not isinstance(value, (list, tuple, set)):
+        value = [value]
+    result = []
+    for v in value:
+        try:
+            result.append(int(v))
+        except (TypeError, ValueError):
+            logger.warning(f"[TASK_GRAPH] 无法解析的依赖: {v}")
+    return result
+
+
+def priority(task: TaskItem) -> tuple:
+    """就绪子任务的提交顺序：correlation 越高越先执行，其次按 index。"""
+    try:
+        correlation = -int(task.correlation) if task.correlation is not None else 0
+    except (TypeError, ValueError):
+        correlation = 0
+    return correlation, task.index if task.index is not None else 0
+
+
+def ready_tasks(pending: List[TaskItem], deps: Dict[int, Set[int]], done: Set[int]) -> List[TaskItem]:
+    """返回依赖已全部完成的待执行子任务，按优先级排序。"""
+    ready = [task for task in pending if deps.get(task.index, set()) <= done]
+    return sorted(ready, key=priority)
+
+
+class TaskScheduler:
+    """
+    子任务 DAG 的调度状态：待执行、执行中与已完成的子任务。
+    同步与异步执行共用，调用方只负责提交 ready 返回的子任务，并在子任务结束后调用 complete。
+    """
+
+    def __init__(self, task_list: List[TaskItem], executed_index: Iterable[int], mode: str = 'explicit'):
+        self.task_list = task_list
+        self.deps = resolve_dependencies(task_list, mode)
+        done = set(executed_index)
+        self.pending = [task for task in task_list if task.index not in done]
+        self.done = done
+        self._tasks = {task.index: task for task in task_list}
+        self._running = 0
+        self._finished: Set[int] = set()
+
+    @property
+    def active(self) -> bool:
+        """是否还有待执行或执行中的子任务"""
+        return bool(self.pending) or self._running > 0
+
+    def ready(self) -> List[Tuple[TaskItem, Dict[int, str]]]:
+        """取出依赖已完成的子任务及其依赖的结果，按优先级排序；存在循环依赖时解除后继续"""
+        while True:
+            tasks = ready_tasks(self.pending, self.deps, self.done)
+            if tasks or self._running or not self.pending:
+                break
+            # 没有可执行也没有执行中的子任务：存在循环依赖，解除index最小的子任务的依赖
+            task = min(self.pending, key=lambda t: t.index)
+            logger.warning(f"[TASK_GRAPH] 子任务 {task.index} 存在循环依赖 {sorted(self.deps[task.index])}，忽略其依赖")
+            self.deps[task.index] = set()
+        for task in tasks:
+            self.pending.remove(task)
+        self._running += len(tasks)
+        return [(task, {i: self._tasks[i].result for i in sorted(self.deps.get(task.index, ()))}) for task in tasks]
+
+    def complete(self, task: TaskItem, error: Optional[BaseException] = None):
+        """子任务执行结束，error 不为空时标记为失败"""
+        if error is not None:
+            logger.error(f"[TASK_GRAPH] 子任务 {task.index} 执行失败: {error}")
+            task.status = 'failed'
+        self._running -= 1
+        self.done.add(task.index)
+        self._finished.add(task.index)
+
+    def executed(self) -> List[int]:
+        """本次执行完成的子任务，按子任务顺序排列，保证与串行执行的结果一致"""
+        return [task.index for task in self.task_list if task.index in self._finished]
@@ -1,13 +1,18 @@
-import copy
+import asyncio
 import json
+import os
+import threading
 import traceback
+from concurrent.futures import Future
 from abc import ABC, abstractmethod
-from typing import Optional, List, Union, Dict, Iterator, Tuple
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Optional, List, Union, Dict, Iterator, Tuple
 
 import json5
 import qwen_agent.tools
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import BaseMessage, BaseMessageChunk, SystemMessage, HumanMessage, AIMessage, ToolCall
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langchain_core.tools import BaseTool
 from qwen_agent.llm.schema import ContentItem
 from qwen_agent.tools import MCPManager, TOOL_REGISTRY
@@ -15,11 +20,27 @@ from qwen_agent.tools.base import ToolServiceError
 from qwen_agent.tools.simple_doc_parser import DocParserError
 
 from .base import get_chat_model
+from .cache import (LLMCache, get_llm_cache, is_deterministic, replay_stream, areplay_stream, record_stream,
+                    arecord_stream, from_cache_value, to_cache_value)
+from .cassette import Cassette, get_cassette
+from .context import ContextBudget, get_context_budget, estimate_tokens, message_tokens
+from .prefix import get_prefix_estimator
+from .tool_limit import get_tool_limiter
 from ..log import logger
+from ..trace import LLM, TOOL, Span, atrace_stream, span as trace_span, start_span, trace_stream
 from ..tools import get_qwen_cls
 from ..utils.utils import merge_generate_cfgs
 
 
+# 单个工具的默认并发上限，未配置的工具仅受线程池大小限制
+DEFAULT_TOOL_CONCURRENCY = {'execute_command': 2}
+# 每个 Assistant 缓存的工具说明与系统消息数量
+PROMPT_CACHE_SIZE = 64
+# 作为请求参数传给模型的生成配置项，其余配置项（如 lang）只在本地使用
+SAMPLING_KEYS = ('temperature', 'top_p', 'max_tokens', 'seed', 'stop', 'presence_penalty', 'frequency_penalty',
+                 'response_format', 'extra_body')
+
+
 class BaseAssistant(ABC):
     def __init__(self,
                  function_list: Optional[List[Union[str, Dict, BaseTool]]] = None,
@@ -31,11 +52,31 @@ class BaseAssistant(ABC):
             self.llm = get_chat_model(llm)
         else:
             self.llm = llm
+        # LLM 响应缓存，默认关闭，可通过参数 cache 或 llm 配置中的 cache 开启
+        cache_cfg = kwargs.get('cache') or (llm.get('cache') if isinstance(llm, dict) else None)
+        self.cache: Optional[LLMCache] = get_llm_cache(cache_cfg)
+        # 工具循环的上下文 token 预算，默认不限制
+        self.context_budget: Optional[ContextBudget] = get_context_budget(kwargs.get('context_budget'))
+        # 记录或回放 LLM 与工具调用，默认读取环境变量 MY_AGENT_CASSETTE
+        self.cassette: Optional[Cassette] = get_cassette(kwargs.get('cassette'))
         self.name = name
         self.system = system
         self.description = description
-        self.extra_generate_cfg: dict = {}
+        # llm 配置中的生成参数，每次请求与调用方传入的参数合并
+        self.extra_generate_cfg: dict = dict(llm.get('generate_cfg') or {}) if isinstance(llm, dict) else {}
         self.function_map = {}
+        # 已编译的工具说明与系统消息，function_map 变化时清空
+        self._prompt_cache: 'OrderedDict[tuple, Any]' = OrderedDict()
+        self._prompt_cache_fingerprint: Optional[tuple] = None
+        self._prompt_cache_lock = threading.Lock()
+        # 后台调用工具的线程池，首次使用时创建
+        self.max_tool_workers = kwargs.get('max_tool_workers') or int(os.getenv('MY_AGENT_TOOL_WORKERS', '8'))
+        self._tool_executor: Optional[ContextThreadPoolExecutor] = None
+        self._tool_executor_lock = threading.Lock()
+        # 单个工具的并发上限，相同配置在进程内共享，超出上限的调用在提交到线程池之前排队
+        tool_concurrency = {**DEFAULT_TOOL_CONCURRENCY, **(kwargs.get('tool_concurrency') or {})}
+        self._tool_limiters = {tool_name: get_tool_limiter(tool_name, limit)
+                               for tool_name, limit in tool_concurrency.items() if limit}
         if function_list:
             for tool in function_list:
                 self._init_tool(tool)
@@ -84,8 +125,7 @@ class BaseAssistant(ABC):
                 usr = usr + [ContentItem(text=sep)] + bot
             else:
                 raise NotImplementedError
-            text_to_complete = copy.deepcopy(messages[-2])
-            text_to_complete.content = usr
+            text_to_complete = messages[-2].model_copy(update={'content': usr})
             messages = messages[:-2] + [text_to_complete]
         return messages
 
@@ -97,26 +137,77 @@ class BaseAssistant(ABC):
         return last_responses
 
     def run(self, messages: Union[str, List[BaseMessage]], **kwargs) -> Iterator[List[BaseMessage]]:
+        messages = self._prepare_messages(messages, **kwargs)
+        for rsp in self._run(messages=messages, **kwargs):
+            yield [x for x in rsp]
+
+    async def arun(self, messages: Union[str, List[BaseMessage]], **kwargs) -> AsyncIterator[List[BaseMessage]]:
+        """Async version of self.run, LLM and tool calls do not block the event loop."""
+        messages = self._prepare_messages(messages, **kwargs)
+        async for rsp in self._arun(messages=messages, **kwargs):
+            yield [x for x in rsp]
+
+    def _prepare_messages(self, messages: Union[str, List[BaseMessage]], **kwargs) -> List[BaseMessage]:
         if isinstance(messages, str):
             messages = [HumanMessage(messages)]
-        messages = copy.deepcopy(messages)
+        # 只复制列表，消息对象在调用链中视为不可变，需要修改时用 model_copy 生成新消息替换，不复制其余内容
+        messages = list(messages)
         if self.system:
             if messages[0].type != 'system':
                 messages.insert(0, SystemMessage(self.system))
             else:
-                messages[0].content = self.system + '\n\n' + messages[0].content
+                messages[0] = messages[0].model_copy(update={'content': self.system + '\n\n' + messages[0].content})
 
         if kwargs.get('usetool'):
-            if not kwargs.get('tool_names'):
-                messages = self._preprocess_messages(messages=messages,
-                                                     functions=[func.function for func in self.function_map.values()])
-            else:
-                messages = self._preprocess_messages(messages=messages,
-                                                 functions=[self.function_map.get(func_name).function for func_name in kwargs.get('tool_names') if func_name in self.function_map])
+            messages = self._preprocess_messages(messages=messages,
+                                                 tools_prompt=self._tools_prompt(kwargs.get('tool_names')))
         else:
             messages = self._preprocess_messages(messages=messages)
-        for rsp in self._run(messages=messages, **kwargs):
-            yield [x for x in rsp]
+        return messages
+
+    def _tools_prompt(self, tool_names: Optional[List[str]] = None) -> Optional[str]:
+        """所选工具（为空时为全部工具）的说明，按工具名缓存；没有可用工具时返回 None"""
+
+        def build():
+            names = tool_names or list(self.function_map)
+            functions = [self.function_map[name].function for name in names if name in self.function_map]
+            return self._format_tools_prompt(functions) if functions else None
+
+        return self._cached_prompt(('tools', tuple(tool_names) if tool_names else None), build)
+
+    def _format_tools_prompt(self, functions: List[Dict]) -> str:
+        tool_descs = [{'type': 'function', 'function': f} for f in functions]
+        tool_descs = '\n'.join([json.dumps(f, ensure_ascii=False) for f in tool_descs])
+        return self._fncall_prompt().format(tool_descs=tool_descs)
+
+    def _system_with_tools(self, system: BaseMessage, tools_prompt: str) -> BaseMessage:
+        """将工具说明填入系统消息，相同的系统提示与工具组合复用同一个消息对象"""
+
+        def build():
+            if "{tools}" in system.content:
+                content = system.content.format(tools=tools_prompt)
+            else:
+                content = system.content + ('\n\n' + tools_prompt)
+            return system.model_copy(update={'content': content})
+
+        return self._cached_prompt(('system', system.content, tools_prompt), build)
+
+    def _cached_prompt(self, key: tuple, build: Callable[[], Any]) -> Any:
+        # 工具增删或替换后，已编译的提示全部失效
+        fingerprint = tuple((name, id(tool)) for name, tool in self.function_map.items())
+        with self._prompt_cache_lock:
+            if fingerprint != self._prompt_cache_fingerprint:
+                self._prompt_cache.clear()
+                self._prompt_cache_fingerprint = fingerprint
+            if key in self._prompt_cache:
+                self._prompt_cache.move_to_end(key)
+                return self._prompt_cache[key]
+        value = build()
+        with self._prompt_cache_lock:
+            self._prompt_cache[key] = value
+            while len(self._prompt_cache) > PROMPT_CACHE_SIZE:
+                self._prompt_cache.popitem(last=False)
+        return value
 
     def _fncall_prompt(self) -> str:
         return """# 工具相关
@@ -147,10 +238,11 @@ You are allowed to call functions multiple times across multiple turns if needed
     #     </tool_call>
 
     def _preprocess_messages(self, messages: List[BaseMessage], lang: str = 'zh', generate_cfg: dict = None,
-                             functions: Optional[List[Dict]] = None, ) -> List[BaseMessage]:
+                             functions: Optional[List[Dict]] = None,
+                             tools_prompt: Optional[str] = None) -> List[BaseMessage]:
         new_messages = []
         fn_call_msg = ''
-        for msg in copy.deepcopy(messages):
+        for msg in messages:
             role, content = msg.type, msg.content
             if role in ('system', 'human'):
                 new_messages.append(msg)
@@ -172,21 +264,16 @@ You are allowed to call functions multiple times across multiple turns if needed
                     fn_call_msg = f"{fn_call_msg}\n\n{fc}"
             elif role == 'tool':
                 fc = f'<tool_response>\n{content}\n</tool_response>'
-                if messages[-1].role == 'human':
-                    messages[-1].content = f'{messages[-1].content}\n{fc}'
-                    messages[-1].content.extend(content)
+                if new_messages and new_messages[-1].type == 'human':
+                    new_messages[-1] = new_messages[-1].model_copy(update={'content': f'{new_messages[-1].content}\n{fc}'})
                 else:
                     new_messages.append(HumanMessage(content=content))
 
-        if functions:
-            tool_descs = [{'type': 'function', 'function': f} for f in functions]
-            tool_descs = '\n'.join([json.dumps(f, ensure_ascii=False) for f in tool_descs])
-            tools_prompt = self._fncall_prompt().format(tool_descs=tool_descs)
+        if functions and tools_prompt is None:
+            tools_prompt = self._format_tools_prompt(functions)
+        if tools_prompt:
             if messages and messages[0].type == 'system':
-                if "{tools}" in new_messages[0].content:
-                    new_messages[0].content = new_messages[0].content.format(tools=tools_prompt)
-                else:
-                    new_messages[0].content = new_messages[0].content + ('\n\n' + tools_prompt)
+                new_messages[0] = self._system_with_tools(new_messages[0], tools_prompt)
             else:
                 new_messages = [SystemMessage(content=tools_prompt)] + messages
         return new_messages
@@ -195,6 +282,10 @@ You are allowed to call functions multiple times across multiple turns if needed
     def _run(self, messages: List[BaseMessage], lang: str = 'zh', **kwargs) -> Iterator[List[BaseMessage]]:
         raise NotImplementedError
 
+    async def _arun(self, messages: List[BaseMessage], lang: str = 'zh', **kwargs) -> AsyncIterator[List[BaseMessage]]:
+        raise NotImplementedError
+        yield
+
     def _call_llm(
             self,
             messages: List[BaseMessage],
@@ -215,19 +306,167 @@ You are allowed to call functions multiple times across multiple turns if needed
         Yields:
             The response generator of LLM.
         """
+        generate_cfg = merge_generate_cfgs(
+            base_generate_cfg=self.extra_generate_cfg,
+            new_generate_cfg=extra_generate_cfg,
+        )
+        cache_key = self._cache_key(messages, generate_cfg)
+        current = self._start_llm_span(messages, stream)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.debug(f'[LLM_CACHE] 命中缓存: {cache_key}')
+                if current is not None:
+                    current.set(cache_hit=True)
+                return self._traced(current, replay_stream(cached) if stream else from_cache_value(cached), stream)
+        self._observe_prefix(messages, current)
+        params = self._sampling_params(generate_cfg)
         if stream:
-            return self.llm.stream(input=messages,
-                                   stream_usage=stream_usage,
-                                   config=merge_generate_cfgs(
-                                       base_generate_cfg=self.extra_generate_cfg,
-                                       new_generate_cfg=extra_generate_cfg
-                                   ))
+            def call():
+                return self.llm.stream(input=messages, stream_usage=stream_usage, **params)
+
+            output = self.cassette.stream(messages, generate_cfg, call) if self.cassette else call()
+            output = record_stream(self.cache, cache_key, output) if cache_key else output
+            return self._traced(current, output, stream)
         else:
-            return self.llm.invoke(input=messages,
-                                   config=merge_generate_cfgs(
-                                       base_generate_cfg=self.extra_generate_cfg,
-                                       new_generate_cfg=extra_generate_cfg,
-                                   ))
+            try:
+                def call():
+                    return self.llm.invoke(input=messages, **params)
+
+                output = self.cassette.invoke(messages, generate_cfg, call) if self.cassette else call()
+            except Exception as e:
+                self._fail_span(current, e)
+                raise
+            if cache_key:
+                self.cache.put(cache_key, to_cache_value(output))
+            return self._traced(current, output, stream)
+
+    async def _acall_llm(
+            self,
+            messages: List[BaseMessage],
+            stream: bool = True,
+            extra_generate_cfg: Optional[dict] = None,
+            stream_usage: bool = True,
+    ) -> Union[BaseMessage, AsyncIterator[BaseMessageChunk]]:
+        """Async version of self._call_llm, based on `astream`/`ainvoke` of the chat model."""
+        generate_cfg = merge_generate_cfgs(
+            base_generate_cfg=self.extra_generate_cfg,
+            new_generate_cfg=extra_generate_cfg,
+        )
+        cache_key = self._cache_key(messages, generate_cfg)
+        current = self._start_llm_span(messages, stream)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.debug(f'[LLM_CACHE] 命中缓存: {cache_key}')
+                if current is not None:
+                    current.set(cache_hit=True)
+                return self._atraced(current, areplay_stream(cached) if stream else from_cache_value(cached), stream)
+        self._observe_prefix(messages, current)
+        params = self._sampling_params(generate_cfg)
+        if stream:
+            def call():
+                return self.llm.astream(input=messages, stream_usage=stream_usage, **params)
+
+            output = self.cassette.astream(messages, generate_cfg, call) if self.cassette else call()
+            output = arecord_stream(self.cache, cache_key, output) if cache_key else output
+            return self._atraced(current, output, stream)
+        else:
+            try:
+                def call():
+                    return self.llm.ainvoke(input=messages, **params)
+
+                output = await (self.cassette.ainvoke(messages, generate_cfg, call) if self.cassette else call())
+            except Exception as e:
+                self._fail_span(current, e)
+                raise
+            if cache_key:
+                self.cache.put(cache_key, to_cache_value(output))
+            return self._atraced(current, output, stream)
+
+    def _start_llm_span(self, messages: List[BaseMessage], stream: bool) -> Optional[Span]:
+        """开启追踪时记录一次 LLM 调用，prompt token 先按本地估算，收到 usage 后替换为实际值"""
+        current = start_span(self.name or 'llm', LLM, stream=stream,
+                             model=getattr(self.llm, 'model_name', None) or type(self.llm).__name__)
+        if current is not None:
+            current.set(prompt_tokens=sum(message_tokens(m) for m in messages), estimated=True)
+        return current
+
+    @staticmethod
+    def _sampling_params(generate_cfg: dict) -> dict:
+        """生成配置中作为请求参数传给模型的部分，例如 top_p、seed 与 extra_body 中的 guided_json"""
+        return {k: v for k, v in generate_cfg.items() if k in SAMPLING_KEYS and v is not None}
+
+    @staticmethod
+    def _observe_prefix(messages: List[BaseMessage], current: Optional[Span]):
+        """估算本次请求可复用的服务端前缀缓存，开启追踪或 MY_AGENT_PREFIX_STATS=1 时记录"""
+        estimator = get_prefix_estimator(force=current is not None)
+        if estimator is None:
+            return
+        observed = estimator.observe(messages)
+        if current is not None:
+            current.set(prefix_tokens=observed['prefix_tokens'], prefix_ratio=observed['prefix_ratio'])
+
+    @staticmethod
+    def _traced(current: Optional[Span], output, stream: bool):
+        if current is None:
+            return output
+        if stream:
+            return trace_stream(current, output, _content_tokens)
+        current.finish(output, _content_tokens)
+        return output
+
+    @staticmethod
+    def _atraced(current: Optional[Span], output, stream: bool):
+        if current is None:
+            return output
+        if stream:
+            return atrace_stream(current, output, _content_tokens)
+        current.finish(output, _content_tokens)
+        return output
+
+    @staticmethod
+    def _fail_span(current: Optional[Span], error: Exception):
+        if current is not None:
+            current.fail(error)
+            current.finish()
+
+    def _cache_key(self, messages: List[BaseMessage], generate_cfg: dict) -> Optional[str]:
+        """开启缓存且采样确定时返回缓存 key，否则返回 None"""
+        if self.cache is None:
+            return None
+        if not is_deterministic(generate_cfg, self.llm):
+            self.cache.record_bypass()
+            return None
+        model = [getattr(self.llm, 'model_name', None), getattr(self.llm, 'openai_api_base', None)]
+        return self.cache.make_key(messages, generate_cfg, model)
+
+    async def _acall_tool(self, tool_name: str, tool_args: Union[str, dict] = '{}',
+                          **kwargs) -> Union[str, List[ContentItem]]:
+        """Async version of self._call_tool.
+
+        Tools are synchronous, so they are run in the tool thread pool to keep the event loop free.
+        """
+        return await asyncio.wrap_future(self._submit_tool(tool_name, tool_args, **kwargs))
+
+    def _submit_tool(self, tool_name: str, tool_args: Union[str, dict] = '{}', **kwargs) -> Future:
+        """Call a tool in the background thread pool of the agent.
+
+        The pool is bounded by max_tool_workers. Calls of a tool over its tool_concurrency limit wait before
+        submission, so they do not hold pool workers.
+
+        Returns:
+            A future of the output of self._call_tool.
+        """
+        if self._tool_executor is None:
+            with self._tool_executor_lock:
+                if self._tool_executor is None:
+                    self._tool_executor = ContextThreadPoolExecutor(max_workers=self.max_tool_workers,
+                                                                    thread_name_prefix=f'{self.name or "assistant"}_tool')
+        limiter = self._tool_limiters.get(tool_name)
+        if limiter is not None:
+            return limiter.submit(self._tool_executor, self._call_tool, tool_name, tool_args, **kwargs)
+        return self._tool_executor.submit(self._call_tool, tool_name, tool_args, **kwargs)
 
     def _call_tool(self, tool_name: str, tool_args: Union[str, dict] = '{}', **kwargs) -> Union[str, List[ContentItem]]:
         """The interface of calling tools for the agent.
@@ -242,6 +481,14 @@ You are allowed to call functions multiple times across multiple turns if needed
         if tool_name not in self.function_map:
             return f'Tool {tool_name} does not exists.'
         tool = self.function_map[tool_name]
+        with trace_span(tool_name, TOOL) as current:
+            def call():
+                return self._call_tool_traced(tool, tool_name, tool_args, current, **kwargs)
+
+            return self.cassette.tool(tool_name, tool_args, call) if self.cassette else call()
+
+    def _call_tool_traced(self, tool, tool_name: str, tool_args: Union[str, dict], current: Optional[Span],
+                          **kwargs) -> Union[str, List[ContentItem]]:
         try:
             if isinstance(tool_args, str):
                 tool_args = json5.loads(tool_args) if tool_args else {}
@@ -249,6 +496,8 @@ You are allowed to call functions multiple times across multiple turns if needed
         except (ToolServiceError, DocParserError) as ex:
             raise ex
         except Exception as ex:
+            if current is not None:
+                current.fail(ex)
             exception_type = type(ex).__name__
             exception_message = str(ex)
             traceback_info = ''.join(traceback.format_tb(ex.__traceback__))
@@ -286,6 +535,49 @@ You are allowed to call functions multiple times across multiple turns if needed
             fn_args = ''
         return fn_name, fn_args
 
+    def _parse_tool_call(self, text: str, complete: bool = True) -> Optional[ToolCall]:
+        """解析一个 <tool_call> 块内的文本。
+
+        Args:
+            text: <tool_call> 与 </tool_call> 之间的文本。
+            complete: 是否已读到 </tool_call>。
+
+        Returns:
+            解析出的工具调用，无法解析时返回 None。
+        """
+        if not text.strip():
+            return None
+        if not complete:
+            fn_name, fn_args = self.extract_fn(text=text)
+            if fn_name:  # need to call function
+                # TODO: process incomplete tool-call messages
+                return ToolCall(
+                    id=fn_name,
+                    name=fn_name,
+                    # 此处json不完整，无法赋值
+                    args={}
+                )
+            return None
+        text = text.strip()
+        fn = None
+        try:
+            fn = json5.loads(text)
+        except Exception:
+            logger.warning(f'Invalid json tool-calling arguments, txt:[{text}]')
+            fn_name, fn_args = self.extract_fn(text=text)
+            return ToolCall(
+                id=fn_name,
+                name=fn_name,
+                args=json.loads(fn_args)
+            )
+        if fn:
+            return ToolCall(
+                id=fn['name'],
+                name=fn['name'],
+                args=fn['arguments']
+            )
+        return None
+
     def _postprocess_messages(self, message: AIMessage) -> List[AIMessage]:
         """A built-in tool call detection for func_call format message.
 
@@ -311,38 +603,15 @@ You are allowed to call functions multiple times across multiple turns if needed
         for txt in tool_call_list[1:]:
             if not txt.strip():
                 continue
-
-            if '</tool_call>' not in txt:
-                # incomplete </tool_call>: This is to better represent incomplete tool calls in streaming output
-                fn_name, fn_args = self.extract_fn(text=txt)
-                if fn_name:  # need to call function
-                    # TODO: process incomplete tool-call messages
-                    toolCalls.append(ToolCall(
-                        id=fn_name,
-                        name=fn_name,
-                        # 此处json不完整，无法赋值
-                        args={}
-                    ))
-                continue
-
-            one_tool_call_txt = txt.split('</tool_call>')
-            fn = None
-            try:
-                fn = json5.loads(one_tool_call_txt[0].strip())
-            except Exception:
-                logger.warning(f'Invalid json tool-calling arguments, txt:[{txt}]')
-                fn_name, fn_args = self.extract_fn(text=one_tool_call_txt[0].strip())
-                toolCalls.append(ToolCall(
-                    id=fn_name,
-                    name=fn_name,
-                    args=json.loads(fn_args)
-                ))
-            if fn:
-                toolCalls.append(ToolCall(
-                    id=fn['name'],
-                    name=fn['name'],
-                    args=fn['arguments']
-                ))
+            # incomplete </tool_call>: This is to better represent incomplete tool calls in streaming output
+            complete = '</tool_call>' in txt
+            tool_call = self._parse_tool_call(txt.split('</tool_call>')[0], complete=complete)
+            if tool_call:
+                toolCalls.append(tool_call)
         if toolCalls:
             new_messages.append(AIMessage(content='', tool_calls=toolCalls))
         return new_messages
+
+
+def _content_tokens(message) -> int:
+    return estimate_tokens(getattr(message, 'content', None))
@@ -1,7 +1,29 @@
+import asyncio
+import importlib.util
+import json
+import threading
+import weakref
+from typing import Any, Dict
+
+import httpx
+import openai
 from langchain_core.language_models import BaseChatModel
 
 from .llm import LLM_REGISTRY
 
+# 连接池默认配置，可在 llm 配置中覆盖同名字段
+DEFAULT_POOL_CFG = {
+    'max_connections': 100,
+    'max_keepalive_connections': 20,
+    'keepalive_expiry': 30.0,
+    'http2': True,
+}
+
+# 进程级共享的 HTTP 连接池与模型客户端，避免每个 Agent 各自建立连接
+_http_clients: Dict[tuple, Any] = {}
+_chat_models: Dict[str, BaseChatModel] = {}
+_registry_lock = threading.Lock()
+
 
 def register_llm(model_type):
     def decorator(cls):
@@ -18,11 +40,119 @@ def register_llm(model_type):
 def get_chat_model(cfg: dict):
     if 'base_url' in cfg and 'model_type' not in cfg:
         if cfg['base_url'].strip().startswith('http'):
-            model_type = 'oai'
-            cfg['model_type'] = model_type
-            return LLM_REGISTRY[model_type](cfg)
+            cfg['model_type'] = 'oai'
 
-    if cfg['model_type'] in LLM_REGISTRY:
-        return LLM_REGISTRY[cfg['model_type']](cfg)
+    model_type = cfg.get('model_type')
+    if model_type in LLM_REGISTRY:
+        # 相同配置的模型客户端在进程内共享
+        key = json.dumps(cfg, sort_keys=True, default=str)
+        with _registry_lock:
+            model = _chat_models.get(key)
+        if model is None:
+            model_cfg = cfg
+            if model_type == 'oai':
+                model_cfg = {'http_client': get_http_client(cfg),
+                             'http_async_client': get_http_client(cfg, is_async=True),
+                             **cfg}
+            model = LLM_REGISTRY[model_type](model_cfg)
+            with _registry_lock:
+                model = _chat_models.setdefault(key, model)
+        return model
 
     raise ValueError(f'Invalid model cfg: {cfg}')
+
+
+def get_http_client(cfg: dict, is_async: bool = False):
+    """
+    获取按端点共享的 HTTP 客户端，同一端点的所有模型复用 keep-alive 连接池。
+    连接数等参数见 DEFAULT_POOL_CFG，安装 h2 时启用 HTTP/2。
+    """
+    pool = {k: cfg.get(k, v) for k, v in DEFAULT_POOL_CFG.items()}
+    key = (is_async, cfg.get('base_url'), cfg.get('timeout'), tuple(sorted(pool.items())))
+    with _registry_lock:
+        client = _http_clients.get(key)
+        if client is None or client.is_closed:
+            kwargs = {
+                'limits': httpx.Limits(max_connections=pool['max_connections'],
+                                       max_keepalive_connections=pool['max_keepalive_connections'],
+                                       keepalive_expiry=pool['keepalive_expiry']),
+                'http2': bool(pool['http2']) and http2_available(),
+            }
+            if cfg.get('timeout') is not None:
+                kwargs['timeout'] = cfg['timeout']
+            client_cls = LoopAsyncHttpxClient if is_async else openai.DefaultHttpxClient
+            client = client_cls(**kwargs)
+            _http_clients[key] = client
+        return client
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec('h2') is not None
+
+
+def clear_clients():
+    """关闭并清空共享的客户端，主要用于测试或重新加载配置"""
+    with _registry_lock:
+        for client in _http_clients.values():
+            if isinstance(client, LoopAsyncHttpxClient):
+                client.close_all()
+            else:
+                client.close()
+        _http_clients.clear()
+        _chat_models.clear()
+
+
+class LoopAsyncHttpxClient(openai.DefaultAsyncHttpxClient):
+    """
+    按事件循环分配连接池的异步客户端。
+    异步连接绑定创建它的事件循环，asyncio.run 每次新建循环后旧循环的连接不可再用，
+    因此共享的客户端只负责构造请求，实际发送使用当前事件循环的连接池；循环被回收后对应的连接池随之释放。
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client_kwargs = kwargs
+        self._loop_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]' = weakref.WeakKeyDictionary()
+        self._loop_lock = threading.Lock()
+
+    def for_loop(self, loop: asyncio.AbstractEventLoop = None):
+        """当前（或指定）事件循环的连接池"""
+        loop = loop or asyncio.get_running_loop()
+        with self._loop_lock:
+            client = self._loop_clients.get(loop)
+            if client is None or client.is_closed:
+                client = openai.DefaultAsyncHttpxClient(**self._client_kwargs)
+                self._loop_clients[loop] = client
+            return client
+
+    async def send(self, request, **kwargs):
+        return await self.for_loop().send(request, **kwargs)
+
+    async def aclose(self):
+        """关闭当前事件循环的连接池"""
+        with self._loop_lock:
+            client = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close_all(self):
+        """在各自的事件循环中关闭所有连接池，已关闭的循环中的连接随循环失效，由垃圾回收释放"""
+        with self._loop_lock:
+            clients = list(self._loop_clients.items())
+            self._loop_clients.clear()
+        for loop, client in clients:
+            if loop.is_closed():
+                continue
+            if not loop.is_running():
+                loop.run_until_complete(client.aclose())
+            elif _running_loop() is loop:
+                loop.create_task(client.aclose())
+            else:
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
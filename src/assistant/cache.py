@@ -0,0 +1,206 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, AsyncIterator
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+
+from ..log import logger
+
+# 流式回放时每个分块的字符数
+REPLAY_CHUNK_SIZE = 16
+
+
+class LLMCache:
+    """
+    LLM 响应缓存，内存 LRU + 可选的本地 SQLite 持久化，两层均支持 TTL。
+    仅在采样确定（temperature 为 0 或设置了 seed）时使用，见 is_deterministic。
+    设置了 ttl 时，打开 SQLite 时以及此后每 prune_every 次写入删除其中已过期的记录。
+    """
+
+    def __init__(self, max_entries: int = 256, path: Optional[str] = None, ttl: Optional[float] = None,
+                 prune_every: int = 100):
+        self.max_entries = max_entries
+        self.path = path
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._lru: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'bypassed': 0, 'writes': 0}
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS llm_cache '
+                             '(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)')
+            self._db.commit()
+            self.prune()
+
+    @staticmethod
+    def make_key(messages: List[BaseMessage], generate_cfg: Optional[dict] = None, model: Any = None) -> str:
+        """由规范化后的消息、生成参数与模型标识计算稳定的缓存 key"""
+        payload = {
+            'model': model,
+            'messages': [normalize_message(m) for m in messages],
+            'generate_cfg': generate_cfg or {},
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created, now):
+                    self._lru.move_to_end(key)
+                    self._stats['hits'] += 1
+                    self._stats['memory_hits'] += 1
+                    return value
+                del self._lru[key]
+            if self._db is not None:
+                row = self._db.execute('SELECT value, created FROM llm_cache WHERE key = ?', (key,)).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self._stats['hits'] += 1
+                    self._stats['disk_hits'] += 1
+                    return value
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, key: str, value: Dict):
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, value)
+            self._stats['writes'] += 1
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO llm_cache (key, value, created) VALUES (?, ?, ?)',
+                                 (key, json.dumps(value, ensure_ascii=False), created))
+                self._db.commit()
+                if self.prune_every > 0 and self._stats['writes'] % self.prune_every == 0:
+                    self._delete_expired()
+
+    def record_bypass(self):
+        with self._lock:
+            self._stats['bypassed'] += 1
+
+    def prune(self) -> int:
+        """删除 SQLite 中已过期的记录，返回删除条数"""
+        with self._lock:
+            return self._delete_expired()
+
+    def _delete_expired(self) -> int:
+        if self._db is None or not self.ttl:
+            return 0
+        cursor = self._db.execute('DELETE FROM llm_cache WHERE created < ?', (time.time() - self.ttl,))
+        self._db.commit()
+        if cursor.rowcount:
+            logger.debug(f'[LLM_CACHE] 删除 {cursor.rowcount} 条过期缓存')
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, 'entries': len(self._lru)}
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM llm_cache')
+                self._db.commit()
+
+    def _remember(self, key: str, created: float, value: Dict):
+        self._lru[key] = (created, value)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _expired(self, created: float, now: float) -> bool:
+        return bool(self.ttl) and now - created > self.ttl
+
+
+_caches: Dict[str, LLMCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_llm_cache(cfg: Optional[Dict]) -> Optional[LLMCache]:
+    """
+    根据配置获取缓存，相同配置的 Assistant 共享同一个缓存实例。
+    cfg: {'max_entries': 256, 'path': 'llm_cache.sqlite', 'ttl': 86400, 'prune_every': 100}
+    """
+    if not cfg:
+        return None
+    if isinstance(cfg, LLMCache):
+        return cfg
+    key = json.dumps(cfg, sort_keys=True)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = LLMCache(**cfg)
+        return _caches[key]
+
+
+def is_deterministic(generate_cfg: Optional[dict], llm: Any = None) -> bool:
+    """采样是否确定：设置了 seed，或 temperature 为 0"""
+    generate_cfg = generate_cfg or {}
+    if generate_cfg.get('seed') is not None or getattr(llm, 'seed', None) is not None:
+        return True
+    temperature = generate_cfg.get('temperature', getattr(llm, 'temperature', None))
+    return temperature is not None and float(temperature) == 0
+
+
+def normalize_message(message: BaseMessage) -> Dict:
+    normalized = {'type': message.type, 'content': message.content}
+    tool_calls = getattr(message, 'tool_calls', None)
+    if tool_calls:
+        normalized['tool_calls'] = [{'name': tc.get('name'), 'args': tc.get('args')} for tc in tool_calls]
+    tool_call_id = getattr(message, 'tool_call_id', None)
+    if tool_call_id:
+        normalized['tool_call_id'] = tool_call_id
+    return normalized
+
+
+def to_cache_value(message: BaseMessage) -> Dict:
+    return {'content': message.content, 'usage_metadata': getattr(message, 'usage_metadata', None)}
+
+
+def from_cache_value(value: Dict) -> AIMessage:
+    return AIMessage(content=value['content'], usage_metadata=value.get('usage_metadata'))
+
+
+def replay_stream(value: Dict) -> Iterator[AIMessageChunk]:
+    """将缓存的完整响应按分块回放为流式输出"""
+    content = value['content']
+    pieces = [content[i:i + REPLAY_CHUNK_SIZE] for i in range(0, len(content), REPLAY_CHUNK_SIZE)] or ['']
+    for i, piece in enumerate(pieces):
+        last = i == len(pieces) - 1
+        yield AIMessageChunk(content=piece, usage_metadata=value.get('usage_metadata') if last else None)
+
+
+async def areplay_stream(value: Dict) -> AsyncIterator[AIMessageChunk]:
+    for chunk in replay_stream(value):
+        yield chunk
+
+
+def record_stream(cache: LLMCache, key: str, stream: Iterator[AIMessageChunk]) -> Iterator[AIMessageChunk]:
+    """透传流式输出，完整结束后写入缓存"""
+    parts, usage = [], None
+    for chunk in stream:
+        parts.append(chunk.content)
+        usage = getattr(chunk, 'usage_metadata', None) or usage
+        yield chunk
+    cache.put(key, {'content': ''.join(parts), 'usage_metadata': usage})
+    logger.debug(f'[LLM_CACHE] 写入缓存: {key}')
+
+
+async def arecord_stream(cache: LLMCache, key: str, stream: AsyncIterator[AIMessageChunk]) -> AsyncIterator[AIMessageChunk]:
+    parts, usage = [], None
+    async for chunk in stream:
+        parts.append(chunk.content)
+        usage = getattr(chunk, 'usage_metadata', None) or usage
+        yield chunk
+    cache.put(key, {'content': ''.join(parts), 'usage_metadata': usage})
+    logger.debug(f'[LLM_CACHE] 写入缓存: {key}')
@@ -0,0 +1,253 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Union
+
+import json5
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from qwen_agent.llm.schema import ContentItem
+
+from .cache import LLMCache
+from ..log import logger
+
+RECORD = 'record'
+REPLAY = 'replay'
+# 命中时回放，未命中时调用真实的 LLM 或工具并追加记录
+AUTO = 'auto'
+MODES = (RECORD, REPLAY, AUTO)
+
+
+class CassetteMissError(KeyError):
+    """回放模式下 cassette 中没有对应的请求"""
+
+
+class Cassette:
+    """
+    记录与回放 LLM 和工具调用，用于无网络、无模型服务的确定性运行和性能分析。
+
+    文件为 JSONL（路径以 .gz 结尾时使用 gzip 压缩），每行一次调用：
+        {"t": "llm", "k": key, "c": [[距调用开始的秒数, 分块内容], ...], "u": usage_metadata}
+        {"t": "tool", "k": key, "n": 工具名, "r": 结果, "d": 耗时}
+    LLM 请求的 key 由规范化后的消息与生成参数计算（不含模型地址），工具请求的 key 由工具名与参数计算。
+    相同 key 的多次调用按记录顺序依次回放，超出记录次数后重复最后一次。
+
+    pace 控制回放速度：0 为不等待，1 为按记录的首 token 延迟与分块间隔回放，0.5 为两倍速。
+    """
+
+    def __init__(self, path: str, mode: str = REPLAY, pace: float = 0):
+        if mode not in MODES:
+            raise ValueError(f'Unknown cassette mode {mode}, expected one of {MODES}')
+        self.path = path
+        self.mode = mode
+        self.pace = pace
+        self._records: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'recorded': 0}
+        if mode == RECORD:
+            # 重新录制时清空旧记录
+            with self._open('wt'):
+                pass
+        elif os.path.exists(path):
+            self._load()
+        elif mode == REPLAY:
+            raise FileNotFoundError(f'Cassette {path} does not exist')
+
+    @staticmethod
+    def llm_key(messages: List[BaseMessage], generate_cfg: Optional[dict] = None) -> str:
+        return 'llm:' + LLMCache.make_key(messages, generate_cfg)
+
+    @staticmethod
+    def tool_key(tool_name: str, tool_args: Union[str, dict]) -> str:
+        if isinstance(tool_args, str):
+            try:
+                tool_args = json5.loads(tool_args) if tool_args else {}
+            except ValueError:
+                pass
+        raw = json.dumps([tool_name, tool_args], ensure_ascii=False, sort_keys=True, default=str)
+        return 'tool:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def invoke(self, messages: List[BaseMessage], generate_cfg: dict, call: Callable[[], BaseMessage]) -> BaseMessage:
+        """非流式 LLM 调用"""
+        key = self.llm_key(messages, generate_cfg)
+        record = self._lookup(key)
+        if record is not None:
+            self._sleep(record['c'][-1][0] if record['c'] else 0)
+            return _to_message(record)
+        started = time.perf_counter()
+        output = call()
+        self._append({'t': 'llm', 'k': key, 'c': [[_elapsed(started), output.content]],
+                      'u': getattr(output, 'usage_metadata', None)})
+        return output
+
+    async def ainvoke(self, messages: List[BaseMessage], generate_cfg: dict,
+                      call: Callable[[], Awaitable[BaseMessage]]) -> BaseMessage:
+        key = self.llm_key(messages, generate_cfg)
+        record = self._lookup(key)
+        if record is not None:
+            await self._asleep(record['c'][-1][0] if record['c'] else 0)
+            return _to_message(record)
+        started = time.perf_counter()
+        output = await call()
+        self._append({'t': 'llm', 'k': key, 'c': [[_elapsed(started), output.content]],
+                      'u': getattr(output, 'usage_metadata', None)})
+        return output
+
+    def stream(self, messages: List[BaseMessage], generate_cfg: dict,
+               call: Callable[[], Iterator[AIMessageChunk]]) -> Iterator[AIMessageChunk]:
+        """流式 LLM 调用，录制时保留每个分块的时间"""
+        key = self.llm_key(messages, generate_cfg)
+        record = self._lookup(key)
+        if record is not None:
+            return self._replay(record)
+        return self._record_stream(key, call())
+
+    def astream(self, messages: List[BaseMessage], generate_cfg: dict,
+                call: Callable[[], AsyncIterator[AIMessageChunk]]) -> AsyncIterator[AIMessageChunk]:
+        key = self.llm_key(messages, generate_cfg)
+        record = self._lookup(key)
+        if record is not None:
+            return self._areplay(record)
+        return self._arecord_stream(key, call())
+
+    def tool(self, tool_name: str, tool_args: Union[str, dict],
+             call: Callable[[], Union[str, List[ContentItem]]]) -> Union[str, List[ContentItem]]:
+        """工具调用，记录最终返回给 LLM 的结果"""
+        key = self.tool_key(tool_name, tool_args)
+        record = self._lookup(key)
+        if record is not None:
+            self._sleep(record.get('d', 0))
+            result = record['r']
+            return [ContentItem(**item) for item in result] if isinstance(result, list) else result
+        started = time.perf_counter()
+        result = call()
+        stored = [item.model_dump(exclude_none=True) for item in result] if isinstance(result, list) else result
+        self._append({'t': 'tool', 'k': key, 'n': tool_name, 'r': stored, 'd': _elapsed(started)})
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, 'entries': sum(len(v) for v in self._records.values())}
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.mode == RECORD:
+            return None
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                self._stats['misses'] += 1
+                if self.mode == REPLAY:
+                    raise CassetteMissError(f'No recorded interaction for {key} in {self.path}')
+                return None
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            self._stats['hits'] += 1
+            return records[min(cursor, len(records) - 1)]
+
+    def _replay(self, record: Dict[str, Any]) -> Iterator[AIMessageChunk]:
+        previous = 0.0
+        chunks = record['c'] or [[0, '']]
+        for i, (offset, content) in enumerate(chunks):
+            self._sleep(offset - previous)
+            previous = offset
+            yield AIMessageChunk(content=content, usage_metadata=record.get('u') if i == len(chunks) - 1 else None)
+
+    async def _areplay(self, record: Dict[str, Any]) -> AsyncIterator[AIMessageChunk]:
+        previous = 0.0
+        chunks = record['c'] or [[0, '']]
+        for i, (offset, content) in enumerate(chunks):
+            await self._asleep(offset - previous)
+            previous = offset
+            yield AIMessageChunk(content=content, usage_metadata=record.get('u') if i == len(chunks) - 1 else None)
+
+    def _record_stream(self, key: str, stream: Iterator[AIMessageChunk]) -> Iterator[AIMessageChunk]:
+        started = time.perf_counter()
+        chunks, usage = [], None
+        for chunk in stream:
+            chunks.append([_elapsed(started), chunk.content])
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            yield chunk
+        # 只记录完整结束的流
+        self._append({'t': 'llm', 'k': key, 'c': chunks, 'u': usage})
+
+    async def _arecord_stream(self, key: str, stream: AsyncIterator[AIMessageChunk]) -> AsyncIterator[AIMessageChunk]:
+        started = time.perf_counter()
+        chunks, usage = [], None
+        async for chunk in stream:
+            chunks.append([_elapsed(started), chunk.content])
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            yield chunk
+        self._append({'t': 'llm', 'k': key, 'c': chunks, 'u': usage})
+
+    def _append(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str)
+        with self._lock:
+            if self.mode == AUTO:
+                # 新录制的调用在本次运行中同样可以回放
+                self._records.setdefault(record['k'], []).append(record)
+                self._cursors[record['k']] = len(self._records[record['k']])
+            self._stats['recorded'] += 1
+            with self._open('at') as f:
+                f.write(line + '\n')
+        logger.debug(f"[CASSETTE] 录制 {record['t']}: {record['k']}")
+
+    def _load(self):
+        with self._open('rt') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    self._records.setdefault(record['k'], []).append(record)
+        logger.info(f'[CASSETTE] 加载 {self.path}: {sum(len(v) for v in self._records.values())} 条记录')
+
+    def _open(self, mode: str):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, mode, encoding='utf-8')
+        return open(self.path, mode, encoding='utf-8')
+
+    def _sleep(self, seconds: float):
+        if self.pace and seconds > 0:
+            time.sleep(seconds * self.pace)
+
+    async def _asleep(self, seconds: float):
+        if self.pace and seconds > 0:
+            await asyncio.sleep(seconds * self.pace)
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(cfg: Union[None, str, Dict, Cassette] = None) -> Optional[Cassette]:
+    """
+    根据配置获取 cassette，相同路径的 Assistant 共享同一个实例。
+    cfg 为空时读取环境变量 MY_AGENT_CASSETTE（文件路径）、MY_AGENT_CASSETTE_MODE（record/replay/auto，
+    默认 replay）与 MY_AGENT_CASSETTE_PACE（默认 0，不等待）。
+    cfg: 'run.cassette.jsonl.gz' 或 {'path': ..., 'mode': 'record', 'pace': 1}
+    """
+    if isinstance(cfg, Cassette):
+        return cfg
+    if not cfg:
+        if not os.getenv('MY_AGENT_CASSETTE'):
+            return None
+        cfg = {'path': os.getenv('MY_AGENT_CASSETTE'), 'mode': os.getenv('MY_AGENT_CASSETTE_MODE', REPLAY),
+               'pace': float(os.getenv('MY_AGENT_CASSETTE_PACE', '0'))}
+    elif isinstance(cfg, str):
+        cfg = {'path': cfg}
+    with _cassettes_lock:
+        cassette = _cassettes.get(cfg['path'])
+        if cassette is None or cassette.mode != cfg.get('mode', REPLAY):
+            cassette = _cassettes[cfg['path']] = Cassette(**cfg)
+        return cassette
+
+
+def _to_message(record: Dict[str, Any]) -> AIMessage:
+    return AIMessage(content=''.join(content for _, content in record['c']), usage_metadata=record.get('u'))
+
+
+def _elapsed(started: float) -> float:
+    return round(time.perf_counter() - started, 4)
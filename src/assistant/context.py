@@ -0,0 +1,185 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+from ..log import logger
+
+# 摘要消息的标记，保存在 additional_kwargs 中
+SUMMARY_KEY = 'context_summary'
+SUMMARY_TITLE = '## 早期对话摘要（已压缩）'
+ELIDE_MARK = '\n...[已省略 {} 字符]...\n'
+# 每条消息的格式开销（角色、分隔符等）
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(content: Any) -> int:
+    """
+    本地快速估算 token 数，无需分词器：非 ASCII 字符（中文等）按 1 token/字，ASCII 文本按 4 字符/token。
+    """
+    if not content:
+        return 0
+    if isinstance(content, list):
+        return sum(estimate_tokens(item.get('text') if isinstance(item, dict) else getattr(item, 'text', item))
+                   for item in content)
+    if not isinstance(content, str):
+        content = str(content)
+    ascii_chars = len(content.encode('ascii', 'ignore'))
+    return len(content) - ascii_chars + (ascii_chars + 3) // 4
+
+
+def message_tokens(message: BaseMessage) -> int:
+    tokens = MESSAGE_OVERHEAD + estimate_tokens(message.content)
+    for tool_call in getattr(message, 'tool_calls', None) or []:
+        tokens += estimate_tokens(tool_call.get('name')) + estimate_tokens(
+            json.dumps(tool_call.get('args'), ensure_ascii=False))
+    return tokens
+
+
+def elide_text(text: str, max_tokens: int) -> str:
+    """超过 max_tokens 的文本只保留首尾，中间替换为省略标记"""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep = int(len(text) * max_tokens / tokens) // 2
+    return text[:keep] + ELIDE_MARK.format(len(text) - 2 * keep) + (text[-keep:] if keep else '')
+
+
+class ContextBudget:
+    """
+    工具循环的上下文预算。超出 max_tokens 时按以下顺序压缩，直到满足预算：
+    1. 早期轮次中的工具结果只保留首尾 tool_result_tokens；
+    2. 从最早的轮次开始折叠为一条摘要消息，摘要不超过 summary_tokens；
+    3. 仍超出时，最近轮次中的工具结果也只保留首尾。
+    系统提示词、首条用户消息与最近 keep_turns 轮的消息原样保留。
+    """
+
+    def __init__(self, max_tokens: int = 32768, keep_turns: int = 2, tool_result_tokens: int = 1024,
+                 summary_tokens: int = 1024):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.tool_result_tokens = tool_result_tokens
+        self.summary_tokens = summary_tokens
+
+    def count(self, messages: List[BaseMessage]) -> int:
+        return sum(message_tokens(m) for m in messages)
+
+    def compact(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """原地压缩 messages，已折叠的轮次不会再展开，之后的请求保持相同的前缀"""
+        before = self.count(messages)
+        if before <= self.max_tokens:
+            return messages
+        head, lines, turns = self._split(messages)
+        split = max(0, len(turns) - self.keep_turns)
+        old = [[self._elide(m) for m in turn] for turn in turns[:split]]
+        recent = turns[split:]
+
+        result = self._assemble(head, lines, old, recent)
+        while old and self.count(result) > self.max_tokens:
+            lines = self._trim_lines(lines + _summarize(old.pop(0)))
+            result = self._assemble(head, lines, old, recent)
+        if self.count(result) > self.max_tokens:
+            recent = [[self._elide(m) for m in turn] for turn in recent]
+            result = self._assemble(head, lines, old, recent)
+
+        after = self.count(result)
+        if after > self.max_tokens:
+            logger.warning(f'[CONTEXT] 压缩后上下文仍超出预算: {after} > {self.max_tokens} tokens')
+        else:
+            logger.info(f'[CONTEXT] 上下文压缩: {before} -> {after} tokens')
+        messages[:] = result
+        return messages
+
+    def _split(self, messages: List[BaseMessage]) -> Tuple[List[BaseMessage], List[str], List[List[BaseMessage]]]:
+        """拆分为固定头部（系统提示词与首条用户消息）、已有摘要与按 LLM 输出划分的轮次"""
+        i = 0
+        while i < len(messages) and isinstance(messages[i], SystemMessage):
+            i += 1
+        if i < len(messages) and isinstance(messages[i], HumanMessage) and not _is_summary(messages[i]):
+            i += 1
+        head = messages[:i]
+        lines: List[str] = []
+        if i < len(messages) and _is_summary(messages[i]):
+            lines = list(messages[i].additional_kwargs.get(SUMMARY_KEY) or [])
+            i += 1
+        turns: List[List[BaseMessage]] = []
+        prev = None
+        for message in messages[i:]:
+            # 新一轮从用户消息或工具结果之后的 LLM 输出开始
+            new_turn = isinstance(message, HumanMessage) or (
+                    isinstance(message, AIMessage) and not isinstance(prev, AIMessage))
+            if new_turn or not turns:
+                turns.append([])
+            turns[-1].append(message)
+            prev = message
+        return head, lines, turns
+
+    def _assemble(self, head: List[BaseMessage], lines: List[str], old: List[List[BaseMessage]],
+                  recent: List[List[BaseMessage]]) -> List[BaseMessage]:
+        result = list(head)
+        if lines:
+            result.append(HumanMessage(content=SUMMARY_TITLE + '\n' + '\n'.join(lines),
+                                       additional_kwargs={SUMMARY_KEY: lines}))
+        for turn in old + recent:
+            result.extend(turn)
+        return result
+
+    def _elide(self, message: BaseMessage) -> BaseMessage:
+        if isinstance(message, ToolMessage) and isinstance(message.content, str):
+            content = elide_text(message.content, self.tool_result_tokens)
+            if content is not message.content:
+                return message.model_copy(update={'content': content})
+        return message
+
+    def _trim_lines(self, lines: List[str]) -> List[str]:
+        """摘要超出 summary_tokens 时丢弃最早的条目"""
+        total = sum(estimate_tokens(line) + 1 for line in lines)
+        start = 0
+        while total > self.summary_tokens and start < len(lines) - 1:
+            total -= estimate_tokens(lines[start]) + 1
+            start += 1
+        return lines[start:]
+
+
+def get_context_budget(cfg: Union[None, int, Dict, ContextBudget]) -> Optional[ContextBudget]:
+    """
+    根据配置创建上下文预算，None 或 0 表示不限制。
+    cfg: 最大 token 数，或 {'max_tokens': 32768, 'keep_turns': 2, 'tool_result_tokens': 1024, 'summary_tokens': 1024}
+    """
+    if not cfg:
+        return None
+    if isinstance(cfg, ContextBudget):
+        return cfg
+    if isinstance(cfg, dict):
+        return ContextBudget(**cfg)
+    return ContextBudget(max_tokens=int(cfg))
+
+
+def _is_summary(message: BaseMessage) -> bool:
+    return SUMMARY_KEY in message.additional_kwargs
+
+
+def _summarize(turn: List[BaseMessage], limit: int = 120) -> List[str]:
+    """将一轮消息压缩为几行摘要，仅保留回复开头、工具调用与结果的首行"""
+    lines = []
+    for message in turn:
+        if isinstance(message, ToolMessage):
+            first_line = str(message.content).strip().split('\n', 1)[0]
+            lines.append(f'- 工具 {message.tool_call_id} 结果: {_shorten(first_line, limit)}')
+        elif isinstance(message, AIMessage):
+            content = str(message.content)
+            if '</think>' in content:
+                content = content.split('</think>', 1)[1]
+            if content.strip():
+                lines.append(f'- 助手: {_shorten(content.strip(), limit)}')
+            for tool_call in message.tool_calls or []:
+                args = json.dumps(tool_call.get('args'), ensure_ascii=False)
+                lines.append(f"- 调用工具 {tool_call.get('name')}: {_shorten(args, limit)}")
+        elif message.content:
+            lines.append(f'- 用户: {_shorten(str(message.content).strip(), limit)}')
+    return lines
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = ' '.join(text.split())
+    return text if len(text) <= limit else text[:limit] + '…'
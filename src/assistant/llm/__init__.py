@@ -4,17 +4,21 @@ from typing import List
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, FunctionMessage
 from langchain_openai import ChatOpenAI
 
+from .router import RouterChatModel
+
 LLM_REGISTRY = {}
 
 
 class OpenAi(ChatOpenAI):
     def __init__(self, cfg: dict):
-        allowed_params = ['timeout', 'max_retries','api_key','base_url','organization','max_tokens','temperature','model']
+        allowed_params = ['timeout', 'max_retries','api_key','base_url','organization','max_tokens','temperature','model',
+                          'http_client', 'http_async_client']
         # 筛选
         filtered_kwargs = {k: v for k, v in cfg.items() if k in allowed_params}
         super().__init__(**filtered_kwargs)
 
 LLM_REGISTRY['oai'] = OpenAi
+LLM_REGISTRY['router'] = RouterChatModel
 
 def convert_messages_to_openai(messages: List[BaseMessage]):
     hf_messages = []
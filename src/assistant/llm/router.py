@@ -0,0 +1,232 @@
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import openai
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from ...log import logger
+
+# 可在其他副本上重试的错误：连接失败、超时、限流与服务端错误
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+# 路由自身的配置项，其余配置透传给每个副本的模型
+ROUTER_KEYS = ('max_attempts', 'cooldown', 'health_check_interval', 'ewma_alpha')
+
+
+class Replica:
+    """一个 LLM 服务副本及其负载、延迟与健康状态"""
+
+    def __init__(self, base_url: str, model: BaseChatModel):
+        self.base_url = base_url
+        self.model = model
+        self.in_flight = 0
+        # 首个响应延迟的 EWMA（秒），尚无观测时为 None
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.down_until = 0.0
+        self.picked = 0
+
+    def healthy(self, now: float) -> bool:
+        return self.down_until <= now
+
+    def load(self) -> float:
+        # 未观测过延迟的副本优先被探索
+        return (self.in_flight + 1) * (self.latency or 0.0)
+
+
+class RouterChatModel(BaseChatModel):
+    """
+    多副本路由模型：每次请求发往负载最低的健康副本，负载按 (进行中请求数 + 1) × 延迟 EWMA 估算，
+    负载相同时按进行中请求数与轮询顺序选择。
+    请求失败的副本在 cooldown 秒内移出轮转，并在其他副本上重试，流式请求仅在尚未输出内容时重试。
+    health_check_interval > 0 时后台定期探测各副本的 /models 接口。
+
+    cfg: {'model_type': 'router', 'model': 'qwen', 'api_key': 'EMPTY',
+          'endpoints': ['http://host-a:8000/v1', {'base_url': 'http://host-b:8000/v1', 'api_key': 'xxx'}]}
+    """
+    model_name: Optional[str] = None
+    temperature: Optional[float] = None
+    max_attempts: int = 2
+    cooldown: float = 30.0
+    health_check_interval: float = 0.0
+    ewma_alpha: float = 0.3
+
+    _replicas: List[Replica] = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _seq: int = PrivateAttr(default=0)
+    _stop: Any = PrivateAttr(default_factory=threading.Event)
+
+    def __init__(self, cfg: dict):
+        super().__init__(model_name=cfg.get('model'), temperature=cfg.get('temperature'),
+                         **{k: cfg[k] for k in ROUTER_KEYS if k in cfg})
+        from ..base import get_chat_model
+
+        common = {k: v for k, v in cfg.items() if k not in ROUTER_KEYS + ('model_type', 'endpoints')}
+        # 副本之间的重试由路由负责
+        common.setdefault('max_retries', 0)
+        for endpoint in cfg.get('endpoints') or []:
+            if isinstance(endpoint, str):
+                endpoint = {'base_url': endpoint}
+            model = get_chat_model({**common, **endpoint, 'model_type': 'oai'})
+            self._replicas.append(Replica(endpoint['base_url'], model))
+        if not self._replicas:
+            raise ValueError(f'Router model requires endpoints: {cfg}')
+        if self.health_check_interval > 0:
+            threading.Thread(target=self._health_loop, name='llm_router_health', daemon=True).start()
+
+    @property
+    def _llm_type(self) -> str:
+        return 'router'
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {'model_name': self.model_name, 'endpoints': [r.base_url for r in self._replicas]}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tried, error = [], None
+        while True:
+            replica = self._pick(tried, error)
+            started = time.monotonic()
+            try:
+                result = replica.model._generate(messages, stop=stop, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                error = self._mark_down(replica, e)
+                continue
+            finally:
+                self._release(replica)
+            self._observe(replica, time.monotonic() - started)
+            return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tried, error = [], None
+        while True:
+            replica = self._pick(tried, error)
+            started = time.monotonic()
+            try:
+                result = await replica.model._agenerate(messages, stop=stop, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                error = self._mark_down(replica, e)
+                continue
+            finally:
+                self._release(replica)
+            self._observe(replica, time.monotonic() - started)
+            return result
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tried, error = [], None
+        while True:
+            replica = self._pick(tried, error)
+            started, emitted = time.monotonic(), False
+            try:
+                for chunk in replica.model._stream(messages, stop=stop, **kwargs):
+                    if not emitted:
+                        self._observe(replica, time.monotonic() - started)
+                        emitted = True
+                    yield chunk
+            except RETRYABLE_ERRORS as e:
+                error = self._mark_down(replica, e)
+                if emitted:
+                    # 已经输出部分内容，重试会导致内容重复
+                    raise
+                continue
+            finally:
+                self._release(replica)
+            return
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        tried, error = [], None
+        while True:
+            replica = self._pick(tried, error)
+            started, emitted = time.monotonic(), False
+            try:
+                async for chunk in replica.model._astream(messages, stop=stop, **kwargs):
+                    if not emitted:
+                        self._observe(replica, time.monotonic() - started)
+                        emitted = True
+                    yield chunk
+            except RETRYABLE_ERRORS as e:
+                error = self._mark_down(replica, e)
+                if emitted:
+                    raise
+                continue
+            finally:
+                self._release(replica)
+            return
+
+    def check_health(self, timeout: float = 2.0) -> Dict[str, bool]:
+        """主动探测各副本的 /models 接口并更新健康状态"""
+        status = {}
+        for replica in self._replicas:
+            try:
+                replica.model.root_client.with_options(timeout=timeout, max_retries=0).models.list()
+                status[replica.base_url] = True
+            except Exception as e:
+                self._mark_down(replica, e)
+                status[replica.base_url] = False
+                continue
+            with self._lock:
+                replica.failures = 0
+                replica.down_until = 0.0
+        return status
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [{'base_url': r.base_url, 'in_flight': r.in_flight, 'latency': r.latency,
+                     'failures': r.failures, 'healthy': r.healthy(now)} for r in self._replicas]
+
+    def close(self):
+        """停止后台健康检查"""
+        self._stop.set()
+
+    def _pick(self, tried: List[Replica], error: Optional[Exception]) -> Replica:
+        """选择负载最低的健康副本并占用一个请求名额，重试次数用尽时抛出上一次的错误"""
+        if error is not None and len(tried) >= self.max_attempts:
+            raise error
+        now = time.monotonic()
+        with self._lock:
+            candidates = [r for r in self._replicas if r not in tried]
+            if not candidates:
+                raise error
+            # 全部副本不可用时，尝试最早恢复的副本
+            healthy = [r for r in candidates if r.healthy(now)] or [min(candidates, key=lambda r: r.down_until)]
+            replica = min(healthy, key=lambda r: (r.load(), r.in_flight, r.picked))
+            self._seq += 1
+            replica.picked = self._seq
+            replica.in_flight += 1
+        tried.append(replica)
+        return replica
+
+    def _release(self, replica: Replica):
+        with self._lock:
+            replica.in_flight -= 1
+
+    def _observe(self, replica: Replica, latency: float):
+        with self._lock:
+            if replica.latency is None:
+                replica.latency = latency
+            else:
+                replica.latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * replica.latency
+            replica.failures = 0
+            replica.down_until = 0.0
+
+    def _mark_down(self, replica: Replica, error: Exception) -> Exception:
+        with self._lock:
+            replica.failures += 1
+            replica.down_until = time.monotonic() + self.cooldown
+        logger.warning(f'[LLM_ROUTER] 副本 {replica.base_url} 请求失败，{self.cooldown}s 内移出轮转: {error}')
+        return error
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_check_interval):
+            self.check_health()
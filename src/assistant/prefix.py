@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.messages import BaseMessage
+
+from .context import estimate_tokens
+
+# 前缀块大小（字符），与 vLLM 按固定 token 数分块、以父块哈希链接的方式相同
+BLOCK_CHARS = 32
+# 记录的前缀块数量上限，近似服务端 KV cache 的容量
+MAX_BLOCKS = 1 << 16
+
+
+def render_prompt(messages: List[BaseMessage]) -> str:
+    """按对话模板的顺序拼接消息，近似服务端实际看到的 prompt 文本"""
+    parts = []
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content,
+                                                                                      ensure_ascii=False)
+        parts.append(f'<|{message.type}|>\n{content}\n')
+    return ''.join(parts)
+
+
+class PrefixCacheEstimator:
+    """
+    估算 prompt 与之前请求共享的前缀比例，用于确认服务端（vLLM automatic prefix caching）能否复用 KV cache。
+    prompt 按 BLOCK_CHARS 分块，每块的哈希包含之前所有块，开头连续命中的块即为可复用的前缀。
+    """
+
+    def __init__(self, block_chars: int = BLOCK_CHARS, max_blocks: int = MAX_BLOCKS):
+        self.block_chars = block_chars
+        self.max_blocks = max_blocks
+        self._blocks: 'OrderedDict[int, None]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'prompts': 0, 'prompt_tokens': 0, 'shared_tokens': 0}
+
+    def observe(self, messages: List[BaseMessage]) -> Dict[str, float]:
+        """记录一次请求，返回本次的 prompt token、共享前缀 token 与比例"""
+        text = render_prompt(messages)
+        step = self.block_chars
+        hashes, parent = [], 0
+        for start in range(0, len(text) - len(text) % step, step):
+            parent = hash((parent, text[start:start + step]))
+            hashes.append(parent)
+        with self._lock:
+            shared = 0
+            while shared < len(hashes) and hashes[shared] in self._blocks:
+                self._blocks.move_to_end(hashes[shared])
+                shared += 1
+            for block in hashes[shared:]:
+                self._blocks[block] = None
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+            shared_tokens = estimate_tokens(text[:shared * step])
+            prompt_tokens = estimate_tokens(text)
+            self._stats['prompts'] += 1
+            self._stats['prompt_tokens'] += prompt_tokens
+            self._stats['shared_tokens'] += shared_tokens
+        return {'prompt_tokens': prompt_tokens, 'prefix_tokens': shared_tokens,
+                'prefix_ratio': round(shared_tokens / prompt_tokens, 4) if prompt_tokens else 0.0}
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['ratio'] = round(stats['shared_tokens'] / stats['prompt_tokens'], 4) if stats['prompt_tokens'] else 0.0
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._blocks.clear()
+            self._stats = {'prompts': 0, 'prompt_tokens': 0, 'shared_tokens': 0}
+
+
+_estimator: Optional[PrefixCacheEstimator] = None
+_estimator_lock = threading.Lock()
+
+
+def get_prefix_estimator(force: bool = False) -> Optional[PrefixCacheEstimator]:
+    """
+    进程内共享的前缀估算器。设置环境变量 MY_AGENT_PREFIX_STATS=1 或 force 为 True（例如开启追踪时）启用，
+    否则返回 None，不增加请求开销。
+    """
+    global _estimator
+    if not force and os.getenv('MY_AGENT_PREFIX_STATS', '0').strip().lower() not in ('1', 'true'):
+        return None
+    if _estimator is None:
+        with _estimator_lock:
+            if _estimator is None:
+                _estimator = PrefixCacheEstimator()
+    return _estimator
+
+
+def prefix_stats() -> Dict[str, float]:
+    """已记录请求的 prompt token、共享前缀 token 与共享比例"""
+    estimator = get_prefix_estimator(force=True)
+    return estimator.stats()
@@ -1,9 +1,13 @@
+import asyncio
 import json
-from typing import List, Iterator, Optional, Dict
+from concurrent.futures import Future
+from typing import List, Iterator, Optional, Dict, AsyncIterator, Tuple
 
-from langchain_core.messages import BaseMessage, FunctionMessage, SystemMessage, AIMessage, ToolMessage
+from langchain_core.messages import BaseMessage, FunctionMessage, SystemMessage, AIMessage, ToolMessage, ToolCall
 
 from .assistant import BaseAssistant
+from .stream_parser import StreamParser, StreamEvent, TOOL_CALL
+from ..trace import current_tracer
 
 FN_NAME = '✿FUNCTION✿'
 FN_ARGS = '✿ARGS✿'
@@ -70,43 +74,122 @@ def get_function_description(function: Dict) -> str:
 class QwenAssistant(BaseAssistant):
 
     def _run(self, messages: List[BaseMessage], lang: str = 'zh', **kwargs) -> Iterator[List[BaseMessage]]:
-        extra_generate_cfg = {}
+        # 调用方传入的生成参数，例如结构化输出的 guided_json
+        extra_generate_cfg = dict(kwargs.get('generate_cfg') or {})
         if kwargs.get('seed') is not None:
             extra_generate_cfg['seed'] = kwargs['seed']
         while (True):
+            self._fit_context(messages)
             output_stream = self._call_llm(messages=messages,
-                                           extra_generate_cfg=extra_generate_cfg, stream=kwargs.get('stream', False), stream_usage=kwargs.get('usage', False))
+                                           extra_generate_cfg=extra_generate_cfg, stream=kwargs.get('stream', False), stream_usage=self._stream_usage(**kwargs))
             output: List[AIMessage] = []
+            # 流式输出时已提前发起的工具调用
+            dispatched: List[Tuple[ToolCall, Future]] = []
             if isinstance(output_stream, AIMessage):
                 output_stream = self._postprocess_messages(output_stream)
                 output = output_stream
                 yield output
             else:
-                full_resp = ''
+                # 增量解析，每个分块只处理新到达的文本
+                parser = StreamParser(self._parse_tool_call)
                 for o in output_stream:
                     if o:
-                        full_resp += o.content
-                        output = self._postprocess_messages(AIMessage(content=full_resp))
+                        self._dispatch_tools(_tool_calls(parser.feed(o.content)), dispatched, messages, **kwargs)
                         yield [o]
+                self._dispatch_tools(_tool_calls(parser.close()), dispatched, messages, **kwargs)
+                output = parser.to_messages()
+                # 流式输出的是原始文本块，额外输出解析后的工具调用
+                for out in output:
+                    if out.tool_calls:
+                        yield [out]
             if output:
                 messages.extend(output)
-                used_any_tool = False
+                if not dispatched:
+                    # 非流式输出，一次性并行发起本轮的所有工具调用
+                    self._dispatch_tools([tc for out in output for tc in (out.tool_calls or [])], dispatched, messages, **kwargs)
+                # 按工具调用出现的顺序合并结果
+                for tool_call, future in dispatched:
+                    yield self._append_tool_result(messages, tool_call, future.result())
+                if not dispatched:
+                    break
+
+    async def _arun(self, messages: List[BaseMessage], lang: str = 'zh', **kwargs) -> AsyncIterator[List[BaseMessage]]:
+        # 调用方传入的生成参数，例如结构化输出的 guided_json
+        extra_generate_cfg = dict(kwargs.get('generate_cfg') or {})
+        if kwargs.get('seed') is not None:
+            extra_generate_cfg['seed'] = kwargs['seed']
+        while (True):
+            self._fit_context(messages)
+            output_stream = await self._acall_llm(messages=messages,
+                                                  extra_generate_cfg=extra_generate_cfg, stream=kwargs.get('stream', False), stream_usage=self._stream_usage(**kwargs))
+            output: List[AIMessage] = []
+            dispatched: List[Tuple[ToolCall, asyncio.Task]] = []
+            if isinstance(output_stream, AIMessage):
+                output = self._postprocess_messages(output_stream)
+                yield output
+            else:
+                # 增量解析，每个分块只处理新到达的文本
+                parser = StreamParser(self._parse_tool_call)
+                async for o in output_stream:
+                    if o:
+                        self._adispatch_tools(_tool_calls(parser.feed(o.content)), dispatched, messages, **kwargs)
+                        yield [o]
+                self._adispatch_tools(_tool_calls(parser.close()), dispatched, messages, **kwargs)
+                output = parser.to_messages()
+                # 流式输出的是原始文本块，额外输出解析后的工具调用
                 for out in output:
                     if out.tool_calls:
-                        for tool_call in out.tool_calls:
-                            tool_result = self._call_tool(tool_call.get('name'), tool_call.get('args'), messages=messages, **kwargs)
-                            fn_msg = ToolMessage(
-                                tool_call_id=tool_call.get('name'),
-                                content=tool_result,
-                                artifact=tool_result,
-                            )
-                            messages.append(fn_msg)
-                            yield [ToolMessage(
-                                tool_call_id=tool_call.get('name'),
-                                content=f'<tool_response>\n{tool_result}\n</tool_response>\n',
-                                artifact=tool_result,
-                            )]
-                            used_any_tool = True
-                if not used_any_tool:
+                        yield [out]
+            if output:
+                messages.extend(output)
+                if not dispatched:
+                    self._adispatch_tools([tc for out in output for tc in (out.tool_calls or [])], dispatched, messages, **kwargs)
+                for tool_call, task in dispatched:
+                    yield self._append_tool_result(messages, tool_call, await task)
+                if not dispatched:
                     break
 
+    @staticmethod
+    def _stream_usage(**kwargs) -> bool:
+        # 开启追踪时请求服务端在流式输出末尾返回 token 用量
+        return kwargs.get('usage', False) or current_tracer() is not None
+
+    def _fit_context(self, messages: List[BaseMessage]):
+        """超出上下文预算时原地压缩 messages，之后追加的消息基于压缩后的上下文"""
+        if self.context_budget is not None:
+            self.context_budget.compact(messages)
+
+    def _dispatch_tools(self, tool_calls: List[ToolCall], dispatched: list, messages: List[BaseMessage], **kwargs):
+        """
+        在后台线程池中发起工具调用，多个工具并行执行。
+        流式输出时 </tool_call> 闭合后立即调用，与剩余的生成过程重叠。
+        """
+        for tool_call in tool_calls:
+            future = self._submit_tool(tool_call.get('name'), tool_call.get('args'), messages=messages, **kwargs)
+            dispatched.append((tool_call, future))
+
+    def _adispatch_tools(self, tool_calls: List[ToolCall], dispatched: list, messages: List[BaseMessage], **kwargs):
+        """_dispatch_tools 的异步版本"""
+        for tool_call in tool_calls:
+            task = asyncio.ensure_future(
+                self._acall_tool(tool_call.get('name'), tool_call.get('args'), messages=messages, **kwargs))
+            dispatched.append((tool_call, task))
+
+    @staticmethod
+    def _append_tool_result(messages: List[BaseMessage], tool_call: dict, tool_result) -> List[ToolMessage]:
+        """将工具结果追加到上下文，并返回需要输出给调用方的消息"""
+        fn_msg = ToolMessage(
+            tool_call_id=tool_call.get('name'),
+            content=tool_result,
+            artifact=tool_result,
+        )
+        messages.append(fn_msg)
+        return [ToolMessage(
+            tool_call_id=tool_call.get('name'),
+            content=f'<tool_response>\n{tool_result}\n</tool_response>\n',
+            artifact=tool_result,
+        )]
+
+
+def _tool_calls(events: List[StreamEvent]) -> List[ToolCall]:
+    return [event.tool_call for event in events if event.type == TOOL_CALL]
@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from langchain_core.messages import AIMessage, ToolCall
+
+THINK = 'think'
+CONTENT = 'content'
+TOOL_CALL = 'tool_call'
+
+
+@dataclass
+class StreamEvent:
+    """流式解析事件：think/content 为新增文本，tool_call 为一个已闭合的工具调用"""
+    type: str
+    text: str = ''
+    tool_call: Optional[ToolCall] = None
+
+
+class StreamParser:
+    """
+    增量解析 LLM 流式输出中的 <think> 与 <tool_call> 块。
+
+    每次 feed 只处理新到达的文本：块外文本与 think 文本立即输出，仅保留末尾可能是不完整标签的几个字符；
+    tool_call 块的文本单独累积，在 </tool_call> 闭合时解析并输出工具调用事件。整体为线性复杂度。
+    """
+    tags = (THINK, TOOL_CALL)
+
+    def __init__(self, parse_tool_call: Callable[..., Optional[ToolCall]]):
+        self.parse_tool_call = parse_tool_call
+        self.tool_calls: List[ToolCall] = []
+        self._buffer = ''
+        self._tag = None
+        self._tool_parts: List[str] = []
+        # 第一个 <tool_call> 之前的原始文本，与 _postprocess_messages 的 pre_thought 一致
+        self._prefix: Optional[List[str]] = []
+        self._first_prefix = ''
+        self._open_tags = [f'<{tag}>' for tag in self.tags]
+
+    def feed(self, text: str) -> List[StreamEvent]:
+        events: List[StreamEvent] = []
+        self._buffer += text
+        while self._buffer:
+            if self._tag is None:
+                found = [(self._buffer.find(open_tag), tag) for open_tag, tag in zip(self._open_tags, self.tags)]
+                found = [(idx, tag) for idx, tag in found if idx != -1]
+                if found:
+                    idx, tag = min(found)
+                    self._emit(events, self._buffer[:idx])
+                    self._buffer = self._buffer[idx + len(tag) + 2:]
+                    self._open(tag)
+                    continue
+                keep = partial_tag_len(self._buffer, self._open_tags)
+            else:
+                end_tag = f'</{self._tag}>'
+                idx = self._buffer.find(end_tag)
+                if idx != -1:
+                    self._emit(events, self._buffer[:idx])
+                    self._buffer = self._buffer[idx + len(end_tag):]
+                    self._close(events)
+                    continue
+                keep = partial_tag_len(self._buffer, [end_tag])
+            # 末尾可能是不完整的标签，保留到下一次处理
+            cut = len(self._buffer) - keep
+            self._emit(events, self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+            break
+        return events
+
+    def close(self) -> List[StreamEvent]:
+        """输出结束，处理剩余文本；未闭合的工具调用只保留工具名"""
+        events: List[StreamEvent] = []
+        self._emit(events, self._buffer)
+        self._buffer = ''
+        if self._tag == TOOL_CALL:
+            tool_call = self.parse_tool_call(''.join(self._tool_parts), complete=False)
+            self._tool_parts = []
+            if tool_call:
+                self.tool_calls.append(tool_call)
+                events.append(StreamEvent(TOOL_CALL, tool_call=tool_call))
+        self._tag = None
+        return events
+
+    def to_messages(self) -> List[AIMessage]:
+        """生成与 _postprocess_messages 相同结构的消息"""
+        prefix = ''.join(self._prefix) if self._prefix is not None else self._first_prefix
+        new_messages = [AIMessage(content=prefix if prefix.strip() else '')]
+        if self.tool_calls:
+            new_messages.append(AIMessage(content='', tool_calls=list(self.tool_calls)))
+        return new_messages
+
+    def _open(self, tag: str):
+        self._tag = tag
+        if self._prefix is not None:
+            if tag == TOOL_CALL:
+                self._first_prefix = ''.join(self._prefix)
+                self._prefix = None
+            else:
+                self._prefix.append(f'<{tag}>')
+
+    def _close(self, events: List[StreamEvent]):
+        if self._tag == TOOL_CALL:
+            tool_call = self.parse_tool_call(''.join(self._tool_parts), complete=True)
+            self._tool_parts = []
+            if tool_call:
+                self.tool_calls.append(tool_call)
+                events.append(StreamEvent(TOOL_CALL, tool_call=tool_call))
+        elif self._prefix is not None:
+            self._prefix.append(f'</{self._tag}>')
+        self._tag = None
+
+    def _emit(self, events: List[StreamEvent], text: str):
+        if not text:
+            return
+        if self._tag == TOOL_CALL:
+            self._tool_parts.append(text)
+            return
+        if self._prefix is not None:
+            self._prefix.append(text)
+        events.append(StreamEvent(THINK if self._tag == THINK else CONTENT, text=text))
+
+
+def partial_tag_len(text: str, tags: List[str]) -> int:
+    """text 末尾与任一标签前缀重合的最大长度"""
+    # 不完整的标签一定以 '<' 开头，绝大多数分块可以直接跳过
+    start = text.find('<', max(0, len(text) - max(len(tag) for tag in tags) + 1))
+    while start != -1:
+        suffix = text[start:]
+        if any(tag.startswith(suffix) for tag in tags):
+            return len(suffix)
+        start = text.find('<', start + 1)
+    return 0
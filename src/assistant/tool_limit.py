@@ -0,0 +1,83 @@
+"""
+单个工具的进程级并发上限。
+
+超过上限的调用在提交到线程池之前排队，不占用线程池的工作线程，排队时间也不计入工具调用的耗时。
+相同工具名与上限的配置在进程内共享同一个限制器，多个 Assistant 同时调用时总并发同样受限。
+"""
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Executor, Future
+from functools import partial
+from typing import Callable, Deque, Dict, Tuple
+
+from src.log import logger
+
+
+class ToolLimiter:
+    """限制同一工具同时执行的调用数，超出的调用按提交顺序排队"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._running = 0
+        self._queue: Deque[Tuple[Executor, Callable, Future]] = deque()
+        self._lock = threading.Lock()
+
+    def submit(self, executor: Executor, fn: Callable, *args, **kwargs) -> Future:
+        """有空闲名额时立即提交到 executor，否则排队，返回调用结果的 Future"""
+        # 排队的调用稍后在其他线程中提交，需要保留当前的上下文（例如追踪的父 span）
+        task = partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        future = Future()
+        with self._lock:
+            if self._running >= self.limit:
+                self._queue.append((executor, task, future))
+                logger.debug(f'[TOOL_LIMIT] 工具 {self.name} 达到并发上限 {self.limit}，排队 {len(self._queue)}')
+                return future
+            self._running += 1
+        self._start(executor, task, future)
+        return future
+
+    def _start(self, executor: Executor, task: Callable, future: Future):
+        while True:
+            if future.set_running_or_notify_cancel():
+                try:
+                    inner = executor.submit(task)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    inner.add_done_callback(lambda done: self._finish(done, future))
+                    return
+            # 已取消或提交失败，名额交给下一个排队的调用
+            with self._lock:
+                if not self._queue:
+                    self._running -= 1
+                    return
+                executor, task, future = self._queue.popleft()
+
+    def _finish(self, done: Future, future: Future):
+        if done.cancelled():
+            future.set_exception(CancelledError())
+        elif done.exception() is not None:
+            future.set_exception(done.exception())
+        else:
+            future.set_result(done.result())
+        with self._lock:
+            if not self._queue:
+                self._running -= 1
+                return
+            executor, task, future = self._queue.popleft()
+        self._start(executor, task, future)
+
+
+_limiters: Dict[Tuple[str, int], ToolLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_tool_limiter(name: str, limit: int) -> ToolLimiter:
+    """进程内共享的工具并发限制器"""
+    with _limiters_lock:
+        key = (name, limit)
+        if key not in _limiters:
+            _limiters[key] = ToolLimiter(name, limit)
+        return _limiters[key]
@@ -0,0 +1,139 @@
+"""批量执行任务。
+
+从 JSONL 文件读取任务，每行为 {"id": "...", "task": "..."} 或一个字符串，
+以有界并发通过任务图执行，每个任务使用独立的 thread_id，完成一个就向输出文件追加一行结果。
+
+    python -m src.graph.batch tasks.jsonl -o results.jsonl -c 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, is_dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from langgraph.graph.state import CompiledStateGraph
+
+from src.agent.agent_state import AgentState
+from src.log import logger
+
+# 结果中保留的状态字段
+RESULT_FIELDS = ('knowledge', 'task_finish', 'executed_index', 'task_list', 'response')
+
+
+def load_tasks(path: str) -> List[Dict[str, Any]]:
+    tasks = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {'task': item}
+            item.setdefault('id', str(line_no))
+            item['id'] = str(item['id'])
+            tasks.append(item)
+    return tasks
+
+
+def finished_ids(output_path: str) -> set:
+    """输出文件中已成功完成的任务，重新执行批次时跳过"""
+    if not os.path.exists(output_path):
+        return set()
+    done = set()
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 上次中断时可能写了半行
+                continue
+            if record.get('status') == 'ok':
+                done.add(str(record.get('id')))
+    return done
+
+
+async def arun_batch(tasks: Iterable[Dict[str, Any]], output_path: str, max_concurrency: Optional[int] = None,
+                     graph: Optional[CompiledStateGraph] = None, batch_id: Optional[str] = None,
+                     skip_finished: bool = True) -> Dict[str, int]:
+    """
+    并发执行一批任务，结果按完成顺序追加写入 output_path，返回成功与失败的数量。
+    每个任务的 thread_id 为 {batch_id}-{id}，使用带 checkpointer 的图时可以据此恢复或重跑子任务。
+    """
+    if graph is None:
+        from src.graph.graph import graph
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv('MY_AGENT_BATCH_CONCURRENCY', '8'))
+    batch_id = batch_id or os.path.splitext(os.path.basename(output_path))[0]
+    tasks = list(tasks)
+    if skip_finished:
+        done = finished_ids(output_path)
+        if done:
+            logger.info(f'[BATCH] 跳过已完成的 {len(done)} 个任务')
+        tasks = [t for t in tasks if t['id'] not in done]
+    counts = {'ok': 0, 'error': 0}
+    if not tasks:
+        return counts
+
+    inputs = [AgentState(user_task=t['task']) for t in tasks]
+    configs = [{'configurable': {'thread_id': f"{batch_id}-{t['id']}"}, 'max_concurrency': max_concurrency,
+                'run_name': f"batch-{t['id']}"} for t in tasks]
+    started = time.perf_counter()
+    logger.info(f'[BATCH] 开始执行 {len(tasks)} 个任务，并发数 {max_concurrency}')
+    with open(output_path, 'a', encoding='utf-8') as out:
+        async for i, output in graph.abatch_as_completed(inputs, configs, return_exceptions=True):
+            record = _to_record(tasks[i], configs[i], output)
+            counts[record['status']] += 1
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            out.flush()
+            logger.info(f"[BATCH] 任务 {tasks[i]['id']} 完成: {record['status']} "
+                        f"({sum(counts.values())}/{len(tasks)})")
+    logger.info(f'[BATCH] 全部完成，耗时 {time.perf_counter() - started:.1f}s: {counts}')
+    return counts
+
+
+def run_batch(tasks: Iterable[Dict[str, Any]], output_path: str, max_concurrency: Optional[int] = None,
+              graph: Optional[CompiledStateGraph] = None, batch_id: Optional[str] = None,
+              skip_finished: bool = True) -> Dict[str, int]:
+    """arun_batch 的同步入口"""
+    return asyncio.run(arun_batch(tasks, output_path, max_concurrency=max_concurrency, graph=graph,
+                                  batch_id=batch_id, skip_finished=skip_finished))
+
+
+def _to_record(task: Dict[str, Any], config: Dict[str, Any], output: Any) -> Dict[str, Any]:
+    record = {'id': task['id'], 'task': task['task'], 'thread_id': config['configurable']['thread_id']}
+    if isinstance(output, Exception):
+        return {**record, 'status': 'error', 'error': f'{type(output).__name__}: {output}'}
+    values = output if isinstance(output, dict) else asdict(output)
+    for key in RESULT_FIELDS:
+        value = values.get(key)
+        if isinstance(value, list):
+            value = [asdict(v) if is_dataclass(v) else v for v in value]
+        record[key] = value
+    return {**record, 'status': 'ok'}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='批量执行 JSONL 文件中的任务')
+    parser.add_argument('input', help='任务文件，每行为 {"id": ..., "task": ...} 或字符串')
+    parser.add_argument('-o', '--output', default='results.jsonl', help='结果文件，按完成顺序追加写入')
+    parser.add_argument('-c', '--concurrency', type=int, default=None,
+                        help='最大并发任务数，默认读取 MY_AGENT_BATCH_CONCURRENCY 或 8')
+    parser.add_argument('--checkpoint', action='store_true', help='使用本地 checkpointer 保存每个任务的状态')
+    parser.add_argument('--batch-id', default=None, help='thread_id 前缀，默认使用输出文件名')
+    parser.add_argument('--rerun-finished', action='store_true', help='重新执行输出文件中已完成的任务')
+    args = parser.parse_args(argv)
+
+    graph = None
+    if args.checkpoint:
+        from src.graph.graph import get_local_graph
+        graph = get_local_graph()
+    counts = run_batch(load_tasks(args.input), args.output, max_concurrency=args.concurrency, graph=graph,
+                       batch_id=args.batch_id, skip_finished=not args.rerun_finished)
+    print(json.dumps(counts, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
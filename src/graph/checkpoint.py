@@ -0,0 +1,371 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import run_in_executor
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from src.log import logger
+
+# 超过该字节数的序列化结果使用 zlib 压缩
+COMPRESS_THRESHOLD = 512
+COMPRESSED_SUFFIX = '+zlib'
+
+# 状态中需要反序列化的自定义类型
+STATE_TYPES = [('src.agent.agent_state', 'TaskItem'), ('src.agent.agent_state', 'AgentState')]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata BLOB NOT NULL,
+    versions TEXT NOT NULL,
+    created REAL NOT NULL,
+    metadata_type TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    digest TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS blob_data (
+    digest TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+def default_serde() -> SerializerProtocol:
+    try:
+        return JsonPlusSerializer(allowed_msgpack_modules=STATE_TYPES)
+    except TypeError:
+        # 旧版本的 langgraph 不支持类型白名单
+        return JsonPlusSerializer()
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    基于本地 SQLite 的 LangGraph checkpointer，进程崩溃或中断后可以从最后完成的节点继续执行。
+
+    每个 checkpoint 只保存本步更新的 channel（new_versions），未更新的 channel 引用之前的版本；
+    channel 的值按内容摘要去重存储，节点未改变的字段不会重复写入。较大的值使用 zlib 压缩。
+    prune_interval > 0 时后台线程定期清理，每个线程只保留最近 keep_last 个 checkpoint。
+    """
+
+    def __init__(self, path: str = 'checkpoints.sqlite', *, serde: Optional[SerializerProtocol] = None,
+                 keep_last: int = 20, max_age: Optional[float] = None, prune_interval: float = 600):
+        super().__init__(serde=serde or default_serde())
+        self.path = path
+        self.keep_last = keep_last
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(checkpoints)')}
+        if 'metadata_type' not in columns:
+            # 旧版本的数据库，metadata 与 checkpoint 使用相同的序列化类型
+            self._conn.execute('ALTER TABLE checkpoints ADD COLUMN metadata_type TEXT')
+        self._conn.commit()
+        self._stop = threading.Event()
+        if prune_interval > 0:
+            threading.Thread(target=self._prune_loop, args=(prune_interval,), name='checkpoint_prune',
+                             daemon=True).start()
+
+    def __enter__(self) -> 'SqliteCheckpointSaver':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._conn.close()
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config['configurable']['thread_id']
+        checkpoint_ns = config['configurable'].get('checkpoint_ns', '')
+        checkpoint_id = get_checkpoint_id(config)
+        sql = ('SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata, '
+               'versions, COALESCE(metadata_type, type) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?')
+        params: Tuple = (thread_id, checkpoint_ns)
+        if checkpoint_id:
+            sql += ' AND checkpoint_id = ?'
+            params += (checkpoint_id,)
+        else:
+            sql += ' ORDER BY checkpoint_id DESC LIMIT 1'
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+            return self._to_tuple(row) if row else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        sql = ('SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata, '
+               'versions, COALESCE(metadata_type, type) FROM checkpoints')
+        where, params = [], []
+        if config:
+            where.append('thread_id = ?')
+            params.append(config['configurable']['thread_id'])
+            if config['configurable'].get('checkpoint_ns') is not None:
+                where.append('checkpoint_ns = ?')
+                params.append(config['configurable']['checkpoint_ns'])
+            if get_checkpoint_id(config):
+                where.append('checkpoint_id = ?')
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            where.append('checkpoint_id < ?')
+            params.append(get_checkpoint_id(before))
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC'
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self.serde.loads_typed((row[8], row[6]))
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+            with self._lock:
+                checkpoint_tuple = self._to_tuple(row)
+            if limit is not None:
+                limit -= 1
+            yield checkpoint_tuple
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config['configurable']['thread_id']
+        checkpoint_ns = config['configurable'].get('checkpoint_ns', '')
+        c = checkpoint.copy()
+        values: Dict[str, Any] = c.pop('channel_values')
+        # 只序列化本步更新的 channel
+        blobs = []
+        for channel, version in new_versions.items():
+            blobs.append((channel, str(version), self._dumps(values[channel]) if channel in values else None))
+        type_, data = self.serde.dumps_typed(c)
+        meta_type, meta = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        versions = json.dumps({k: str(v) for k, v in c['channel_versions'].items()})
+        with self._lock:
+            for channel, version, value in blobs:
+                digest = None
+                if value is not None:
+                    digest = hashlib.sha1(value[0].encode() + value[1]).hexdigest()
+                    self._conn.execute('INSERT OR IGNORE INTO blob_data (digest, type, data) VALUES (?, ?, ?)',
+                                       (digest, *value))
+                self._conn.execute('INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, digest) '
+                                   'VALUES (?, ?, ?, ?, ?)', (thread_id, checkpoint_ns, channel, version, digest))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, '
+                'type, checkpoint, metadata, versions, created, metadata_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (thread_id, checkpoint_ns, checkpoint['id'], config['configurable'].get('checkpoint_id'),
+                 type_, data, meta, versions, time.time(), meta_type))
+            self._conn.commit()
+        return {'configurable': {'thread_id': thread_id, 'checkpoint_ns': checkpoint_ns,
+                                 'checkpoint_id': checkpoint['id']}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = '') -> None:
+        thread_id = config['configurable']['thread_id']
+        checkpoint_ns = config['configurable'].get('checkpoint_ns', '')
+        checkpoint_id = config['configurable']['checkpoint_id']
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dumps(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, data, task_path))
+        # 普通写入只保留第一次，错误、中断等特殊写入覆盖旧值
+        with self._lock:
+            for row in rows:
+                verb = 'INSERT OR IGNORE' if row[4] >= 0 else 'INSERT OR REPLACE'
+                self._conn.execute(f'{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, '
+                                   f'channel, type, value, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+            self._conn.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for table in ('checkpoints', 'blobs', 'writes'):
+                self._conn.execute(f'DELETE FROM {table} WHERE thread_id = ?', (thread_id,))
+            self._delete_orphan_data()
+            self._conn.commit()
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await run_in_executor(None, self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None,
+                    limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        items = await run_in_executor(None, lambda: list(self.list(config, filter=filter, before=before,
+                                                                     limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await run_in_executor(None, self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = '') -> None:
+        return await run_in_executor(None, self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await run_in_executor(None, self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # 带随机后缀，从同一 checkpoint 分叉出的不同分支不会写入相同的版本
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split('.')[0])
+        return f'{current_v + 1:032}.{random.random():016}'
+
+    def prune(self, keep_last: Optional[int] = None, max_age: Optional[float] = None) -> int:
+        """
+        每个线程只保留最近 keep_last 个 checkpoint，最后更新早于 max_age 秒的线程整体删除，
+        并清理不再被引用的 channel 数据。返回删除的 checkpoint 数。
+        """
+        keep_last = self.keep_last if keep_last is None else keep_last
+        max_age = self.max_age if max_age is None else max_age
+        deleted = 0
+        with self._lock:
+            if max_age:
+                expired = [r[0] for r in self._conn.execute(
+                    'SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(created) < ?',
+                    (time.time() - max_age,))]
+                for thread_id in expired:
+                    deleted += self._conn.execute('DELETE FROM checkpoints WHERE thread_id = ?',
+                                                  (thread_id,)).rowcount
+                    self._conn.execute('DELETE FROM blobs WHERE thread_id = ?', (thread_id,))
+                    self._conn.execute('DELETE FROM writes WHERE thread_id = ?', (thread_id,))
+            groups = self._conn.execute('SELECT thread_id, checkpoint_ns FROM checkpoints GROUP BY thread_id, '
+                                        'checkpoint_ns HAVING COUNT(*) > ?', (keep_last,)).fetchall()
+            for thread_id, checkpoint_ns in groups:
+                deleted += self._prune_group(thread_id, checkpoint_ns, keep_last)
+            self._delete_orphan_data()
+            self._conn.commit()
+        if deleted:
+            logger.info(f'[CHECKPOINT] 清理 {deleted} 个过期 checkpoint')
+        return deleted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {table: self._conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                    for table in ('checkpoints', 'blobs', 'blob_data', 'writes')}
+
+    def _prune_group(self, thread_id: str, checkpoint_ns: str, keep_last: int) -> int:
+        rows = self._conn.execute('SELECT checkpoint_id, versions FROM checkpoints WHERE thread_id = ? AND '
+                                  'checkpoint_ns = ? ORDER BY checkpoint_id DESC',
+                                  (thread_id, checkpoint_ns)).fetchall()
+        kept, dropped = rows[:keep_last], rows[keep_last:]
+        for checkpoint_id, _ in dropped:
+            key = (thread_id, checkpoint_ns, checkpoint_id)
+            self._conn.execute('DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND '
+                               'checkpoint_id = ?', key)
+            self._conn.execute('DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND '
+                               'checkpoint_id = ?', key)
+        # 保留仍被剩余 checkpoint 引用的 channel 版本
+        referenced = {(channel, version) for _, versions in kept for channel, version in json.loads(versions).items()}
+        for channel, version in self._conn.execute('SELECT channel, version FROM blobs WHERE thread_id = ? AND '
+                                                   'checkpoint_ns = ?', (thread_id, checkpoint_ns)).fetchall():
+            if (channel, version) not in referenced:
+                self._conn.execute('DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? '
+                                   'AND version = ?', (thread_id, checkpoint_ns, channel, version))
+        return len(dropped)
+
+    def _delete_orphan_data(self):
+        self._conn.execute('DELETE FROM blob_data WHERE digest NOT IN '
+                           '(SELECT digest FROM blobs WHERE digest IS NOT NULL)')
+
+    def _prune_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.prune()
+            except Exception as e:
+                logger.warning(f'[CHECKPOINT] 清理 checkpoint 失败: {e}')
+
+    def _to_tuple(self, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, data, meta, versions, meta_type = row
+        checkpoint = self.serde.loads_typed((type_, data))
+        writes = self._conn.execute('SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND '
+                                    'checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_path, task_id, idx',
+                                    (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        return CheckpointTuple(
+            config={'configurable': {'thread_id': thread_id, 'checkpoint_ns': checkpoint_ns,
+                                     'checkpoint_id': checkpoint_id}},
+            checkpoint={**checkpoint,
+                        'channel_values': self._load_values(thread_id, checkpoint_ns, json.loads(versions))},
+            metadata=self.serde.loads_typed((meta_type, meta)),
+            parent_config={'configurable': {'thread_id': thread_id, 'checkpoint_ns': checkpoint_ns,
+                                            'checkpoint_id': parent_id}} if parent_id else None,
+            pending_writes=[(task_id, channel, self._loads(w_type, value))
+                            for task_id, channel, w_type, value in writes],
+        )
+
+    def _load_values(self, thread_id: str, checkpoint_ns: str, versions: Dict[str, str]) -> Dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            row = self._conn.execute('SELECT d.type, d.data FROM blobs b JOIN blob_data d ON b.digest = d.digest '
+                                     'WHERE b.thread_id = ? AND b.checkpoint_ns = ? AND b.channel = ? AND '
+                                     'b.version = ?', (thread_id, checkpoint_ns, channel, version)).fetchone()
+            if row is not None:
+                values[channel] = self._loads(*row)
+        return values
+
+    def _dumps(self, value: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        if len(data) > COMPRESS_THRESHOLD:
+            return type_ + COMPRESSED_SUFFIX, zlib.compress(data)
+        return type_, data
+
+    def _loads(self, type_: str, data: bytes) -> Any:
+        if type_.endswith(COMPRESSED_SUFFIX):
+            type_, data = type_[:-len(COMPRESSED_SUFFIX)], zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+
+def get_checkpointer(path: Optional[str] = None, **kwargs) -> SqliteCheckpointSaver:
+    """本地运行使用的 checkpointer，默认路径可通过 MY_AGENT_CHECKPOINT_DB 配置"""
+    return SqliteCheckpointSaver(path or os.getenv('MY_AGENT_CHECKPOINT_DB', 'checkpoints.sqlite'), **kwargs)
@@ -4,23 +4,37 @@ Returns a predefined response. Replace logic and configuration as needed.
 """
 
 from __future__ import annotations
-from langgraph.checkpoint.memory import MemorySaver
+
+import atexit
+import contextlib
+import os
+import threading
+import uuid
+from typing import List, Optional
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 
 from src.agent.agent_state import AgentState, ModelMode
 from src.agent import (PlannerAgent, ReviewerAgent, ToolAgent, KnowledgeAgent)
 from src.agent.execute_agent import GeneralExecuteAgent
+from src.graph.checkpoint import get_checkpointer
+from src.graph.rerun import rerun_subtasks
 from src.log import logger
 from src.tools import all_tools
+from src.trace import traced, tracing
 
-planner = PlannerAgent(mode=ModelMode.LOCAL_QWEN)
+# 节点内使用流式调用，graph.stream(stream_mode="messages") 可以实时获取 token
+planner = PlannerAgent(mode=ModelMode.LOCAL_QWEN, stream=True)
 reviewer = ReviewerAgent(mode=ModelMode.LOCAL_QWEN)
 tool_agent = ToolAgent(mode=ModelMode.LOCAL_QWEN,tools=all_tools)
-general_execute_agent = GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN)
-knowledge = KnowledgeAgent(mode=ModelMode.LOCAL_QWEN)
+general_execute_agent = GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN, stream=True)
+knowledge = KnowledgeAgent(mode=ModelMode.LOCAL_QWEN, stream=True)
 
 
+@traced('knowledge')
 def knowledge_node(state: AgentState):
     state.node = 'KNOWLEDGE'
     state = knowledge.acquire_knowledge(state)
@@ -28,6 +42,15 @@ def knowledge_node(state: AgentState):
     return state
 
 
+@traced('knowledge')
+async def aknowledge_node(state: AgentState):
+    state.node = 'KNOWLEDGE'
+    state = await knowledge.aacquire_knowledge(state)
+    logger.info(f"[KNOWLEDGE] => {state.knowledge}")
+    return state
+
+
+@traced('plan')
 def plan_node(state: AgentState):
     state.node = 'PLAN'
     state = planner.plan(state)
@@ -35,12 +58,28 @@ def plan_node(state: AgentState):
     return state
 
 
+@traced('plan')
+async def aplan_node(state: AgentState):
+    state.node = 'PLAN'
+    state = await planner.aplan(state)
+    logger.info(f"[PLANNER] => {state.task_list}")
+    return state
+
+
+@traced('execute')
 def general_execute_node(state: AgentState):
     state.node = 'EXECUTE'
     state = general_execute_agent.run(state)
     return state
 
 
+@traced('execute')
+async def ageneral_execute_node(state: AgentState):
+    state.node = 'EXECUTE'
+    state = await general_execute_agent.arun(state)
+    return state
+
+
 def tools_node(state: AgentState):
     knowledge.node = 'tools'
     # print(f"\n[EXECUTOR节点] 输入状态: tool_calls={state.tool_calls is not None}")
@@ -75,45 +114,85 @@ def review_route(state: AgentState):
         return "plan"
 
 
-# 平台不支持本地持久化
-# memory = MemorySaver()
-# Define the graph
-graph = (
-    StateGraph(AgentState)
-    .add_node("knowledge", knowledge_node)
-    .add_node("plan", plan_node)
-    .add_node("execute", general_execute_node)
-    # .add_node("executor", tools_node)
-    # .add_node("review", review_node)
-    .add_edge(START, "knowledge")
-    .add_edge("knowledge", "plan")
-    .add_edge("plan", "execute")
-    .add_conditional_edges("execute", execute_route)
-    # .add_conditional_edges("review", review_route)
-    .compile(name="Planning Graph")
-)
-
-
-def run(task):
+def build_graph(checkpointer: Optional[BaseCheckpointSaver] = None):
+    """构建任务图，传入 checkpointer 时每个节点完成后保存状态，可按 thread_id 恢复执行"""
+    return (
+        StateGraph(AgentState)
+        # 同时提供同步与异步实现，graph.invoke 走同步路径，graph.ainvoke 走异步路径
+        .add_node("knowledge", RunnableLambda(knowledge_node, afunc=aknowledge_node, name="knowledge"))
+        .add_node("plan", RunnableLambda(plan_node, afunc=aplan_node, name="plan"))
+        .add_node("execute", RunnableLambda(general_execute_node, afunc=ageneral_execute_node, name="execute"))
+        # .add_node("executor", tools_node)
+        # .add_node("review", review_node)
+        .add_edge(START, "knowledge")
+        .add_edge("knowledge", "plan")
+        .add_edge("plan", "execute")
+        .add_conditional_edges("execute", execute_route)
+        # .add_conditional_edges("review", review_route)
+        .compile(name="Planning Graph", checkpointer=checkpointer)
+    )
+
+
+# 平台自带持久化，不使用本地 checkpointer
+graph = build_graph()
+
+_local_graph = None
+_local_graph_lock = threading.Lock()
+
+
+def get_local_graph():
+    """
+    本地执行使用的带 SQLite checkpointer 的 graph，首次使用时建立。
+    进程内只打开一个数据库连接与清理线程，进程退出时关闭。
+    """
+    global _local_graph
+    with _local_graph_lock:
+        if _local_graph is None:
+            checkpointer = get_checkpointer()
+            atexit.register(checkpointer.close)
+            _local_graph = build_graph(checkpointer)
+        return _local_graph
+
+
+def run(task, thread_id: Optional[str] = None):
+    """本地执行任务，状态保存在 SQLite 中；传入之前中断的 thread_id 时从最后完成的节点继续执行"""
     try:
-        state = AgentState(user_task=task)
+        thread_id = thread_id or uuid.uuid4().hex
+        config = {"configurable": {"thread_id": thread_id}}
+        local_graph = get_local_graph()
+        snapshot = local_graph.get_state(config)
+        if snapshot.next:
+            logger.info(f"[GRAPH] 从 checkpoint 恢复执行: thread_id={thread_id}, 下一节点: {snapshot.next}")
+            state = None
+        else:
+            logger.info(f"[GRAPH] 开始执行: thread_id={thread_id}")
+            state = AgentState(user_task=task)
         final_state: AgentState
-        for step in graph.stream(state, config={"configurable": {"thread_id": "1"}}, stream_mode="values", ):
-            print(f"\n--- {step.get('node', 'start')}本轮输出 ---")
-            for node, output in step.items():
-                if output not in (None, '', [], {}):
-                    print(f"[{node}] => {output}")
-
-                # 如果有中断（例如需要用户输入）
-                if hasattr(output, "awaiting_input") and output.awaiting_input:
-                    print(f"\n[{node}] 正在等待用户输入...")
-                    user_input = input("请输入：")
-                    step = graph.resume(user_input)
-                    print("\n>>> 已恢复执行")
-
-            # 每次保存最新状态
-            final_state = step
-            print("\n")
+        # 设置 MY_AGENT_TRACE 为目录时记录各节点与调用的耗时和 token，结束后导出 trace 文件
+        trace_dir = os.getenv('MY_AGENT_TRACE')
+        with (tracing(f'run-{thread_id}') if trace_dir else contextlib.nullcontext()) as tracer:
+            for step in local_graph.stream(state, config=config, stream_mode="values", ):
+                print(f"\n--- {step.get('node', 'start')}本轮输出 ---")
+                for node, output in step.items():
+                    if output not in (None, '', [], {}):
+                        print(f"[{node}] => {output}")
+
+                    # 如果有中断（例如需要用户输入）
+                    if hasattr(output, "awaiting_input") and output.awaiting_input:
+                        print(f"\n[{node}] 正在等待用户输入...")
+                        user_input = input("请输入：")
+                        step = local_graph.resume(user_input)
+                        print("\n>>> 已恢复执行")
+
+                # 每次保存最新状态
+                final_state = step
+                print("\n")
+
+        if tracer is not None:
+            os.makedirs(trace_dir, exist_ok=True)
+            tracer.export_chrome(os.path.join(trace_dir, f'{thread_id}.trace.json'))
+            tracer.export_jsonl(os.path.join(trace_dir, f'{thread_id}.trace.jsonl'))
+            logger.info(f"[TRACE] {tracer.summary()}")
 
         print("\n" + "=" * 50)
         print("=== 最终执行结果 ===")
@@ -136,5 +215,15 @@ def run(task):
         traceback.print_exc()
 
 
+def rerun(thread_id: str, indices: Optional[List[int]] = None):
+    """重新执行之前运行中失败（或指定）的子任务及其下游子任务，复用已保存的 knowledge 与计划"""
+    local_graph = get_local_graph()
+    final_state = rerun_subtasks(local_graph, thread_id, indices,
+                                 dependency_mode=general_execute_agent.dependency_mode)
+    for task in final_state.get('task_list', []):
+        print(f"[{task.index}] {task.task} => {task.status}: {task.result}")
+    return final_state
+
+
 if __name__ == "__main__":
     run("什么是世界模型")
@@ -0,0 +1,94 @@
+from dataclasses import fields
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
+
+from src.agent.agent_state import AgentState, TaskItem
+from src.agent.task_graph import dependents_of
+from src.log import logger
+
+
+def failed_subtasks(task_list: List[TaskItem]) -> List[int]:
+    """执行失败或结果为空的子任务"""
+    return [task.index for task in task_list if task.status == 'failed' or not task.result]
+
+
+def mark_dirty(state: AgentState, indices: Iterable[int], dependency_mode: str = 'explicit') -> Set[int]:
+    """
+    将子任务及所有依赖它们的子任务标记为待执行：清空结果并从 executed_index 中移除。
+    返回被标记的子任务 index。
+    """
+    dirty = dependents_of(state.task_list, indices, dependency_mode)
+    for task in state.task_list:
+        if task.index in dirty:
+            task.result = None
+            task.status = None
+    state.executed_index = [i for i in state.executed_index if i not in dirty]
+    return dirty
+
+
+def fork_for_rerun(graph: CompiledStateGraph, thread_id: str, indices: Optional[Iterable[int]] = None,
+                   checkpoint_id: Optional[str] = None,
+                   dependency_mode: str = 'explicit') -> Optional[RunnableConfig]:
+    """
+    基于线程的 checkpoint 分叉出新的状态，标记需要重新执行的子任务，knowledge 与计划保持不变。
+    indices 为空时选择失败或结果为空的子任务。新状态以 plan 节点的输出写入，下一步直接进入 execute 节点。
+    没有需要重新执行的子任务时返回 None。
+    """
+    snapshot = graph.get_state(_config(thread_id, checkpoint_id))
+    update = _dirty_update(snapshot.values, thread_id, indices, dependency_mode)
+    if update is None:
+        return None
+    return graph.update_state(snapshot.config, update, as_node='plan')
+
+
+async def afork_for_rerun(graph: CompiledStateGraph, thread_id: str, indices: Optional[Iterable[int]] = None,
+                          checkpoint_id: Optional[str] = None,
+                          dependency_mode: str = 'explicit') -> Optional[RunnableConfig]:
+    """fork_for_rerun 的异步版本"""
+    snapshot = await graph.aget_state(_config(thread_id, checkpoint_id))
+    update = _dirty_update(snapshot.values, thread_id, indices, dependency_mode)
+    if update is None:
+        return None
+    return await graph.aupdate_state(snapshot.config, update, as_node='plan')
+
+
+def rerun_subtasks(graph: CompiledStateGraph, thread_id: str, indices: Optional[Iterable[int]] = None,
+                   checkpoint_id: Optional[str] = None, dependency_mode: str = 'explicit') -> Dict[str, Any]:
+    """重新执行指定（默认为失败的）子任务及其下游子任务，返回最终状态"""
+    config = fork_for_rerun(graph, thread_id, indices, checkpoint_id, dependency_mode)
+    if config is None:
+        return graph.get_state(_config(thread_id, checkpoint_id)).values
+    return graph.invoke(None, config)
+
+
+async def arerun_subtasks(graph: CompiledStateGraph, thread_id: str, indices: Optional[Iterable[int]] = None,
+                          checkpoint_id: Optional[str] = None, dependency_mode: str = 'explicit') -> Dict[str, Any]:
+    """rerun_subtasks 的异步版本"""
+    config = await afork_for_rerun(graph, thread_id, indices, checkpoint_id, dependency_mode)
+    if config is None:
+        return (await graph.aget_state(_config(thread_id, checkpoint_id))).values
+    return await graph.ainvoke(None, config)
+
+
+def _config(thread_id: str, checkpoint_id: Optional[str] = None) -> RunnableConfig:
+    config: Dict[str, Any] = {'configurable': {'thread_id': thread_id}}
+    if checkpoint_id:
+        config['configurable']['checkpoint_id'] = checkpoint_id
+    return config
+
+
+def _dirty_update(values: Dict[str, Any], thread_id: str, indices: Optional[Iterable[int]],
+                  dependency_mode: str) -> Optional[Dict[str, Any]]:
+    if not values:
+        raise ValueError(f'No checkpoint found for thread {thread_id}')
+    names = {f.name for f in fields(AgentState)}
+    state = AgentState(**{k: v for k, v in values.items() if k in names})
+    indices = list(failed_subtasks(state.task_list) if indices is None else indices)
+    if not indices:
+        logger.info(f'[RERUN] 线程 {thread_id} 没有需要重新执行的子任务')
+        return None
+    dirty = mark_dirty(state, indices, dependency_mode)
+    logger.info(f'[RERUN] 线程 {thread_id} 重新执行子任务: {sorted(dirty)}')
+    return {'task_list': state.task_list, 'executed_index': state.executed_index}
@@ -1,5 +1,4 @@
 # 不自动调用工具，由外部统一调用
-import copy
 from typing import List, Iterator
 
 from qwen_agent import Agent
@@ -15,7 +14,7 @@ qwen_adaptation_init()
 class LocalQwenAgent(Agent):
 
     def _run(self, messages: List[Message], lang: str = 'en', **kwargs) -> Iterator[List[Message]]:
-        messages = copy.deepcopy(messages)
+        # Agent.run 已复制过消息，这里只读取，不再复制
         response = []
         extra_generate_cfg = {'lang': lang}
         output_stream = self._call_llm(messages=messages,
@@ -55,7 +54,7 @@ llm_cfg = {
 system_instruction = '''你需要协助用户完成命令执行。'''
 
 
-tools = ['code_interpreter', 'human_assistance', 'execute_command', 'list_sessions', 'read_output', 'create_session', 'query_url', 'search_web']  # `code_interpreter` 是框架自带的工具，用于执行代码。
+tools = ['code_interpreter', 'human_assistance', 'execute_command', 'list_sessions', 'read_output', 'wait_output', 'create_session', 'query_url', 'search_web']  # `code_interpreter` 是框架自带的工具，用于执行代码。
 bot = Assistant(llm=llm_cfg,
                 system_message=system_instruction,
                 function_list=tools,
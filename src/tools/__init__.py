@@ -12,7 +12,9 @@ from src.tools.command_execution_functions import (
     execute_command,
     list_sessions,
     read_output,
-    create_session
+    wait_output,
+    create_session,
+    close_session
 )
 from src.tools.filesystem_functions import (
     list_dir,
@@ -32,7 +34,9 @@ all_tools = [
     execute_command,
     list_sessions,
     read_output,
+    wait_output,
     create_session,
+    close_session,
     list_dir,
     read_file_lines,
     write_file,
@@ -50,13 +54,23 @@ def register_qwen_tool_from_langchain(lc_tool, name=None, description=None):
     return register_tool(tool_name)(ToolCls)
 
 
+# LangChain 工具转换得到的 qwen 工具类，每个 Assistant 初始化时复用，不重复生成参数 schema
+# key 为 (id(lc_tool), description, name)，值中保留工具本身以确认 id 未被复用
+_qwen_cls_cache = {}
+
+
 def get_qwen_cls(lc_tool: langchain_core.tools.BaseTool, description=None, name=None):
+    key = (id(lc_tool), description, name)
+    cached = _qwen_cls_cache.get(key)
+    if cached is not None and cached[0] is lc_tool:
+        return cached[1], cached[2]
     tool_name = name or lc_tool.name
     tool_description = description or getattr(lc_tool, "description", "")
     parameters = []
     # 如果有 args_schema，用其 schema() 提取字段
     if hasattr(lc_tool, "args_schema") and lc_tool.args_schema:
-        schema_info = lc_tool.args_schema.schema()
+        args_schema = lc_tool.args_schema
+        schema_info = args_schema.model_json_schema() if hasattr(args_schema, "model_json_schema") else args_schema.schema()
         required_fields = schema_info.get("required", [])
         for param_name, param_info in schema_info.get("properties", {}).items():
             parameters.append({
@@ -81,6 +95,7 @@ def get_qwen_cls(lc_tool: langchain_core.tools.BaseTool, description=None, name=
             "call": tool_call,
         }
     )
+    _qwen_cls_cache[key] = (lc_tool, ToolCls, tool_name)
     return ToolCls, tool_name
 
 
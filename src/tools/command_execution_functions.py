@@ -1,134 +1,135 @@
+import atexit
+import re
 from typing import Dict, List, Optional
-import subprocess
-import threading
-import uuid
 from langchain_core.tools import tool
 
-# 全局 session 管理
-_sessions: Dict[str, Dict] = {}
-_sessions_lock = threading.Lock()
+from src.tools.session_manager import get_session_manager
+from src.tools.shell_session import MAX_RESULT_BYTES
 
 
 @tool
-def execute_command(command: str, path: str, sessionid: str = None, timeout: int = 10, new_session: bool = True) -> dict:
+def execute_command(command: str, path: str = None, sessionid: str = None, timeout: int = 10,
+                    new_session: bool = True, background: bool = False) -> dict:
     """
-    使用shell脚本执行命令。new_session默认为True，会自动新建session，若需使用之前的会话则指定sessionid。
-    :param sessionid: 指定会话 ID
-    :param path: 命令执行的上下文路径
+    使用shell执行命令。同一会话中的命令在同一个shell进程中依次执行，cd、环境变量、激活的虚拟环境等会保留。
+    指定sessionid时在该会话中执行；未指定且new_session为True时自动新建会话。
     :param command: 要执行的命令
-    :param timeout: 超时时间（秒）
-    :param new_session: 是否新建session, 默认为True，若为False，则必须给出一个sessionid
-    :return: {"sessionid":当前会话的id, "output”:控制台的输出结果}
+    :param path: 命令执行的上下文路径，为空时沿用会话当前目录
+    :param sessionid: 指定会话 ID
+    :param timeout: 超时时间（秒），超时后结束该命令，会话保留
+    :param new_session: 未指定sessionid时是否新建session, 默认为True
+    :param background: 是否在后台执行，适用于构建、启动服务等耗时命令。为True时立即返回command_id，不受timeout限制，
+                       之后使用read_output读取输出或wait_output等待结束/等待输出出现指定内容；多个后台命令需使用不同的会话
+    :return: {"sessionid":当前会话的id, "output”:控制台的输出结果（过长时只包含最后一部分）, "exit_code":退出码, "timeout":是否超时,
+              "cwd":会话当前目录, "offset"/"end":本次输出在会话输出中的起止位置，可用read_output分页读取}
     """
-    import os
-    result = {}
     try:
-        shell = True
-        if new_session:
-            # 新建session
-            sessionid = _create_session(shell="bash")
         if not sessionid:
-            return {"error": "sessionid不能为空，除非new_session为True"}
-        with _sessions_lock:
-            if sessionid not in _sessions:
-                return {"sessionid": sessionid, "output": [f"[Error] sessionid {sessionid} 不存在"]}
-            shell_type = _sessions[sessionid].get('shell', 'cmd')
-
-        # 根据shell类型选择shell参数
-        if shell_type == 'cmd':
-            shell_executable = None  # 默认shell
-        elif shell_type == 'powershell':
-            shell_executable = 'powershell'
-        elif shell_type == 'bash':
-            shell_executable = r'D:\工具\编程\git\bin\bash.exe'
-            command = ['/usr/bin/shell', '-c'] + [command]
-            shell = False
-        else:
-            shell_executable = None  # fallback
-
-        # 执行命令
-        proc = subprocess.Popen(
-            command,
-            shell=shell,
-            cwd=path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            executable=shell_executable,
-            encoding='utf-8'
-            # creationflags=subprocess.CREATE_NEW_CONSOLE
-        )
-        try:
-            outs, _ = proc.communicate(timeout=timeout, input='ls')
-            timed_out = False
-        except subprocess.TimeoutExpired:
-            proc.kill()
-            outs, _ = proc.communicate()
-            outs += '\n[Timeout]'
-            timed_out = True
-        output_lines = outs.splitlines()
-        with _sessions_lock:
-            _sessions[sessionid]['output'].extend(output_lines)
-            _sessions[sessionid]['last_command'] = command
-            _sessions[sessionid]['history'].append(command)
-        result = {"sessionid": sessionid, "output": output_lines, "timeout": timed_out}
+            if not new_session:
+                return {"error": "sessionid不能为空，除非new_session为True"}
+            sessionid = _create_session(cwd=path)
+            path = None
+        session = get_session_manager().get(sessionid)
+        if session is None:
+            return {"sessionid": sessionid, "output": [f"[Error] sessionid {sessionid} 不存在或已因空闲超时被回收"]}
+        if background:
+            command_id = session.start(command, cwd=path)
+            if command_id is None:
+                return {"sessionid": sessionid, "error": "会话正在执行其他命令，请使用新的会话"}
+            return {"sessionid": sessionid, "command_id": command_id, "state": "running",
+                    "offset": session.commands[command_id]['offset']}
+        result = session.run(command, timeout=timeout, cwd=path)
+        return {"sessionid": sessionid, "output": result['output'].splitlines(), "exit_code": result['exit_code'],
+                "timeout": result['timeout'], "cwd": session.cwd, "offset": result.get('offset'),
+                "end": result.get('end')}
     except Exception as e:
-        with _sessions_lock:
-            _sessions[sessionid]['output'].append(f'[Error] {e}')
-            _sessions[sessionid]['last_command'] = command
-            _sessions[sessionid]['history'].append(command)
-        result = {"error": str(e)}
-    return result
+        return {"sessionid": sessionid, "error": str(e)}
 
 
 @tool
 def list_sessions() -> List[Dict]:
     """
-    查询存活的 session。
-    :return: [{sessionid, last_command, shell}]
+    查询 session 及其 shell 进程的状态。
+    :return: [{sessionid, shell, pid, state(running/idle/exited), cwd, last_command, ...}]
+    """
+    return [session.info() for session in get_session_manager().list()]
+
+
+@tool
+def read_output(sessionid: str, lines: int = 10, offset: int = None, max_bytes: int = 65536) -> dict:
+    """
+    读取指定 session 的输出。未指定offset时读取最后lines行；指定offset时从该位置开始读取，配合返回的next_offset分页读取完整输出。
+    :param sessionid: 会话 ID
+    :param lines: 未指定offset时需要读取的行数，小于等于0时从最早保留的输出开始读取全部输出（按max_bytes分页）
+    :param offset: 读取的起始位置（字节偏移），可使用execute_command返回的offset或上次读取返回的next_offset
+    :param max_bytes: 单次读取的最大字节数
+    :return: {"output":输出内容（行）, "offset":实际起始位置, "next_offset":下次读取的位置, "end":当前输出末尾, "truncated":offset之前的输出是否已被丢弃}
     """
-    with _sessions_lock:
-        return [
-            {'sessionid': sid, 'last_command': sess['last_command'], 'shell': sess.get('shell', 'cmd')}
-            for sid, sess in _sessions.items()
-        ]
+    session = get_session_manager().get(sessionid)
+    if session is None:
+        return {"error": f"sessionid {sessionid} 不存在或已因空闲超时被回收"}
+    result = session.read(offset=offset, max_bytes=max(1, min(max_bytes, MAX_RESULT_BYTES * 16)), lines=lines)
+    result['output'] = result['output'].splitlines()
+    return result
 
 
 @tool
-def read_output(sessionid: str, lines: int = 10) -> List[str]:
+def wait_output(sessionid: str, command_id: int = None, pattern: str = None, timeout: float = 30,
+                kill_on_timeout: bool = False) -> dict:
     """
-    读取指定 session 的输出。
+    等待后台命令结束，或等待命令的输出中出现与正则pattern匹配的内容（例如服务启动完成的日志），返回期间的输出。
     :param sessionid: 会话 ID
-    :param lines: 需要读取的行数
-    :return: 输出内容（行）
+    :param command_id: execute_command返回的command_id，为空时为该会话最近一条命令
+    :param pattern: 正则表达式（^ 与 $ 匹配每一行的开头与结尾），为空时等待命令结束
+    :param timeout: 最长等待时间（秒）
+    :param kill_on_timeout: 超时后是否结束命令，默认不结束，命令继续在后台执行
+    :return: {"finished":命令是否结束, "matched":是否匹配到pattern, "timeout":是否超时, "exit_code":退出码,
+              "output":命令的输出（过长时只包含最后一部分）, "offset"/"end":输出的起止位置}
     """
-    with _sessions_lock:
-        if sessionid not in _sessions:
-            return [f'[Error] sessionid {sessionid} 不存在']
-        output = _sessions[sessionid]['output']
-        return output[-lines:] if lines > 0 else output
+    session = get_session_manager().get(sessionid)
+    if session is None:
+        return {"error": f"sessionid {sessionid} 不存在或已因空闲超时被回收"}
+    if command_id is None:
+        command_id = next(reversed(session.commands), None)
+    try:
+        record = session.wait(command_id, timeout, pattern=pattern, kill_on_timeout=kill_on_timeout)
+    except (KeyError, re.error) as e:
+        return {"sessionid": sessionid, "error": str(e)}
+    end = record['end'] if record['end'] is not None else session.output.end
+    return {"sessionid": sessionid, "command_id": command_id, "finished": record['finished'],
+            "matched": record['matched'], "timeout": record['timeout'], "exit_code": record['exit_code'],
+            "output": session.tail(record['offset'], end).splitlines(), "offset": record['offset'], "end": end}
 
 
 @tool
-def create_session(shell: str = 'cmd') -> str:
+def create_session(shell: str = None, path: str = None) -> dict:
     """
-    创建一个新的 sessionid
-    :param shell: 指定shell类型，支持cmd、powershell、bash，默认cmd
+    创建一个新的会话并启动对应的shell进程
+    :param shell: 指定shell类型，支持bash、sh、cmd、powershell，默认Windows为cmd，其余系统为bash
+    :param path: shell的初始工作目录
+    :return: {sessionid, shell, pid, state, cwd, ...}
     """
-    return _create_session(shell)
-
-# @tool
-def _create_session(shell: str = 'cmd') -> str:
-    sessionid = str(uuid.uuid4())
-    with _sessions_lock:
-        _sessions[sessionid] = {
-            'history': [],
-            'output': [],
-            'last_command': None,
-            'shell': shell
-        }
-    return sessionid
-
-if __name__ == '__main__':
-    command = execute_command(command='ls', path='S:\\\\work')
-    print(command)
\ No newline at end of file
+    return get_session_manager().create(shell, path).info()
+
+
+@tool
+def close_session(sessionid: str) -> dict:
+    """
+    关闭会话，结束其shell进程及仍在执行的命令。不再使用的会话应及时关闭，空闲超时的会话也会被自动回收。
+    :param sessionid: 会话 ID
+    """
+    return {"sessionid": sessionid, "closed": get_session_manager().close(sessionid)}
+
+
+def _create_session(shell: Optional[str] = None, cwd: Optional[str] = None) -> str:
+    return get_session_manager().create(shell, cwd).sessionid
+
+
+def session_metrics() -> Dict[str, int]:
+    """会话数量、缓冲的输出字节数与回收计数"""
+    return get_session_manager().metrics()
+
+
+@atexit.register
+def _close_sessions():
+    get_session_manager().close_all()
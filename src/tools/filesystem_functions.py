@@ -3,6 +3,8 @@ from typing import List, Dict
 
 from langchain_core.tools import tool
 
+from src.tools.line_index import read_lines
+
 
 @tool
 def list_dir(path: str) -> List[str]:
@@ -25,15 +27,11 @@ def read_file_lines(path: str, start: int, end: int) -> Dict:
     :param end: 结束行（包含）
     :return: {'lines': [内容], 'total_lines': 总行数}
     """
-    lines = []
     total = 0
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            all_lines = f.readlines()
-            total = len(all_lines)
-            # 行号从1开始
-            lines = all_lines[start-1:end]
-        return {'lines': [l.rstrip('\n') for l in lines], 'total_lines': total}
+        # 普通文件使用按文件缓存的行偏移索引，只读取请求的行范围
+        lines, total = read_lines(path, start, end)
+        return {'lines': lines, 'total_lines': total}
     except Exception as e:
         return {'lines': [f"[Error] {e}"], 'total_lines': total}
 
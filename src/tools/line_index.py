@@ -0,0 +1,142 @@
+"""
+文本文件的行偏移索引，用于按行号分页读取大文件（例如多 GB 的日志）。
+
+- 首次读取时通过 mmap 扫描一遍换行符，记录每一行的起始字节偏移
+- 索引按 (路径, mtime_ns, 大小) 缓存，文件未变化时之后的读取只需读取请求的行范围
+- 安装了 numpy 时分块向量化扫描换行符，否则逐个查找
+- /proc、/sys 等伪文件的大小为 0 或不是普通文件，无法映射与索引，逐行读取
+"""
+import mmap
+import os
+import stat
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from src.log import logger
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy 为可选依赖
+    np = None
+
+# 缓存索引的文件数量
+INDEX_CACHE_SIZE = int(os.getenv('MY_AGENT_LINE_INDEX_CACHE', '16'))
+# 向量化扫描时每块的字节数
+SCAN_BLOCK = 64 << 20
+
+
+class LineIndex:
+    """文件中每一行的起始偏移，最后追加文件大小作为末行的结束位置"""
+
+    def __init__(self, path: str, mtime_ns: int, size: int, starts):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self._starts = starts
+
+    @property
+    def total_lines(self) -> int:
+        return len(self._starts) - 1
+
+    @classmethod
+    def build(cls, path: str) -> 'LineIndex':
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            if size == 0:
+                return cls(path, stat.st_mtime_ns, 0, [0])
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                newlines = _scan_newlines(mm, size)
+                trailing = mm[size - 1:size] != b'\n'
+        # 行首为文件开头与每个换行符之后的位置，末尾没有换行时最后一行同样计入
+        if np is not None:
+            starts = np.concatenate(([0], newlines + 1, [size] if trailing else []))
+            starts = starts.astype(np.uint32 if size < 1 << 32 else np.int64)
+        else:
+            starts = array('q', [0])
+            starts.extend(pos + 1 for pos in newlines)
+            if trailing:
+                starts.append(size)
+        return cls(path, stat.st_mtime_ns, size, starts)
+
+    def read(self, start: int, end: int) -> List[str]:
+        """读取第 start 到第 end 行（从 1 开始，包含 end），只读取这些行所在的字节范围"""
+        start, end = max(start, 1), min(end, self.total_lines)
+        if start > end:
+            return []
+        begin, stop = int(self._starts[start - 1]), int(self._starts[end])
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), stop, access=mmap.ACCESS_READ) as mm:
+                data = mm[begin:stop]
+        if data.endswith(b'\n'):
+            data = data[:-1]
+        return [_decode_line(line) for line in data.split(b'\n')]
+
+
+def _decode_line(line: bytes) -> str:
+    # 与文本模式读取一致，去掉 \r\n 换行中的 \r
+    return line.decode('utf-8', errors='replace').removesuffix('\r')
+
+
+def _scan_newlines(mm: mmap.mmap, size: int):
+    """返回所有换行符的偏移"""
+    if np is not None:
+        buffer = np.frombuffer(mm, dtype=np.uint8)
+        try:
+            # 分块比较，避免创建与文件同样大小的临时数组
+            return np.concatenate([np.flatnonzero(buffer[pos:pos + SCAN_BLOCK] == 10) + pos
+                                   for pos in range(0, size, SCAN_BLOCK)])
+        finally:
+            # 释放对 mmap 的引用，否则 mmap 无法关闭
+            del buffer
+    positions = array('q')
+    pos = mm.find(b'\n')
+    while pos != -1:
+        positions.append(pos)
+        pos = mm.find(b'\n', pos + 1)
+    return positions
+
+
+_cache: 'OrderedDict[str, LineIndex]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def read_lines(path: str, start: int, end: int) -> Tuple[List[str], int]:
+    """读取第 start 到第 end 行（从 1 开始，包含 end），返回 (行, 总行数)"""
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+        return _stream_lines(path, start, end)
+    index = get_line_index(path)
+    return index.read(start, end), index.total_lines
+
+
+def _stream_lines(path: str, start: int, end: int) -> Tuple[List[str], int]:
+    """逐行读取大小未知的文件，只保留请求范围内的行"""
+    lines, total = [], 0
+    with open(path, 'rb') as f:
+        for total, line in enumerate(f, start=1):
+            if start <= total <= end:
+                lines.append(_decode_line(line.removesuffix(b'\n')))
+    return lines, total
+
+
+def get_line_index(path: str) -> LineIndex:
+    """获取文件的行索引，文件的 mtime 或大小变化后重新建立"""
+    key = os.path.realpath(path)
+    st = os.stat(key)
+    with _cache_lock:
+        index: Optional[LineIndex] = _cache.get(key)
+        if index is not None and (index.mtime_ns, index.size) == (st.st_mtime_ns, st.st_size):
+            _cache.move_to_end(key)
+            return index
+    index = LineIndex.build(key)
+    logger.debug(f'[LINE_INDEX] 建立 {key} 的行索引，共 {index.total_lines} 行')
+    with _cache_lock:
+        _cache[key] = index
+        _cache.move_to_end(key)
+        while len(_cache) > INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
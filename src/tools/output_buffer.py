@@ -0,0 +1,177 @@
+"""
+会话输出的有界存储。
+
+输出按字节追加，以写入以来的绝对字节偏移作为游标：
+- 最新的 memory_limit 字节以分块形式保存在内存中
+- 更早的输出溢出到临时文件映射的环形区域（mmap），最多保留 spill_limit 字节
+- 超出两者之和的最早输出被丢弃，读取已丢弃的偏移时从最早保留的位置开始并标记 truncated
+
+读取只复制请求的范围，调用方可以按 offset 分页读取大量输出。
+"""
+import mmap
+import os
+import tempfile
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+# 内存中保留的输出字节数
+MEMORY_LIMIT = int(os.getenv('MY_AGENT_OUTPUT_MEMORY', str(1 << 20)))
+# 溢出到临时文件的输出字节数，0 表示不溢出，直接丢弃
+SPILL_LIMIT = int(os.getenv('MY_AGENT_OUTPUT_SPILL', str(64 << 20)))
+
+
+class OutputBuffer:
+    """内存分块 + mmap 环形文件的输出缓冲区，线程安全"""
+
+    def __init__(self, memory_limit: int = MEMORY_LIMIT, spill_limit: int = SPILL_LIMIT):
+        self.memory_limit = memory_limit
+        self.spill_limit = spill_limit
+        # 内存中的分块 (起始偏移, 数据)
+        self._chunks: Deque[Tuple[int, bytes]] = deque()
+        self._memory_bytes = 0
+        # 溢出区域保存 [_spill_start, _memory_start) 的数据
+        self._spill_start = 0
+        self._memory_start = 0
+        self._end = 0
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    @property
+    def start(self) -> int:
+        """最早仍保留的偏移"""
+        return self._spill_start
+
+    @property
+    def end(self) -> int:
+        """已写入的总字节数，即下一次写入的偏移"""
+        return self._end
+
+    def write(self, data: bytes) -> int:
+        """追加输出，返回写入后的 end"""
+        if not data:
+            return self._end
+        with self._lock:
+            self._chunks.append((self._end, data))
+            self._memory_bytes += len(data)
+            self._end += len(data)
+            while self._memory_bytes > self.memory_limit and self._chunks:
+                offset, chunk = self._chunks.popleft()
+                self._memory_bytes -= len(chunk)
+                self._memory_start = offset + len(chunk)
+                self._spill(chunk)
+            return self._end
+
+    def _spill(self, chunk: bytes):
+        if self.spill_limit <= 0:
+            self._spill_start = self._memory_start
+            return
+        if self._mmap is None:
+            self._file = tempfile.TemporaryFile(prefix='my_agent_output_')
+            self._file.truncate(self.spill_limit)
+            self._mmap = mmap.mmap(self._file.fileno(), self.spill_limit)
+        capacity = self.spill_limit
+        # 只需写入最后 capacity 字节，更早的部分写入后也会被覆盖
+        offset = self._memory_start - len(chunk)
+        if len(chunk) > capacity:
+            offset, chunk = offset + len(chunk) - capacity, chunk[-capacity:]
+        pos = offset % capacity
+        first = min(len(chunk), capacity - pos)
+        self._mmap[pos:pos + first] = chunk[:first]
+        if first < len(chunk):
+            self._mmap[:len(chunk) - first] = chunk[first:]
+        self._spill_start = max(self._spill_start, self._memory_start - capacity)
+
+    def read(self, offset: int, limit: int) -> Tuple[bytes, int]:
+        """
+        读取从 offset 开始最多 limit 字节，返回 (数据, 实际起始偏移)。
+        offset 早于 start 时从 start 开始。
+        """
+        with self._lock:
+            start = max(offset, self._spill_start)
+            stop = min(self._end, start + max(limit, 0))
+            if stop <= start:
+                return b'', start
+            parts = []
+            if start < self._memory_start:
+                parts.append(self._read_spill(start, min(stop, self._memory_start)))
+            for chunk_offset, chunk in self._chunks:
+                chunk_end = chunk_offset + len(chunk)
+                if chunk_end <= start:
+                    continue
+                if chunk_offset >= stop:
+                    break
+                parts.append(chunk[max(start - chunk_offset, 0):stop - chunk_offset])
+            return b''.join(parts), start
+
+    def _read_spill(self, start: int, stop: int) -> bytes:
+        capacity = self.spill_limit
+        pos = start % capacity
+        size = stop - start
+        first = min(size, capacity - pos)
+        data = self._mmap[pos:pos + first]
+        if first < size:
+            data += self._mmap[:size - first]
+        return data
+
+    def tail(self, lines: int, max_bytes: int) -> Tuple[bytes, int]:
+        """
+        读取最后 lines 行（最多 max_bytes 字节），返回 (数据, 起始偏移)。
+        lines <= 0 时从最早保留的位置开始读取最多 max_bytes 字节，调用方从返回的偏移继续分页。
+        """
+        if lines <= 0:
+            return self.read(self.start, max_bytes)
+        end = self._end
+        window = min(4096, max_bytes)
+        while True:
+            data, start = self.read(end - window, window)
+            # 末尾的换行不单独算一行
+            newlines = data.count(b'\n', 0, len(data) - 1 if data.endswith(b'\n') else len(data))
+            if newlines >= lines or start <= self.start or window >= max_bytes:
+                break
+            window = min(window * 4, max_bytes)
+        if newlines >= lines:
+            cut = len(data)
+            for _ in range(lines + (1 if data.endswith(b'\n') else 0)):
+                cut = data.rindex(b'\n', 0, cut)
+            data, start = data[cut + 1:], min(start + cut + 1, end)
+        return data, start
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'bytes_total': self._end,
+                'bytes_retained': self._end - self._spill_start,
+                'memory_bytes': self._memory_bytes,
+                'spilled_bytes': self._memory_start - self._spill_start,
+                'dropped_bytes': self._spill_start,
+            }
+
+    def close(self):
+        """释放溢出文件"""
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._file.close()
+                self._mmap = self._file = None
+            self._chunks.clear()
+            self._memory_bytes = 0
+            self._spill_start = self._memory_start = self._end
+
+
+def decode(data: bytes) -> Tuple[str, int]:
+    """
+    按 UTF-8 解码一段输出，返回 (文本, 解码的字节数)。
+    末尾不完整的多字节字符不解码，留给下一次从返回的偏移继续读取。
+    """
+    size = len(data)
+    # 最多回退 3 个字节找到最后一个字符的起始字节
+    for back in range(1, min(4, size) + 1):
+        byte = data[size - back]
+        if byte & 0xC0 != 0x80:
+            expected = 4 if byte >= 0xF0 else 3 if byte >= 0xE0 else 2 if byte >= 0xC0 else 1
+            if back < expected:
+                size -= back
+            break
+    return data[:size].decode('utf-8', errors='replace'), size
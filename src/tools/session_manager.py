@@ -0,0 +1,192 @@
+"""
+shell 会话的生命周期管理：
+- 会话数量上限，达到上限时关闭最久未使用的空闲会话
+- 空闲超过 TTL 的会话由后台线程定期关闭
+- 每个会话的输出缓冲区有固定配额
+- 清理 shell 退出或会话关闭后遗留在其进程组中的后台进程
+
+长期运行的服务中，会话数量、缓冲的输出与子进程数量因此保持有界。
+"""
+import os
+import signal
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+from src.log import logger
+from src.tools.shell_session import ShellSession, process_table
+
+# 会话空闲多久（秒）后被回收，0 表示不回收
+SESSION_TTL = float(os.getenv('MY_AGENT_SESSION_TTL', '600'))
+# 同时存在的会话数量上限
+MAX_SESSIONS = int(os.getenv('MY_AGENT_MAX_SESSIONS', '32'))
+# 每个会话的输出配额（字节）
+SESSION_OUTPUT_LIMIT = int(os.getenv('MY_AGENT_SESSION_OUTPUT', str(16 << 20)))
+# 后台回收的检查间隔（秒）
+REAP_INTERVAL = float(os.getenv('MY_AGENT_SESSION_REAP_INTERVAL', '30'))
+
+
+class SessionLimitError(RuntimeError):
+    """会话数量已达上限且所有会话都在执行命令"""
+
+
+class SessionManager:
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS,
+                 output_limit: int = SESSION_OUTPUT_LIMIT, reap_interval: float = REAP_INTERVAL):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.output_limit = output_limit
+        self.reap_interval = reap_interval
+        self._sessions: Dict[str, ShellSession] = {}
+        self._lock = threading.Lock()
+        # 已结束的 shell 的进程组，其中仍存活的进程视为遗留进程
+        self._dead_groups: Set[int] = set()
+        self._counters = Counter()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def create(self, shell: Optional[str] = None, cwd: Optional[str] = None) -> ShellSession:
+        """创建会话，达到数量上限时先关闭最久未使用的空闲会话"""
+        with self._lock:
+            evicted = None
+            if len(self._sessions) >= self.max_sessions:
+                idle = [s for s in self._sessions.values() if s.state != 'running']
+                if not idle:
+                    raise SessionLimitError(f'会话数量已达上限 {self.max_sessions}，且所有会话都在执行命令')
+                evicted = min(idle, key=lambda s: s.last_active)
+                self._sessions.pop(evicted.sessionid)
+                self._counters['evicted'] += 1
+        if evicted is not None:
+            logger.info(f'[SESSION_MANAGER] 会话数量达到上限，关闭最久未使用的会话 {evicted.sessionid}')
+            self._close(evicted)
+        session = ShellSession(shell=shell, cwd=cwd, output_limit=self.output_limit)
+        with self._lock:
+            self._sessions[session.sessionid] = session
+            self._counters['created'] += 1
+        self._ensure_reaper()
+        return session
+
+    def get(self, sessionid: str) -> Optional[ShellSession]:
+        with self._lock:
+            return self._sessions.get(sessionid)
+
+    def list(self) -> List[ShellSession]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def close(self, sessionid: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(sessionid, None)
+            if session is not None:
+                self._counters['closed'] += 1
+        if session is None:
+            return False
+        self._close(session)
+        return True
+
+    def close_all(self):
+        self._stop.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            self._close(session)
+        self.kill_orphans()
+
+    def _close(self, session: ShellSession):
+        session.close()
+        with self._lock:
+            self._dead_groups.update(session.process_groups)
+
+    def reap(self) -> int:
+        """关闭空闲超过 TTL 的会话并清理遗留进程，返回关闭的会话数"""
+        now = time.time()
+        with self._lock:
+            expired = [s for s in self._sessions.values()
+                       if self.ttl > 0 and s.state != 'running' and now - s.last_active > self.ttl]
+            for session in expired:
+                self._sessions.pop(session.sessionid)
+            self._counters['reaped'] += len(expired)
+            live = list(self._sessions.values())
+        for session in expired:
+            logger.info(f'[SESSION_MANAGER] 会话 {session.sessionid} 空闲超过 {self.ttl}s，已回收')
+            self._close(session)
+        # 存活会话中已退出的 shell（例如执行了 exit 或被重启）留下的进程组
+        with self._lock:
+            for session in live:
+                current = session.pid if session.alive else None
+                self._dead_groups.update(g for g in session.process_groups if g != current)
+        self.kill_orphans()
+        return len(expired)
+
+    def kill_orphans(self) -> int:
+        """结束已结束的 shell 进程组中仍存活的进程，返回结束的进程数"""
+        with self._lock:
+            groups = set(self._dead_groups)
+        if not groups:
+            return 0
+        killed, alive_groups = 0, set()
+        for pid, _, pgrp in process_table():
+            if pgrp in groups:
+                alive_groups.add(pgrp)
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                    killed += 1
+                except (ProcessLookupError, PermissionError):
+                    pass
+        with self._lock:
+            # 没有存活进程的进程组不再检查，进程组 id 可能被新进程复用
+            self._dead_groups -= groups - alive_groups
+            self._counters['orphans_killed'] += killed
+        if killed:
+            logger.info(f'[SESSION_MANAGER] 结束了 {killed} 个遗留进程')
+        return killed
+
+    def metrics(self) -> Dict[str, int]:
+        """存活会话数、执行中的会话数、缓冲的输出字节数与各类回收计数"""
+        sessions = self.list()
+        buffers = [s.output.stats() for s in sessions]
+        return {
+            'live_sessions': len(sessions),
+            'running_sessions': sum(1 for s in sessions if s.state == 'running'),
+            'bytes_buffered': sum(b['bytes_retained'] for b in buffers),
+            'memory_bytes': sum(b['memory_bytes'] for b in buffers),
+            'spilled_bytes': sum(b['spilled_bytes'] for b in buffers),
+            'created': self._counters['created'],
+            'closed': self._counters['closed'],
+            'evicted': self._counters['evicted'],
+            'reaped': self._counters['reaped'],
+            'orphans_killed': self._counters['orphans_killed'],
+        }
+
+    def _ensure_reaper(self):
+        if self.reap_interval <= 0 or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        with self._lock:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._stop.clear()
+                self._reaper = threading.Thread(target=self._reap_loop, name='session_reaper', daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._stop.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f'[SESSION_MANAGER] 回收会话失败: {e}')
+
+
+_manager: Optional[SessionManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_session_manager() -> SessionManager:
+    """进程内共享的会话管理器"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = SessionManager()
+    return _manager
@@ -0,0 +1,441 @@
+"""
+常驻的 shell 会话：每个会话对应一个长期运行的 shell 进程，命令通过 stdin 依次写入同一个进程，
+因此 cd、环境变量、激活的虚拟环境等状态在命令之间保留，也不必为每条命令重新启动进程。
+
+命令结束的判断采用哨兵协议：每条命令之后追加一条输出 `哨兵 + 退出码` 的语句，
+后台线程持续读取 stdout，读到哨兵即认为命令结束。命令可以在后台执行，调用方随后轮询输出或等待输出匹配。
+"""
+import os
+import re
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from src.log import logger
+from src.tools.output_buffer import MEMORY_LIMIT, OutputBuffer, decode
+
+# 各 shell 的启动参数与命令模板，模板中 {command} 为命令、{sentinel} 为哨兵
+# 命令的 stdin 重定向为空设备，避免读取 stdin 时吞掉之后写入的协议内容
+# bash 与 sh 的命令包装为函数在当前 shell 中执行，中断时可以从函数返回，跳过命令中尚未执行的部分
+SHELLS = {
+    'bash': (['bash', '--noprofile', '--norc'],
+             '__my_agent_run() {{ {command}\n}}; __my_agent_run </dev/null 2>&1\nprintf "\\n{sentinel}%d\\n" "$?"\n'),
+    'sh': (['sh'],
+           '__my_agent_run() {{ {command}\n}}; __my_agent_run </dev/null 2>&1\nprintf "\\n{sentinel}%d\\n" "$?"\n'),
+    'powershell': (['powershell', '-NoLogo', '-NoProfile', '-NonInteractive', '-Command', '-'],
+                   '{command}\nWrite-Output "`n{sentinel}$(if ($?) {{ 0 }} else {{ 1 }})"\n'),
+    'cmd': (['cmd', '/Q', '/K'],
+            '{command} < NUL\r\necho.\r\necho {sentinel}%errorlevel%\r\n'),
+}
+# shell 启动后执行的初始化语句：收到 SIGINT 时从正在执行的命令函数返回，退出码为最后执行的命令的退出码
+SHELL_INIT = {
+    'bash': "trap 'return' INT\n",
+    'sh': "trap 'return' INT\n",
+}
+# 未指定 shell 时使用的默认 shell
+DEFAULT_SHELL = 'cmd' if os.name == 'nt' else 'bash'
+# 超时后等待 shell 输出哨兵的时间（秒），超过则重启会话进程
+KILL_GRACE = 2.0
+# 单次命令结果与单次读取返回的最大字节数
+MAX_RESULT_BYTES = 64 * 1024
+# 每个会话保留的命令记录数
+MAX_COMMANDS = 32
+# 等待输出匹配时，与上次扫描重叠的字节数
+SCAN_OVERLAP = 4096
+# 等待命令时的最长休眠间隔（秒）
+POLL_INTERVAL = 0.5
+
+
+class ShellSession:
+    """
+    一个常驻的 shell 进程，同一时刻只执行一条命令。
+    start 写入命令后立即返回命令序号，wait 等待命令结束或输出匹配指定的正则；run 为二者的组合。
+    命令超时时中断该命令（不再执行其余部分）并结束其启动的子进程，shell 本身保留，无法结束时重启 shell。
+    输出（不含哨兵）在到达时写入有界的 OutputBuffer，可按偏移分页读取。
+    """
+
+    def __init__(self, shell: Optional[str] = None, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                 output_limit: Optional[int] = None):
+        self.shell = shell or DEFAULT_SHELL
+        if self.shell not in SHELLS:
+            raise ValueError(f'不支持的 shell: {self.shell}，可选 {list(SHELLS)}')
+        self.sessionid = str(uuid.uuid4())
+        self.start_cwd = cwd
+        self.env = env
+        self.history: Deque[str] = deque(maxlen=MAX_COMMANDS)
+        # output_limit 为输出缓冲区（内存与溢出文件）保留的总字节数
+        if output_limit is None:
+            self.output = OutputBuffer()
+        else:
+            memory_limit = min(MEMORY_LIMIT, output_limit)
+            self.output = OutputBuffer(memory_limit=memory_limit, spill_limit=output_limit - memory_limit)
+        self.last_command: Optional[str] = None
+        self.created = time.time()
+        self.last_active = self.created
+        self.restarts = 0
+        self._token = uuid.uuid4().hex[:12]
+        self._marker = f'__MY_AGENT_{self._token}_'.encode()
+        self._sentinel = re.compile(rb'\r?\n?' + re.escape(self._marker) + rb'(\d+)__(-?\d+)\r?\n')
+        self._seq = 0
+        self._cond = threading.Condition()
+        # 最近的命令：序号 -> {command, offset, end, exit_code, finished, started}
+        self.commands: 'OrderedDict[int, dict]' = OrderedDict()
+        # 正在执行的命令序号
+        self._running: Optional[int] = None
+        self._eof = False
+        self._proc: Optional[subprocess.Popen] = None
+        # 启动过的 shell 进程组（即 shell 的 pid），用于清理 shell 退出后遗留的后台进程
+        self.process_groups: List[int] = []
+        self._start()
+
+    def _start(self):
+        argv, _ = SHELLS[self.shell]
+        executable = shutil.which(argv[0])
+        if executable is None:
+            raise FileNotFoundError(f'找不到 shell: {argv[0]}')
+        env = {**os.environ, **self.env} if self.env else None
+        proc = subprocess.Popen(
+            [executable] + argv[1:],
+            cwd=self.start_cwd,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=0,
+            # 独立的进程组，关闭会话时可以结束 shell 及其所有子进程
+            start_new_session=os.name != 'nt',
+        )
+        if self.shell in SHELL_INIT:
+            proc.stdin.write(SHELL_INIT[self.shell].encode())
+        with self._cond:
+            self._proc = proc
+            self._eof = False
+            self.process_groups.append(proc.pid)
+        threading.Thread(target=self._read_loop, args=(proc,), name=f'shell_{self.sessionid[:8]}',
+                         daemon=True).start()
+        logger.info(f'[SHELL_SESSION] 会话 {self.sessionid} 启动 {self.shell}，pid={proc.pid}')
+
+    def _read_loop(self, proc: subprocess.Popen):
+        """
+        后台读取 shell 的输出，去掉哨兵后写入输出缓冲区，读到哨兵或进程退出时唤醒等待中的命令。
+        stdout 只在这里关闭：其他线程关闭后文件描述符可能被新的会话复用，阻塞中的 os.read 会读走新会话的输出。
+        """
+        try:
+            self._read_output(proc)
+        finally:
+            proc.stdout.close()
+
+    def _read_output(self, proc: subprocess.Popen):
+        fd = proc.stdout.fileno()
+        held = b''
+        while True:
+            try:
+                chunk = os.read(fd, 65536)
+            except OSError:
+                chunk = b''
+            if proc is not self._proc:
+                return
+            data, pos = held + chunk, 0
+            for match in self._sentinel.finditer(data):
+                end = self.output.write(data[pos:match.start()])
+                pos = match.end()
+                self._finish_command(int(match.group(1)), int(match.group(2)), end)
+            held = self._hold_back(data[pos:]) if chunk else b''
+            self.output.write(data[pos:len(data) - len(held)])
+            with self._cond:
+                self._eof = not chunk
+                self._cond.notify_all()
+            if not chunk:
+                # shell 退出（例如执行了 exit），正在执行的命令以 shell 的退出码结束
+                if self._running is not None:
+                    self._finish_command(self._running, proc.wait(), self.output.end)
+                return
+
+    def _hold_back(self, data: bytes) -> bytes:
+        """末尾可能是被分块截断的哨兵时暂不写入，等待下一块数据"""
+        cut = max(data.rfind(b'\n'), 0)
+        rest = data[cut:]
+        candidate = rest.lstrip(b'\r\n')
+        if len(rest) <= len(self._marker) + 32 and self._marker.startswith(candidate[:len(self._marker)]):
+            return rest
+        return b''
+
+    def _finish_command(self, seq: int, exit_code: Optional[int], end: int):
+        with self._cond:
+            record = self.commands.get(seq)
+            if record is not None and not record['finished']:
+                record.update(end=end, exit_code=exit_code, finished=True)
+            if self._running == seq:
+                self._running = None
+                self.last_active = time.time()
+            self._cond.notify_all()
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._proc.pid if self._proc else None
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    @property
+    def state(self) -> str:
+        """running：正在执行命令；idle：空闲；exited：shell 进程已退出"""
+        if not self.alive:
+            return 'exited'
+        return 'running' if self._running is not None else 'idle'
+
+    @property
+    def cwd(self) -> Optional[str]:
+        """shell 进程当前的工作目录，仅在支持 /proc 的系统上可用"""
+        try:
+            return os.readlink(f'/proc/{self.pid}/cwd')
+        except (OSError, TypeError):
+            return self.start_cwd
+
+    def start(self, command: str, cwd: Optional[str] = None, timeout: float = 0) -> Optional[int]:
+        """
+        写入命令后立即返回命令序号，输出在后台持续写入缓冲区。
+        会话在 timeout 秒内仍在执行其他命令时返回 None。cwd 不为空时先切换到该目录，切换后的目录在之后的命令中保留。
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._running is None, timeout):
+                return None
+            self._seq += 1
+            seq = self._seq
+            self._running = seq
+        try:
+            if not self.alive:
+                # shell 已退出，重新启动，之前的状态丢失
+                logger.warning(f'[SHELL_SESSION] 会话 {self.sessionid} 的 shell 已退出，重新启动')
+                self.restarts += 1
+                self._start()
+            if cwd:
+                command = f'cd "{cwd}" && {command}' if self.shell != 'powershell' else f'Set-Location "{cwd}"; {command}'
+            with self._cond:
+                self.commands[seq] = {'id': seq, 'command': command, 'offset': self.output.end, 'end': None,
+                                      'exit_code': None, 'finished': False, 'started': time.time()}
+                while len(self.commands) > MAX_COMMANDS:
+                    self.commands.popitem(last=False)
+            self.last_command = command
+            self.history.append(command)
+            self.last_active = time.time()
+            sentinel = f'{self._marker.decode()}{seq}__'
+            self._proc.stdin.write(SHELLS[self.shell][1].format(command=command, sentinel=sentinel).encode())
+            self._proc.stdin.flush()
+        except Exception:
+            with self._cond:
+                self._running = None
+                self.commands.pop(seq, None)
+            raise
+        return seq
+
+    def wait(self, seq: int, timeout: Optional[float], pattern: Optional[str] = None,
+             kill_on_timeout: bool = True) -> dict:
+        """
+        等待命令结束，或 pattern 不为空时等待命令的输出匹配该正则，timeout 为 None 时不限时。
+        超时且 kill_on_timeout 为 True 时结束命令。返回命令记录，并带有 matched 与 timeout 字段。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        regex = re.compile(pattern, re.MULTILINE) if pattern else None
+        with self._cond:
+            record = self.commands.get(seq)
+            if record is None:
+                raise KeyError(f'命令 {seq} 不存在或记录已被清理')
+            scanned = record['offset']
+        matched = False
+        while True:
+            proc = self._proc
+            if not record['finished'] and proc is not None and proc.poll() is not None:
+                # shell 已退出，但其遗留的后台进程仍持有输出管道，读取线程收不到 EOF
+                self._finish_command(seq, proc.returncode, self.output.end)
+            with self._cond:
+                finished = record['finished']
+            if regex is not None:
+                scanned, matched = self._scan(regex, scanned, record['end'] if finished else self.output.end)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if finished or matched or (remaining is not None and remaining <= 0):
+                break
+            with self._cond:
+                if not record['finished']:
+                    # 输出到达或命令结束时被唤醒，定期醒来以免错过两次检查之间的通知
+                    self._cond.wait(POLL_INTERVAL if remaining is None else min(remaining, POLL_INTERVAL))
+        timed_out = not finished and not matched
+        if timed_out and kill_on_timeout:
+            logger.warning(f'[SHELL_SESSION] 会话 {self.sessionid} 命令超时({timeout}s): {record["command"]}')
+            self.interrupt(seq)
+        return {**record, 'matched': matched, 'timeout': timed_out}
+
+    def _scan(self, regex: re.Pattern, scanned: int, end: int) -> Tuple[int, bool]:
+        """从 scanned 开始查找新输出是否匹配，保留一段重叠以匹配跨越两次读取的内容"""
+        if end <= scanned:
+            return scanned, False
+        start = max(scanned - SCAN_OVERLAP, self.output.start)
+        data, start = self.output.read(start, end - start)
+        text, size = decode(data)
+        return start + size, regex.search(text) is not None
+
+    def interrupt(self, seq: int):
+        """
+        中断正在执行的命令：先向 shell 发送 SIGINT，使其在当前子进程结束后跳过命令的其余部分（例如 `sleep 5; echo done`
+        中的 echo），再结束命令启动的子进程；命令仍未结束时重启 shell。
+        """
+        with self._cond:
+            if self._running != seq:
+                return
+        if self.shell in SHELL_INIT and os.name != 'nt':
+            try:
+                os.kill(self.pid, signal.SIGINT)
+            except (ProcessLookupError, PermissionError, TypeError):
+                pass
+        self._kill_children()
+        with self._cond:
+            if self._cond.wait_for(lambda: self._running != seq, KILL_GRACE):
+                return
+        # 无法结束命令，重启 shell 以保证会话可继续使用
+        self.restart()
+
+    def run(self, command: str, timeout: float = 10, cwd: Optional[str] = None,
+            max_output: int = MAX_RESULT_BYTES) -> dict:
+        """
+        在会话中执行命令并等待结束，返回 {"output": 输出文本, "exit_code": 退出码, "timeout": 是否超时,
+        "offset": 输出在会话缓冲区中的起始偏移, "end": 结束偏移}。
+        输出超过 max_output 字节时只返回最后一部分，完整输出可按偏移从缓冲区读取。
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            seq = self.start(command, cwd=cwd, timeout=timeout)
+        except OSError as e:
+            return {'output': f'[Error] 写入命令失败: {e}', 'exit_code': None, 'timeout': False}
+        if seq is None:
+            return {'output': f'[Error] 会话 {self.sessionid} 正在执行其他命令', 'exit_code': None, 'timeout': True}
+        # 等待其他命令结束的时间同样计入超时
+        record = self.wait(seq, max(deadline - time.monotonic(), 0))
+        end = record['end'] if record['end'] is not None else self.output.end
+        text = self.tail(record['offset'], end, max_output)
+        if record['timeout']:
+            text += '\n[Timeout]'
+        return {'output': text, 'exit_code': record['exit_code'], 'timeout': record['timeout'],
+                'offset': record['offset'], 'end': end}
+
+    def tail(self, start: int, end: int, max_output: int = MAX_RESULT_BYTES) -> str:
+        """[start, end) 范围内的输出，超过 max_output 字节时只返回最后一部分并注明完整范围"""
+        output = self.read(max(start, end - max_output), end - max(start, end - max_output))
+        text = output['output']
+        if output['offset'] > start:
+            text = f'[输出共 {end - start} 字节，只返回最后 {end - output["offset"]} 字节，' \
+                   f'可从 offset={start} 开始分页读取]\n' + text
+        return text
+
+    def read(self, offset: Optional[int] = None, max_bytes: int = MAX_RESULT_BYTES, lines: int = 0) -> dict:
+        """
+        从输出缓冲区读取。offset 为空时读取最后 lines 行（lines <= 0 时从最早保留的输出开始），
+        否则从 offset 开始读取最多 max_bytes 字节。
+        返回 {"output": 文本, "offset": 实际起始偏移, "next_offset": 下次读取的偏移, "end": 当前输出末尾,
+        "truncated": offset 之前的部分输出是否已被丢弃}
+        """
+        if offset is None:
+            data, start = self.output.tail(lines, max_bytes)
+        else:
+            data, start = self.output.read(offset, max_bytes)
+        text, size = decode(data)
+        return {'output': text, 'offset': start, 'next_offset': start + size, 'end': self.output.end,
+                'truncated': offset is not None and start > offset}
+
+    def _kill_children(self):
+        """结束 shell 的所有子孙进程，shell 本身保留；不支持 /proc 时由调用方重启 shell"""
+        for pid in descendants(self.pid):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def restart(self):
+        """结束当前 shell 及其子进程并重新启动，cd 与环境变量等状态丢失"""
+        self._terminate()
+        self.restarts += 1
+        self._start()
+
+    def close(self):
+        """结束 shell 及其所有子进程，释放输出缓冲区"""
+        self._terminate()
+        self.output.close()
+        logger.debug(f'[SHELL_SESSION] 会话 {self.sessionid} 已关闭')
+
+    def _terminate(self):
+        with self._cond:
+            proc, self._proc = self._proc, None
+            running = self._running
+        if running is not None:
+            self._finish_command(running, None, self.output.end)
+        if proc is None:
+            return
+        if proc.poll() is None:
+            try:
+                if os.name != 'nt':
+                    os.killpg(proc.pid, signal.SIGKILL)
+                else:
+                    proc.kill()
+            except (ProcessLookupError, PermissionError):
+                pass
+            proc.wait(timeout=KILL_GRACE)
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+
+    def info(self) -> dict:
+        return {
+            'sessionid': self.sessionid,
+            'shell': self.shell,
+            'pid': self.pid,
+            'state': self.state,
+            'alive': self.alive,
+            'exit_code': self._proc.poll() if self._proc else None,
+            'cwd': self.cwd,
+            'last_command': self.last_command,
+            'running_command': self._running,
+            'commands': self._seq,
+            'restarts': self.restarts,
+            'idle_seconds': round(time.time() - self.last_active, 1),
+            'output': self.output.stats(),
+        }
+
+
+def process_table() -> List[Tuple[int, int, int]]:
+    """通过 /proc 列出所有进程的 (pid, ppid, pgrp)；不支持 /proc 时返回空列表"""
+    if not os.path.isdir('/proc'):
+        return []
+    table = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 进程名可能包含空格与括号，从最后一个 ')' 之后解析：state ppid pgrp ...
+        fields = stat[stat.rindex(b')') + 2:].split()
+        table.append((int(entry), int(fields[1]), int(fields[2])))
+    return table
+
+
+def descendants(pid: Optional[int]) -> List[int]:
+    """通过 /proc 查找进程的所有子孙进程，子进程在前；不支持 /proc 时返回空列表"""
+    if pid is None:
+        return []
+    children: Dict[int, List[int]] = {}
+    for child, ppid, _ in process_table():
+        children.setdefault(ppid, []).append(child)
+    result, stack = [], list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        result.append(child)
+        stack.extend(children.get(child, []))
+    return result
@@ -0,0 +1,293 @@
+"""耗时与 token 统计。
+
+在 tracing() 范围内，图节点、Agent 的 LLM 调用、底层模型调用与工具调用都会记录为 span，
+包括耗时、首 token 延迟、prompt/completion token、缓存命中与异常。未开启时各埋点几乎没有开销。
+
+    with tracing('run') as tracer:
+        graph.invoke(state)
+    tracer.export_chrome('trace.json')   # chrome://tracing 或 Perfetto 中查看
+    tracer.export_jsonl('trace.jsonl')
+"""
+import contextlib
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+NODE = 'node'
+AGENT = 'agent'
+LLM = 'llm'
+TOOL = 'tool'
+
+_current_tracer: ContextVar[Optional['Tracer']] = ContextVar('my_agent_tracer', default=None)
+_current_span: ContextVar[Optional['Span']] = ContextVar('my_agent_span', default=None)
+_span_ids = itertools.count(1)
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str
+    start: float
+    id: int = field(default_factory=lambda: next(_span_ids))
+    parent_id: Optional[int] = None
+    end: Optional[float] = None
+    thread_id: int = field(default_factory=threading.get_ident)
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def first_token(self):
+        """记录首个输出分块的延迟"""
+        if 'ttft_ms' not in self.attrs:
+            self.attrs['ttft_ms'] = round((time.perf_counter() - self.start) * 1000, 3)
+
+    def usage(self, message: Any, estimate: Optional[Callable[[Any], int]] = None):
+        """
+        记录消息的 usage_metadata 中的 token 数。没有 usage 时（例如服务端未开启 stream_usage），
+        用 estimate 估算每个分块的 token 并累加，标记为 estimated。
+        """
+        usage = getattr(message, 'usage_metadata', None)
+        if usage:
+            self.attrs.update(prompt_tokens=usage.get('input_tokens') or 0,
+                              completion_tokens=usage.get('output_tokens') or 0, estimated=False)
+        elif estimate is not None and self.attrs.get('estimated', True):
+            self.attrs['completion_tokens'] = self.attrs.get('completion_tokens', 0) + estimate(message)
+            self.attrs['estimated'] = True
+
+    def finish(self, message: Any = None, estimate: Optional[Callable[[Any], int]] = None):
+        if message is not None:
+            self.usage(message, estimate)
+        self.end = time.perf_counter()
+
+    def fail(self, error: BaseException):
+        self.attrs['error'] = f'{type(error).__name__}: {error}'
+
+
+class Tracer:
+    """收集一次运行中的所有 span，线程安全"""
+
+    def __init__(self, name: str = 'run'):
+        self.name = name
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def start(self, name: str, kind: str, parent: Optional[Span] = None, **attrs) -> Span:
+        span = Span(name=name, kind=kind, start=time.perf_counter(), parent_id=parent.id if parent else None,
+                    attrs=attrs)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def summary(self) -> Dict[str, Any]:
+        """按类型与名称汇总耗时、调用次数、token、缓存命中与异常"""
+        with self._lock:
+            spans = list(self.spans)
+        summary: Dict[str, Any] = {
+            'wall_ms': round((time.perf_counter() - self.origin) * 1000, 3),
+            'errors': sum(1 for s in spans if 'error' in s.attrs),
+        }
+        for kind in (NODE, AGENT, LLM, TOOL):
+            groups: Dict[str, Dict[str, Any]] = {}
+            for span in spans:
+                if span.kind != kind:
+                    continue
+                group = groups.setdefault(span.name, {'calls': 0, 'total_ms': 0.0})
+                group['calls'] += 1
+                group['total_ms'] = round(group['total_ms'] + span.duration * 1000, 3)
+                for key in ('prompt_tokens', 'completion_tokens'):
+                    if key in span.attrs:
+                        group[key] = group.get(key, 0) + span.attrs[key]
+                if span.attrs.get('cache_hit'):
+                    group['cache_hits'] = group.get('cache_hits', 0) + 1
+                if 'error' in span.attrs:
+                    group['errors'] = group.get('errors', 0) + 1
+            summary[kind] = groups
+        llm_spans = [s for s in spans if s.kind == LLM]
+        summary['llm_calls'] = len(llm_spans)
+        summary['prompt_tokens'] = sum(s.attrs.get('prompt_tokens', 0) for s in llm_spans)
+        summary['completion_tokens'] = sum(s.attrs.get('completion_tokens', 0) for s in llm_spans)
+        summary['cache_hits'] = sum(1 for s in llm_spans if s.attrs.get('cache_hit'))
+        # 与之前请求共享的前缀 token 占比，用于确认服务端前缀缓存的复用情况
+        prefixed = [s for s in llm_spans if 'prefix_tokens' in s.attrs]
+        prefix_prompt = sum(s.attrs.get('prompt_tokens', 0) for s in prefixed)
+        summary['prefix_tokens'] = sum(s.attrs['prefix_tokens'] for s in prefixed)
+        summary['prefix_ratio'] = round(summary['prefix_tokens'] / prefix_prompt, 4) if prefix_prompt else 0.0
+        return summary
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Chrome trace-event 格式，时间单位为微秒"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = [{'name': s.name, 'cat': s.kind, 'ph': 'X', 'pid': pid, 'tid': s.thread_id,
+                   'ts': round((s.start - self.origin) * 1e6, 3), 'dur': round(s.duration * 1e6, 3),
+                   'args': {'id': s.id, 'parent_id': s.parent_id, **s.attrs}} for s in spans]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'name': self.name}}
+
+    def export_chrome(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False, default=str)
+
+    def export_jsonl(self, path: str):
+        with self._lock:
+            spans = list(self.spans)
+        with open(path, 'w', encoding='utf-8') as f:
+            for span in spans:
+                record = asdict(span)
+                record['start_ms'] = round((span.start - self.origin) * 1000, 3)
+                record['duration_ms'] = round(span.duration * 1000, 3)
+                del record['start'], record['end']
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+
+@contextlib.contextmanager
+def tracing(name: str = 'run', tracer: Optional[Tracer] = None) -> Iterator[Tracer]:
+    """在当前上下文中开启追踪，线程池（ContextThreadPoolExecutor）与异步任务中的调用同样会被记录"""
+    tracer = tracer or Tracer(name)
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+
+def current_tracer() -> Optional[Tracer]:
+    return _current_tracer.get()
+
+
+@contextlib.contextmanager
+def span(name: str, kind: str, **attrs) -> Iterator[Optional[Span]]:
+    """记录一个 span，内部开启的 span 以它为父节点；未开启追踪时返回 None"""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield None
+        return
+    current = tracer.start(name, kind, parent=_current_span.get(), **attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def start_span(name: str, kind: str, **attrs) -> Optional[Span]:
+    """开始一个不改变当前父节点的 span，用于跨越生成器的流式调用，需配合 trace_stream 结束"""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return None
+    return tracer.start(name, kind, parent=_current_span.get(), **attrs)
+
+
+def trace_stream(current: Optional[Span], stream: Iterator,
+                 estimate: Optional[Callable[[Any], int]] = None) -> Iterator:
+    """
+    透传流式输出，记录首个分块延迟与 token 数，迭代结束时结束 span。
+    生成下一个分块期间 span 为当前 span，其中开启的 span 以它为父节点；yield 前恢复，不影响调用方的上下文。
+    """
+    if current is None:
+        yield from stream
+        return
+    stream = iter(stream)
+    try:
+        while True:
+            token = _current_span.set(current)
+            try:
+                chunk = next(stream)
+            except StopIteration:
+                break
+            finally:
+                _current_span.reset(token)
+            current.first_token()
+            current.usage(chunk, estimate)
+            yield chunk
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        current.end = time.perf_counter()
+
+
+async def atrace_stream(current: Optional[Span], stream: AsyncIterator,
+                        estimate: Optional[Callable[[Any], int]] = None) -> AsyncIterator:
+    """trace_stream 的异步版本"""
+    if current is None:
+        async for chunk in stream:
+            yield chunk
+        return
+    stream = stream.__aiter__()
+    try:
+        while True:
+            token = _current_span.set(current)
+            try:
+                chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                _current_span.reset(token)
+            current.first_token()
+            current.usage(chunk, estimate)
+            yield chunk
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        current.end = time.perf_counter()
+
+
+def trace_iter(name: str, kind: str, stream: Iterator, **attrs) -> Iterator:
+    """为流式输出记录 span，未开启追踪时原样返回"""
+    current = start_span(name, kind, **attrs)
+    return stream if current is None else trace_stream(current, stream)
+
+
+def atrace_iter(name: str, kind: str, stream: AsyncIterator, **attrs) -> AsyncIterator:
+    current = start_span(name, kind, **attrs)
+    return stream if current is None else atrace_stream(current, stream)
+
+
+def traced(name: str, kind: str = NODE) -> Callable:
+    """为同步或异步函数记录 span；返回 AgentState 时附带当前的汇总信息"""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, kind):
+                    result = await func(*args, **kwargs)
+                return _attach_summary(result)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                result = func(*args, **kwargs)
+            return _attach_summary(result)
+
+        return wrapper
+
+    return decorator
+
+
+def _attach_summary(result):
+    tracer = _current_tracer.get()
+    if tracer is not None and hasattr(result, 'trace_summary'):
+        result.trace_summary = tracer.summary()
+    return result
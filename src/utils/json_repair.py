@@ -0,0 +1,136 @@
+"""
+从模型输出中提取 JSON，并在本地修复常见的格式问题，避免因解析失败重新调用 LLM。
+
+可修复的问题：
+- 缺少 ```json 代码块，或 JSON 前后夹杂说明文字、<think> 思考内容
+- // 与 /* */ 注释、末尾多余的逗号
+- 单引号字符串、Python 风格的 True / False / None
+- 输出被截断导致的未闭合字符串与括号
+"""
+import itertools
+import json
+import re
+from typing import Any, Callable, Optional
+
+_FENCE = re.compile(r'```(?:json)?\s*(.*?)(?:```|$)', re.DOTALL)
+_THINK = re.compile(r'<think>.*?(?:</think>|$)', re.DOTALL)
+_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+_CLOSING = {'{': '}', '[': ']'}
+_STARTS = re.compile(r'[{\[]')
+# 最多尝试的 JSON 起始位置数，避免在大段代码等文本上反复修复
+MAX_STARTS = 32
+
+
+def parse_json(text: str, accept: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+    """
+    解析模型输出中的 JSON 对象或数组，优先使用 ```json 代码块中的内容，无法解析时返回 None。
+    文本中可能夹杂其他 JSON（例如说明文字中引用的工具参数），因此依次尝试每个 { 或 [ 开始的位置，
+    返回第一个满足 accept 的值；未指定 accept 时返回第一个能解析的值。
+    """
+    if not text:
+        return None
+    text = _THINK.sub('', text)
+    candidates = [m.group(1) for m in _FENCE.finditer(text) if m.group(1).strip()]
+    candidates.extend(text[m.start():] for m in itertools.islice(_STARTS.finditer(text), MAX_STARTS))
+    for candidate in candidates:
+        value = _loads(candidate.strip())
+        if value is not None and (accept is None or accept(value)):
+            return value
+    return None
+
+
+def _loads(text: str) -> Optional[Any]:
+    try:
+        # 只解析开头的完整值，忽略之后的说明文字
+        return json.JSONDecoder().raw_decode(text)[0]
+    except ValueError:
+        pass
+    try:
+        return json.loads(repair_json(text))
+    except ValueError:
+        return None
+
+
+def repair_json(text: str) -> str:
+    """
+    单次扫描修复 JSON 文本：去掉注释与多余逗号，统一引号与字面量，补全未闭合的字符串与括号。
+    只保留从第一个 { 或 [ 开始的第一个完整值。
+    """
+    start = _json_start(text)
+    if start < 0:
+        return text
+    out = []
+    stack = []
+    quote = None
+    i, n = start, len(text)
+    while i < n:
+        ch = text[i]
+        if quote:
+            if ch == '\\' and i + 1 < n:
+                # JSON 中没有 \' 转义
+                out.append("'" if text[i + 1] == "'" else text[i:i + 2])
+                i += 2
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                # 单引号字符串中的双引号需要转义
+                out.append('\\"')
+            elif ch == '\n':
+                out.append('\\n')
+            else:
+                out.append(ch)
+            i += 1
+            continue
+        if ch in '"\'':
+            quote = ch
+            out.append('"')
+        elif ch == '/' and text.startswith('//', i):
+            end = text.find('\n', i)
+            i = n if end < 0 else end
+            continue
+        elif ch == '/' and text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        elif ch in '{[':
+            stack.append(_CLOSING[ch])
+            out.append(ch)
+        elif ch in '}]':
+            _strip_trailing_comma(out)
+            if stack and stack[-1] == ch:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                break
+        elif ch.isalpha():
+            end = i
+            while end < n and (text[end].isalnum() or text[end] == '_'):
+                end += 1
+            word = text[i:end]
+            out.append(_LITERALS.get(word, word))
+            i = end
+            continue
+        else:
+            out.append(ch)
+        i += 1
+    if quote:
+        out.append('"')
+    _strip_trailing_comma(out)
+    if out and out[-1].rstrip().endswith(':'):
+        out.append('null')
+    out.extend(reversed(stack))
+    return ''.join(out)
+
+
+def _json_start(text: str) -> int:
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    return min(starts) if starts else -1
+
+
+def _strip_trailing_comma(out: list):
+    while out and not out[-1].strip():
+        out.pop()
+    if out and out[-1] == ',':
+        out.pop()
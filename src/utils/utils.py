@@ -10,6 +10,9 @@ def merge_generate_cfgs(base_generate_cfg: Optional[dict], new_generate_cfg: Opt
                 stop = generate_cfg.get('stop', [])
                 stop = stop + [s for s in v if s not in stop]
                 generate_cfg['stop'] = stop
+            elif k == 'extra_body' and isinstance(v, dict):
+                # 请求体的附加参数逐项合并，例如 chat_template_kwargs 与 guided_json
+                generate_cfg['extra_body'] = {**(generate_cfg.get('extra_body') or {}), **v}
             else:
                 generate_cfg[k] = v
     return generate_cfg
\ No newline at end of file
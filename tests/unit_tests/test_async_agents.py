@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from src.agent import PlannerAgent
+from src.agent.agent_state import AgentState, ModelMode
+from src.agent.execute_agent import GeneralExecuteAgent
+from src.assistant.qwen_assistant import QwenAssistant
+from src.tools import list_dir
+
+PLAN = """<think>拆分</think>
+```json
+{"finish": true, "taskItems": [{"index": 1, "task": "a"}, {"index": 2, "task": "b", "depends": [1]}]}
+```"""
+
+
+def test_arun_calls_tools_and_continues(tmp_path) -> None:
+    (tmp_path / "marker.txt").write_text("x")
+    call = json.dumps({"name": "list_dir", "arguments": {"path": str(tmp_path)}})
+    llm = FakeListChatModel(responses=[f'<tool_call>\n{call}\n</tool_call>', 'done'])
+    assistant = QwenAssistant(function_list=[list_dir], llm=llm)
+
+    async def collect():
+        return [batch async for batch in assistant.arun([HumanMessage("ls")], usetool=True)]
+
+    batches = asyncio.run(collect())
+    tool_messages = [m for batch in batches for m in batch if isinstance(m, ToolMessage)]
+    assert len(tool_messages) == 1
+    assert 'marker.txt' in tool_messages[0].artifact
+    assert batches[-1][0].content == 'done'
+
+
+def test_planner_aplan() -> None:
+    planner = PlannerAgent(mode=ModelMode.LOCAL_QWEN, llm=QwenAssistant(llm=FakeListChatModel(responses=[PLAN])))
+    state = asyncio.run(planner.aplan(AgentState(user_task="t")))
+    assert state.task_finish is True
+    assert [t.index for t in state.task_list] == [1, 2]
+    assert state.task_list[1].depends == [1]
+
+
+def test_execute_agent_arun() -> None:
+    result = '```json\n{"task_index": "1", "status": "success", "result": "ok"}\n```'
+    agent = GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN, max_workers=2,
+                                llm=QwenAssistant(llm=FakeListChatModel(responses=[result])))
+    state = AgentState(user_task="t")
+    state.task_list = PlannerAgent(mode=ModelMode.LOCAL_QWEN, llm=object())._parse_plan(
+        type("R", (), {"content": PLAN})())["task_list"]
+    state = asyncio.run(agent.arun(state))
+    assert state.executed_index == [1, 2]
+    assert [t.result for t in state.task_list] == ["ok", "ok"]
@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.constants import END, START
+from langgraph.graph import StateGraph
+
+from src.agent.agent_state import AgentState, TaskItem
+from src.graph.batch import load_tasks, main, run_batch
+
+
+def _graph(active, peak):
+    async def work(state: AgentState):
+        active.append(1)
+        peak[0] = max(peak[0], len(active))
+        await asyncio.sleep(0.02)
+        active.pop()
+        if state.user_task == 'bad':
+            raise ValueError('boom')
+        state.task_list = [TaskItem(index=1, task=state.user_task, result='ok')]
+        state.task_finish = True
+        return state
+
+    return (StateGraph(AgentState).add_node('work', RunnableLambda(lambda s: s, afunc=work, name='work'))
+            .add_edge(START, 'work').add_edge('work', END).compile())
+
+
+def test_batch_runs_concurrently_and_streams_results(tmp_path) -> None:
+    tasks_path, out_path = tmp_path / 'tasks.jsonl', tmp_path / 'out.jsonl'
+    lines = [json.dumps({'id': f'a{i}', 'task': f'task {i}'}) for i in range(6)] + [json.dumps('bad')]
+    tasks_path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    tasks = load_tasks(str(tasks_path))
+    assert tasks[-1] == {'task': 'bad', 'id': '7'}
+
+    active, peak = [], [0]
+    counts = run_batch(tasks, str(out_path), max_concurrency=2, graph=_graph(active, peak))
+    assert counts == {'ok': 6, 'error': 1}
+    assert peak[0] == 2
+    records = [json.loads(line) for line in out_path.read_text(encoding='utf-8').splitlines()]
+    assert len(records) == 7
+    assert len({r['thread_id'] for r in records}) == 7
+    failed = next(r for r in records if r['status'] == 'error')
+    assert failed['id'] == '7' and 'boom' in failed['error']
+    assert next(r for r in records if r['id'] == 'a0')['task_list'][0]['result'] == 'ok'
+
+    # 再次执行时只重跑失败的任务
+    counts = run_batch(tasks, str(out_path), max_concurrency=2, graph=_graph(active, peak))
+    assert counts == {'ok': 0, 'error': 1}
+
+
+def test_batch_cli_parses_arguments(tmp_path, monkeypatch) -> None:
+    calls = {}
+    monkeypatch.setattr('src.graph.batch.run_batch', lambda tasks, output, **kwargs: calls.update(
+        tasks=tasks, output=output, **kwargs) or {'ok': len(tasks), 'error': 0})
+    tasks_path = tmp_path / 'tasks.jsonl'
+    tasks_path.write_text('"a"\n"b"\n', encoding='utf-8')
+    main([str(tasks_path), '-o', str(tmp_path / 'r.jsonl'), '-c', '3'])
+    assert calls['max_concurrency'] == 3
+    assert [t['task'] for t in calls['tasks']] == ['a', 'b']
+    assert calls['skip_finished'] is True
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import time
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+from qwen_agent.tools.base import BaseTool
+
+from src.assistant.cassette import Cassette, CassetteMissError
+from src.assistant.qwen_assistant import QwenAssistant
+
+
+class Counter(BaseTool):
+    name = 'counter'
+    description = '返回调用次数'
+    parameters = []
+    calls = 0
+
+    def call(self, params, **kwargs):
+        Counter.calls += 1
+        return f'count={Counter.calls}'
+
+
+def _run(assistant: QwenAssistant, **kwargs) -> list:
+    return [m.content for batch in assistant.run([HumanMessage('go')], usetool=True, **kwargs) for m in batch]
+
+
+def test_record_then_replay_without_model_or_tools(tmp_path) -> None:
+    path = str(tmp_path / 'run.cassette.jsonl.gz')
+    call = json.dumps({'name': 'counter', 'arguments': {}})
+    responses = [f'<tool_call>\n{call}\n</tool_call>', '完成']
+    Counter.calls = 0
+    recorder = QwenAssistant(function_list=[Counter()], llm=FakeListChatModel(responses=responses * 2),
+                             cassette={'path': path, 'mode': 'record'})
+    recorded = _run(recorder, stream=True)
+    recorded_nonstream = _run(recorder)
+    assert recorder.cassette.stats()['recorded'] == 6
+    assert Counter.calls == 2
+
+    # 回放时模型没有可用的响应，工具也不会被调用
+    replayer = QwenAssistant(function_list=[Counter()], llm=FakeListChatModel(responses=[]),
+                             cassette=Cassette(path, mode='replay'))
+    assert _run(replayer, stream=True) == recorded
+    assert _run(replayer) == recorded_nonstream
+    assert Counter.calls == 2
+    assert replayer.cassette.stats()['hits'] == 6
+
+    with pytest.raises(CassetteMissError):
+        list(replayer.run([HumanMessage('other')]))
+
+
+def test_replay_at_recorded_pace(tmp_path) -> None:
+    path = str(tmp_path / 'pace.jsonl')
+    model = FakeListChatModel(responses=['abcdefgh'], sleep=0.02)
+    list(QwenAssistant(llm=model, cassette={'path': path, 'mode': 'record'}).run([HumanMessage('q')], stream=True))
+    offsets = [offset for offset, _ in json.loads(open(path, encoding='utf-8').readline())['c']]
+    assert len(offsets) == 8 and offsets == sorted(offsets) and offsets[-1] >= 0.14
+
+    fast = QwenAssistant(llm=None, cassette=Cassette(path, pace=0))
+    started = time.perf_counter()
+    list(fast.run([HumanMessage('q')], stream=True))
+    assert time.perf_counter() - started < 0.1
+
+    paced = QwenAssistant(llm=None, cassette=Cassette(path, pace=1))
+
+    async def collect():
+        return [m.content async for batch in paced.arun([HumanMessage('q')], stream=True) for m in batch]
+
+    started = time.perf_counter()
+    assert ''.join(asyncio.run(collect())) == 'abcdefgh'
+    assert time.perf_counter() - started >= offsets[-1]
+
+
+def test_auto_mode_records_misses(tmp_path) -> None:
+    path = str(tmp_path / 'auto.jsonl')
+    assistant = QwenAssistant(llm=FakeListChatModel(responses=['a', 'b']), cassette={'path': path, 'mode': 'auto'})
+    assert _run(assistant) == ['a']
+    assistant = QwenAssistant(llm=FakeListChatModel(responses=['c']), cassette=Cassette(path, mode='auto'))
+    assert _run(assistant) == ['a']
+    assert assistant.cassette.stats() == {'hits': 1, 'misses': 0, 'recorded': 0, 'entries': 1}
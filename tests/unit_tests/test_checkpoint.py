@@ -0,0 +1,90 @@
+import json
+
+from langgraph.constants import END, START
+from langgraph.graph import StateGraph
+
+from src.agent.agent_state import AgentState, TaskItem
+from src.graph.checkpoint import SqliteCheckpointSaver, default_serde
+
+
+def _graph(saver, calls, fail):
+    def plan(state: AgentState):
+        calls.append('plan')
+        state.task_list = [TaskItem(index=i, task='x' * 300) for i in range(5)]
+        return state
+
+    def execute(state: AgentState):
+        calls.append('execute')
+        if fail:
+            fail.pop()
+            raise RuntimeError('crash')
+        state.executed_index = [t.index for t in state.task_list]
+        return state
+
+    return (StateGraph(AgentState).add_node('plan', plan).add_node('execute', execute)
+            .add_edge(START, 'plan').add_edge('plan', 'execute').add_edge('execute', END)
+            .compile(checkpointer=saver))
+
+
+def test_resume_from_last_completed_node(tmp_path) -> None:
+    path = str(tmp_path / 'cp.sqlite')
+    config = {'configurable': {'thread_id': 't1'}}
+    calls = []
+    saver = SqliteCheckpointSaver(path, prune_interval=0)
+    try:
+        _graph(saver, calls, fail=[True]).invoke(AgentState(user_task='task'), config)
+    except RuntimeError:
+        pass
+    saver.close()
+
+    # 重新打开数据库，模拟进程重启
+    saver = SqliteCheckpointSaver(path, prune_interval=0)
+    graph = _graph(saver, calls, fail=[])
+    assert graph.get_state(config).next == ('execute',)
+    result = graph.invoke(None, config)
+    assert calls == ['plan', 'execute', 'execute']
+    assert result['executed_index'] == [0, 1, 2, 3, 4]
+    assert result['task_list'][0].task == 'x' * 300
+    assert len(list(saver.list(config))) == 4
+
+
+def test_unchanged_channels_are_stored_once_and_pruned(tmp_path) -> None:
+    saver = SqliteCheckpointSaver(str(tmp_path / 'cp.sqlite'), prune_interval=0, keep_last=2)
+    graph = _graph(saver, [], fail=[])
+    graph.invoke(AgentState(user_task='task'), {'configurable': {'thread_id': 't1'}})
+    stats = saver.stats()
+    # user_task 等字段在每一步都有新版本，但相同的值只存一份
+    assert stats['blob_data'] < stats['blobs']
+
+    assert saver.prune() == 2
+    assert saver.stats()['checkpoints'] == 2
+    state = graph.get_state({'configurable': {'thread_id': 't1'}})
+    assert state.values['user_task'] == 'task'
+    assert state.values['executed_index'] == [0, 1, 2, 3, 4]
+
+    saver.delete_thread('t1')
+    assert saver.stats() == {'checkpoints': 0, 'blobs': 0, 'blob_data': 0, 'writes': 0}
+
+
+class JsonMetadataSerde:
+    """metadata 与 checkpoint 使用不同序列化类型的 serde"""
+
+    def __init__(self):
+        self.inner = default_serde()
+
+    def dumps_typed(self, obj):
+        if isinstance(obj, dict) and 'step' in obj:
+            return 'json', json.dumps(obj).encode()
+        return self.inner.dumps_typed(obj)
+
+    def loads_typed(self, data):
+        return self.inner.loads_typed(data)
+
+
+def test_metadata_keeps_its_own_type(tmp_path) -> None:
+    saver = SqliteCheckpointSaver(str(tmp_path / 'cp.sqlite'), serde=JsonMetadataSerde(), prune_interval=0)
+    config = {'configurable': {'thread_id': 't1'}}
+    _graph(saver, [], fail=[]).invoke(AgentState(user_task='task'), config)
+    assert saver.get_tuple(config).metadata['step'] == 2
+    assert [t.metadata['step'] for t in saver.list(config, filter={'source': 'loop'})] == [2, 1, 0]
+    saver.close()
@@ -0,0 +1,46 @@
+import asyncio
+
+from src.assistant import base
+from src.assistant.qwen_assistant import QwenAssistant
+
+CFG = {'model': 'qwen', 'base_url': 'http://localhost:8000/v1', 'api_key': 'EMPTY'}
+
+
+def test_assistants_share_model_and_pool() -> None:
+    base.clear_clients()
+    a = QwenAssistant(llm=dict(CFG))
+    b = QwenAssistant(llm=dict(CFG))
+    assert a.llm is b.llm
+    sync_client = base.get_http_client(CFG)
+    assert a.llm.http_client is sync_client
+    assert a.llm.http_async_client is base.get_http_client(CFG, is_async=True)
+    assert a.llm.root_client._client is sync_client
+
+
+def test_pool_settings_are_part_of_the_key() -> None:
+    base.clear_clients()
+    small = base.get_http_client({**CFG, 'max_connections': 4})
+    assert small is not base.get_http_client(CFG)
+    assert small._transport._pool._max_connections == 4
+    assert base.get_http_client({**CFG, 'model': 'other'}) is base.get_http_client(CFG)
+    assert base.get_http_client(CFG)._transport._pool._http2 == base.http2_available()
+
+
+def test_async_pool_follows_event_loop() -> None:
+    base.clear_clients()
+    client = base.get_http_client(CFG, is_async=True)
+
+    async def current():
+        return client.for_loop()
+
+    first, second = asyncio.run(current()), asyncio.run(current())
+    assert first is not second
+
+    loop = asyncio.new_event_loop()
+    try:
+        pool = loop.run_until_complete(current())
+        assert loop.run_until_complete(current()) is pool
+        base.clear_clients()
+        assert pool.is_closed
+    finally:
+        loop.close()
@@ -0,0 +1,80 @@
+import json
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from qwen_agent.tools.base import BaseTool
+
+from src.assistant.context import ContextBudget, SUMMARY_KEY, elide_text, estimate_tokens
+from src.assistant.qwen_assistant import QwenAssistant
+
+
+def _turn(i: int, result: str):
+    call = {'name': 'read', 'args': {'path': f'f{i}'}, 'id': 'read'}
+    return [AIMessage(content=f'第{i}步'), AIMessage(content='', tool_calls=[call]),
+            ToolMessage(tool_call_id='read', content=result)]
+
+
+def test_estimate_tokens() -> None:
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('abcdefgh') == 2
+    assert estimate_tokens('你好世界') == 4
+    assert estimate_tokens([{'text': 'abcd'}, {'text': '中'}]) == 2
+
+
+def test_elide_keeps_head_and_tail() -> None:
+    text = 'HEAD' + 'x' * 4000 + 'TAIL'
+    elided = elide_text(text, 100)
+    assert elided.startswith('HEAD') and elided.endswith('TAIL')
+    assert estimate_tokens(elided) < 120
+    assert elide_text('short', 100) == 'short'
+
+
+def test_compact_summarizes_old_turns_and_keeps_latest() -> None:
+    messages = [SystemMessage('sys'), HumanMessage('task')]
+    for i in range(6):
+        messages += _turn(i, f'result {i}\n' + 'y' * 2000)
+    latest = messages[-3:]
+    budget = ContextBudget(max_tokens=700, keep_turns=1, tool_result_tokens=50, summary_tokens=2000)
+    budget.compact(messages)
+
+    assert budget.count(messages) <= 700
+    assert messages[0].content == 'sys' and messages[1].content == 'task'
+    assert SUMMARY_KEY in messages[2].additional_kwargs
+    assert '调用工具 read' in messages[2].content
+    assert messages[-3:] == latest
+    # 再次压缩时在已有摘要之后追加
+    summary = messages[2].additional_kwargs[SUMMARY_KEY]
+    messages += _turn(6, 'z' * 2000)
+    budget.compact(messages)
+    assert messages[2].additional_kwargs[SUMMARY_KEY][:len(summary)] == summary
+    assert budget.count(messages) <= 700
+
+
+class BigOutput(BaseTool):
+    name = 'big_output'
+    description = '返回大量文本'
+    parameters = []
+
+    def call(self, params, **kwargs):
+        return 'line\n' * 5000
+
+
+class Recorder(BaseCallbackHandler):
+    def __init__(self):
+        self.prompts = []
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.prompts.append(messages[0])
+
+
+def test_assistant_loop_stays_within_budget() -> None:
+    call = json.dumps({'name': 'big_output', 'arguments': {}})
+    responses = [f'<tool_call>\n{call}\n</tool_call>'] * 4 + ['done']
+    recorder = Recorder()
+    assistant = QwenAssistant(function_list=[BigOutput()], context_budget={'max_tokens': 4000, 'keep_turns': 1},
+                              llm=FakeListChatModel(responses=responses, callbacks=[recorder]))
+    batches = list(assistant.run([HumanMessage('go')], usetool=True))
+    assert batches[-1][0].content == 'done'
+    assert len(recorder.prompts) == 5
+    assert all(assistant.context_budget.count(prompt) <= 4000 for prompt in recorder.prompts)
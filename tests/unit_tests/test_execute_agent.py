@@ -0,0 +1,108 @@
+import threading
+import time
+
+from src.agent.agent_state import AgentState, ModelMode, TaskItem
+from src.agent.execute_agent import GeneralExecuteAgent
+from src.agent.task_graph import TaskScheduler, dependents_of, resolve_dependencies
+
+
+class RecordingExecuteAgent(GeneralExecuteAgent):
+    def __init__(self, delay: float = 0.1, **kwargs):
+        super().__init__(mode=ModelMode.LOCAL_QWEN, llm=object(), **kwargs)
+        self.delay = delay
+        self.started = {}
+        self.depend_results = {}
+        self.lock = threading.Lock()
+
+    def executeTask(self, state, task, depend_results=None):
+        with self.lock:
+            self.started[task.index] = time.monotonic()
+            self.depend_results[task.index] = depend_results
+        time.sleep(self.delay)
+        task.result = f"result-{task.index}"
+
+
+def test_independent_tasks_run_in_parallel() -> None:
+    agent = RecordingExecuteAgent(max_workers=4)
+    state = AgentState(user_task="t", task_list=[TaskItem(index=i, task=str(i), depends=[]) for i in range(1, 5)])
+    start = time.monotonic()
+    state = agent.run(state)
+    assert time.monotonic() - start < 0.3
+    assert state.executed_index == [1, 2, 3, 4]
+    assert [t.result for t in state.task_list] == ["result-1", "result-2", "result-3", "result-4"]
+
+
+def test_dependencies_are_respected() -> None:
+    agent = RecordingExecuteAgent(max_workers=4, delay=0.05)
+    state = AgentState(user_task="t", task_list=[
+        TaskItem(index=1, depends=[]),
+        TaskItem(index=2, depends=[1]),
+        TaskItem(index=3, depends=[1, 2]),
+        TaskItem(index=4),
+    ])
+    state = agent.run(state)
+    assert agent.started[2] >= agent.started[1] + 0.05
+    assert agent.started[3] >= agent.started[2] + 0.05
+    assert agent.started[4] < agent.started[2]
+    assert agent.depend_results[3] == {1: "result-1", 2: "result-2"}
+    assert state.executed_index == [1, 2, 3, 4]
+
+
+def test_already_executed_tasks_are_skipped() -> None:
+    agent = RecordingExecuteAgent(max_workers=2, delay=0)
+    state = AgentState(user_task="t", task_list=[TaskItem(index=1, result="old"), TaskItem(index=2, depends=[1])],
+                       executed_index=[1])
+    state = agent.run(state)
+    assert set(agent.started) == {2}
+    assert agent.depend_results[2] == {1: "old"}
+    assert state.executed_index == [1, 2]
+
+
+def test_cycle_does_not_deadlock() -> None:
+    agent = RecordingExecuteAgent(max_workers=2, delay=0)
+    state = AgentState(user_task="t", task_list=[TaskItem(index=1, depends=[2]), TaskItem(index=2, depends=[1])])
+    state = agent.run(state)
+    assert state.executed_index == [1, 2]
+
+
+def test_sequential_mode_and_dependents() -> None:
+    tasks = [TaskItem(index=1), TaskItem(index=2), TaskItem(index=3, depends=["1"])]
+    assert resolve_dependencies(tasks, mode="sequential") == {1: set(), 2: {1}, 3: {1}}
+    assert resolve_dependencies(tasks) == {1: set(), 2: set(), 3: {1}}
+    assert dependents_of(tasks, [1]) == {1, 3}
+
+
+def test_tasks_without_any_depends_run_in_order() -> None:
+    # 所有子任务都未声明 depends 时 index 即执行顺序
+    tasks = [TaskItem(index=1), TaskItem(index=2), TaskItem(index=3)]
+    assert resolve_dependencies(tasks) == {1: set(), 2: {1}, 3: {1, 2}}
+    agent = RecordingExecuteAgent(max_workers=4, delay=0.05)
+    state = agent.run(AgentState(user_task="t", task_list=tasks))
+    assert agent.started[2] >= agent.started[1] + 0.05
+    assert agent.started[3] >= agent.started[2] + 0.05
+    assert state.executed_index == [1, 2, 3]
+
+
+def test_tasks_without_index_get_their_position() -> None:
+    agent = RecordingExecuteAgent(max_workers=2, delay=0)
+    state = AgentState(user_task="t", task_list=[
+        TaskItem(task="a", depends=[3]), TaskItem(index=1, task="b"), TaskItem(task="c", depends=[2]),
+    ])
+    state = agent.run(state)
+    assert [t.index for t in state.task_list] == [2, 1, 3]
+    assert state.executed_index == [2, 1, 3]
+
+
+def test_scheduler_breaks_cycles_and_orders_results() -> None:
+    tasks = [TaskItem(index=1, depends=[3], result="r1"), TaskItem(index=2, depends=[1]), TaskItem(index=3, depends=[2])]
+    scheduler = TaskScheduler(tasks, executed_index=[])
+    assert [(t.index, r) for t, r in scheduler.ready()] == [(1, {})]
+    assert scheduler.ready() == []
+    scheduler.complete(tasks[0])
+    [(task, results)] = scheduler.ready()
+    assert task.index == 2 and results == {1: "r1"}
+    scheduler.complete(task, RuntimeError("boom"))
+    assert task.status == "failed"
+    [(task, _)] = scheduler.ready()
+    scheduler.complete(task)
+    assert not scheduler.active and scheduler.executed() == [1, 2, 3]
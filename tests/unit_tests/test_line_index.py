@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from src.tools import line_index, read_file_lines
+from src.tools.line_index import LineIndex, get_line_index
+
+
+def test_read_ranges_from_cached_index(tmp_path) -> None:
+    path = tmp_path / 'app.log'
+    path.write_bytes(''.join(f'line {i}\n' for i in range(1, 1001)).encode())
+
+    result = read_file_lines.invoke({'path': str(path), 'start': 998, 'end': 2000})
+    assert result == {'lines': ['line 998', 'line 999', 'line 1000'], 'total_lines': 1000}
+    index = get_line_index(str(path))
+    assert read_file_lines.invoke({'path': str(path), 'start': 1, 'end': 2})['lines'] == ['line 1', 'line 2']
+    assert get_line_index(str(path)) is index
+
+    # 追加内容后 mtime 与大小变化，索引重新建立
+    with open(path, 'ab') as f:
+        f.write('中文\r\nno newline'.encode())
+    os.utime(path, ns=(index.mtime_ns + 1, index.mtime_ns + 1))
+    result = read_file_lines.invoke({'path': str(path), 'start': 1001, 'end': 1002})
+    assert result == {'lines': ['中文', 'no newline'], 'total_lines': 1002}
+    assert get_line_index(str(path)) is not index
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_index_edge_cases(tmp_path, monkeypatch, numpy) -> None:
+    if not numpy:
+        monkeypatch.setattr(line_index, 'np', None)
+    monkeypatch.setattr(line_index, 'SCAN_BLOCK', 4)
+    cases = {b'': [], b'\n': [''], b'a\n\nb': ['a', '', 'b'], b'abcdefgh\nij\n': ['abcdefgh', 'ij']}
+    for content, expected in cases.items():
+        path = tmp_path / 'file.txt'
+        path.write_bytes(content)
+        index = LineIndex.build(str(path))
+        assert index.total_lines == len(expected)
+        assert index.read(1, len(expected)) == expected
+        assert index.read(2, 1) == []
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/status'), reason='需要 /proc')
+def test_pseudo_files_are_streamed() -> None:
+    # /proc 下的文件大小为 0，无法建立索引
+    result = read_file_lines.invoke({'path': '/proc/self/status', 'start': 1, 'end': 1})
+    assert result['lines'][0].startswith('Name:') and result['total_lines'] > 1
@@ -0,0 +1,100 @@
+import time
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from src.agent.agent_state import ModelMode
+from src.agent.execute_agent import GeneralExecuteAgent
+from src.assistant.cache import LLMCache, is_deterministic
+from src.assistant.qwen_assistant import QwenAssistant
+
+
+def _contents(assistant: QwenAssistant, **kwargs) -> str:
+    batches = list(assistant.run([HumanMessage("q")], **kwargs))
+    return "".join(m.content for b in batches for m in b)
+
+
+def test_cache_hit_with_seed_and_bypass_without() -> None:
+    cache = LLMCache(max_entries=8)
+    assistant = QwenAssistant(llm=FakeListChatModel(responses=["first", "second", "third"]), cache=cache)
+    assert _contents(assistant, seed=1) == "first"
+    assert _contents(assistant, seed=1) == "first"
+    assert _contents(assistant, seed=1, stream=True) == "first"
+    assert _contents(assistant) == "second"
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["bypassed"] == 1
+
+
+def test_stream_miss_is_recorded() -> None:
+    cache = LLMCache()
+    assistant = QwenAssistant(llm=FakeListChatModel(responses=["streamed answer", "other"]), cache=cache)
+    assert _contents(assistant, seed=2, stream=True) == "streamed answer"
+    assert _contents(assistant, seed=2) == "streamed answer"
+
+
+def test_sqlite_tier_and_ttl(tmp_path) -> None:
+    path = str(tmp_path / "cache.sqlite")
+    key = LLMCache.make_key([HumanMessage("q")], {"seed": 1}, "m")
+    LLMCache(path=path).put(key, {"content": "x"})
+    cache = LLMCache(path=path, ttl=0.05)
+    assert cache.get(key) == {"content": "x"}
+    assert cache.stats()["disk_hits"] == 1
+    time.sleep(0.1)
+    assert cache.get(key) is None
+    assert cache.prune() == 1
+
+
+def test_expired_rows_are_pruned_on_open_and_writes(tmp_path) -> None:
+    path = str(tmp_path / "cache.sqlite")
+    LLMCache(path=path).put("old", {"content": "x"})
+    time.sleep(0.1)
+
+    def rows(cache: LLMCache) -> int:
+        return cache._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    cache = LLMCache(path=path, ttl=0.05, prune_every=2)
+    assert rows(cache) == 0
+    cache.put("a", {"content": "a"})
+    time.sleep(0.1)
+    cache.put("b", {"content": "b"})
+    assert rows(cache) == 1
+
+
+def test_lru_eviction_and_key_stability() -> None:
+    cache = LLMCache(max_entries=2)
+    for k in "abc":
+        cache.put(k, {"content": k})
+    assert cache.get("a") is None and cache.get("c") == {"content": "c"}
+    assert LLMCache.make_key([HumanMessage("q")], {"b": 1, "a": 2}) == LLMCache.make_key([HumanMessage("q")], {"a": 2, "b": 1})
+    assert LLMCache.make_key([HumanMessage("q")]) != LLMCache.make_key([HumanMessage("q2")])
+
+
+def test_is_deterministic() -> None:
+    assert is_deterministic({"seed": 0})
+    assert is_deterministic({"temperature": 0})
+    assert not is_deterministic({"top_p": 0.8})
+
+
+def test_async_path_uses_cache() -> None:
+    import asyncio
+
+    cache = LLMCache()
+    assistant = QwenAssistant(llm=FakeListChatModel(responses=["a1", "a2"]), cache=cache)
+
+    async def contents(**kwargs):
+        return "".join([m.content async for b in assistant.arun([HumanMessage("q")], **kwargs) for m in b])
+
+    assert asyncio.run(contents(seed=3, stream=True)) == "a1"
+    assert asyncio.run(contents(seed=3)) == "a1"
+    assert cache.stats()["hits"] == 1
+
+
+def test_default_agent_cache_env_sets_seed(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("MY_AGENT_LLM_CACHE", str(tmp_path / "cache.sqlite"))
+    assistant = GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN).llm
+    assert assistant.extra_generate_cfg["seed"] == 0
+    assert assistant._cache_key([HumanMessage("q")], assistant.extra_generate_cfg) is not None
+
+    monkeypatch.setenv("MY_AGENT_LLM_SEED", "7")
+    assistant = GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN).llm
+    assert assistant._sampling_params(assistant.extra_generate_cfg)["seed"] == 7
@@ -0,0 +1,95 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from src.assistant.base import get_chat_model
+
+
+def _stub_server(reply: str, status: int = 200):
+    """最小的 OpenAI 兼容服务，返回固定内容，status 非 200 时模拟故障副本"""
+
+    class Handler(BaseHTTPRequestHandler):
+        hits = 0
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self._send(status, {'object': 'list', 'data': []})
+
+        def do_POST(self):
+            Handler.hits += 1
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            if status != 200:
+                return self._send(status, {'error': {'message': 'down'}})
+            if not body.get('stream'):
+                return self._send(200, {'id': 'x', 'object': 'chat.completion', 'created': 0, 'model': 'm',
+                                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                                     'message': {'role': 'assistant', 'content': reply}}]})
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            for piece in (reply[:2], reply[2:]):
+                chunk = {'id': 'x', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'm',
+                         'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+                self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.write(b'data: [DONE]\n\n')
+
+        def _send(self, code, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, Handler, f'http://127.0.0.1:{server.server_address[1]}/v1'
+
+
+@pytest.fixture
+def servers():
+    started = [_stub_server('hello A'), _stub_server('hello B'), _stub_server('', status=500)]
+    yield started
+    for server, _, _ in started:
+        server.shutdown()
+
+
+def _router(urls, **kwargs):
+    return get_chat_model({'model_type': 'router', 'model': 'm', 'api_key': 'EMPTY', 'endpoints': urls, **kwargs})
+
+
+def test_router_balances_by_in_flight(servers) -> None:
+    (_, a, url_a), (_, b, url_b), _ = servers
+    router = _router([url_a, url_b])
+    router._replicas[0].in_flight = 3
+    assert router.invoke([HumanMessage('hi')]).content == 'hello B'
+    router._replicas[0].in_flight = 0
+    router._replicas[1].in_flight = 3
+    assert router.invoke([HumanMessage('hi')]).content == 'hello A'
+    assert (a.hits, b.hits) == (1, 1)
+
+
+def test_router_fails_over_and_marks_replica_down(servers) -> None:
+    (_, a, url_a), _, (_, bad, url_bad) = servers
+    router = _router([url_bad, url_a])
+    assert ''.join(c.content for c in router.stream([HumanMessage('hi')])) == 'hello A'
+    assert bad.hits == 1
+    assert [s['healthy'] for s in router.stats()] == [False, True]
+    # 故障副本在 cooldown 内不再被选中
+    assert router.invoke([HumanMessage('hi')]).content == 'hello A'
+    assert bad.hits == 1
+    assert router.check_health() == {url_bad: False, url_a: True}
+
+
+def test_router_raises_when_attempts_exhausted(servers) -> None:
+    _, _, (_, bad, url_bad) = servers
+    router = _router([url_bad, url_bad + '/'], max_attempts=2)
+    with pytest.raises(Exception):
+        router.invoke([HumanMessage('hi')])
+    assert bad.hits == 2
+    assert all(s['in_flight'] == 0 for s in router.stats())
@@ -0,0 +1,39 @@
+from src.tools.output_buffer import OutputBuffer, decode
+
+
+def test_memory_spill_and_drop() -> None:
+    buffer = OutputBuffer(memory_limit=10, spill_limit=25)
+    for i in range(10):
+        buffer.write(f'line{i}\n'.encode())
+    assert buffer.stats() == {'bytes_total': 60, 'bytes_retained': 31, 'memory_bytes': 6, 'spilled_bytes': 25,
+                              'dropped_bytes': 29}
+    # 跨越溢出区与内存的读取
+    assert buffer.read(0, 100) == (b'\nline5\nline6\nline7\nline8\nline9\n', 29)
+    assert buffer.read(45, 8) == (b'e7\nline8', 45)
+    assert buffer.tail(2, 1000) == (b'line8\nline9\n', 48)
+    buffer.close()
+    assert buffer.read(0, 100) == (b'', 60)
+
+
+def test_spill_ring_wraps_and_large_chunks() -> None:
+    buffer = OutputBuffer(memory_limit=0, spill_limit=16)
+    buffer.write(b'0123456789')
+    buffer.write(b'abcdefghij')
+    assert buffer.read(0, 100) == (b'456789abcdefghij', 4)
+    buffer.write(b'x' * 40)
+    assert buffer.read(0, 100) == (b'x' * 16, 44)
+
+
+def test_decode_keeps_partial_characters() -> None:
+    data = '中文'.encode()
+    assert decode(data[:4]) == ('中', 3)
+    assert decode(data) == ('中文', 6)
+
+
+def test_tail_without_line_limit_pages_from_start() -> None:
+    buffer = OutputBuffer(memory_limit=64, spill_limit=0)
+    buffer.write(b'a\nb\nc\n')
+    assert buffer.tail(2, 1024) == (b'b\nc\n', 2)
+    for lines in (0, -1):
+        assert buffer.tail(lines, 1024) == (b'a\nb\nc\n', 0)
+    assert buffer.tail(0, 4) == (b'a\nb\n', 0)
@@ -0,0 +1,56 @@
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+
+from src.assistant.qwen_assistant import QwenAssistant
+from src.tools import get_qwen_cls, list_dir, read_file_lines, write_file
+
+
+def test_prepare_shares_payloads_and_leaves_input_untouched() -> None:
+    big = HumanMessage(content=[{'type': 'text', 'text': 'x' * 100_000}])
+    system = SystemMessage('你是助手\n\n{tools}')
+    messages = [system, big]
+    assistant = QwenAssistant(function_list=[list_dir], llm=FakeListChatModel(responses=['ok']), system='前缀')
+
+    prepared = assistant._prepare_messages(messages, usetool=True)
+    assert prepared[1] is big
+    assert prepared[0] is not system and prepared[0].content.startswith('前缀\n\n你是助手')
+    assert 'list_dir' in prepared[0].content
+    assert messages == [system, big] and system.content == '你是助手\n\n{tools}'
+
+    # 工具循环中追加的消息不会写回调用方的列表
+    assert [m.content for b in assistant.run(messages, usetool=True) for m in b] == ['ok']
+    assert len(messages) == 2
+
+
+def test_tool_result_is_merged_into_previous_human_message() -> None:
+    human = HumanMessage('列出目录')
+    prepared = QwenAssistant(llm=None)._prepare_messages([human, ToolMessage(tool_call_id='a', content='r')])
+    assert len(prepared) == 1
+    assert prepared[0].content == '列出目录\n<tool_response>\nr\n</tool_response>'
+    assert human.content == '列出目录'
+
+
+def test_tools_prompt_is_compiled_once_per_tool_selection(monkeypatch) -> None:
+    assistant = QwenAssistant(function_list=[list_dir, read_file_lines], llm=None)
+    builds = []
+    format_tools_prompt = assistant._format_tools_prompt
+    monkeypatch.setattr(assistant, '_format_tools_prompt', lambda functions: builds.append(
+        [f['name'] for f in functions]) or format_tools_prompt(functions))
+    messages = [SystemMessage('系统\n\n{tools}'), HumanMessage('q')]
+
+    first = assistant._prepare_messages(messages, usetool=True, tool_names=['list_dir'])
+    second = assistant._prepare_messages(messages, usetool=True, tool_names=['list_dir'])
+    assert first[0] is second[0]
+    assert 'list_dir' in first[0].content and 'read_file_lines' not in first[0].content
+    assistant._prepare_messages(messages, usetool=True)
+    assert builds == [['list_dir'], ['list_dir', 'read_file_lines']]
+
+    # function_map 变化后重新编译
+    assistant._init_tool(write_file)
+    assert 'write_file' in assistant._prepare_messages(messages, usetool=True)[0].content
+    assert len(builds) == 3
+
+
+def test_qwen_tool_class_is_reused() -> None:
+    assert get_qwen_cls(list_dir) == get_qwen_cls(list_dir)
+    assert get_qwen_cls(list_dir, name='ls')[1] == 'ls'
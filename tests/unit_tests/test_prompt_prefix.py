@@ -0,0 +1,45 @@
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from src.agent import PlannerAgent
+from src.agent import planner_agent
+from src.agent.agent_state import AgentState, ModelMode, TaskItem
+from src.agent.execute_agent import GeneralExecuteAgent
+from src.assistant.prefix import PrefixCacheEstimator
+from src.assistant.qwen_assistant import QwenAssistant
+from src.trace import tracing
+
+
+def test_planner_keeps_system_prompt_static() -> None:
+    original = planner_agent.systemMessage.content
+    planner = PlannerAgent(mode=ModelMode.LOCAL_QWEN, llm=object())
+    state = AgentState(user_task='整理目录', knowledge='目录下有 3 个文件')
+    first = planner._build_messages(state)
+    second = planner._build_messages(state)
+    assert planner_agent.systemMessage.content == original
+    assert first[0] is second[0] and first[0].content == original
+    human = first[1].content
+    assert human.index('目录下有 3 个文件') < human.index('整理目录') < human.index('已规划并执行的子任务')
+
+
+def test_subtasks_share_prompt_prefix() -> None:
+    agent = GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN, llm=object())
+    state = AgentState(user_task='统计代码行数', knowledge='仓库使用 Python' * 50)
+    first = agent._build_messages(state, TaskItem(index=1, task='列出文件'))
+    second = agent._build_messages(state, TaskItem(index=2, task='统计行数', depends=[1]), {1: 'a.py'})
+    assert first[0] is second[0]
+
+    estimator = PrefixCacheEstimator()
+    assert estimator.observe(first)['prefix_ratio'] == 0
+    observed = estimator.observe(second)
+    assert observed['prefix_ratio'] > 0.8
+    assert estimator.stats()['prompts'] == 2
+
+
+def test_trace_summary_reports_prefix_ratio() -> None:
+    assistant = QwenAssistant(llm=FakeListChatModel(responses=['a', 'b']))
+    with tracing('t') as tracer:
+        list(assistant.run([HumanMessage('前缀' * 100 + '1')]))
+        list(assistant.run([HumanMessage('前缀' * 100 + '2')]))
+    summary = tracer.summary()
+    assert summary['prefix_tokens'] > 0 and 0 < summary['prefix_ratio'] < 1
@@ -0,0 +1,55 @@
+from langchain_core.language_models import FakeListChatModel
+from langgraph.constants import END, START
+from langgraph.graph import StateGraph
+
+from src.agent.agent_state import AgentState, ModelMode, TaskItem
+from src.agent.execute_agent import GeneralExecuteAgent
+from src.assistant.qwen_assistant import QwenAssistant
+from src.graph.checkpoint import SqliteCheckpointSaver
+from src.graph.rerun import failed_subtasks, rerun_subtasks
+
+
+class TaskModel(FakeListChatModel):
+    """子任务描述中包含 flaky 时第一次执行失败"""
+    responses: list = ['']
+    calls: list = []
+    attempts: dict = {}
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        prompt = messages[-1].content
+        task = next(t for t in ('alpha', 'beta', 'gamma', 'delta') if t in prompt)
+        self.calls.append(task)
+        self.attempts[task] = self.attempts.get(task, 0) + 1
+        ok = 'flaky' not in prompt or self.attempts[task] > 1
+        status = '"status": "success", "result": "ok"' if ok else '"status": "failed", "reason": "boom"'
+        return f'```json\n{{"task_index": "1", {status}}}\n```'
+
+
+def test_rerun_only_failed_subtasks_and_dependents(tmp_path) -> None:
+    model = TaskModel(calls=[], attempts={})
+    agent = GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN, max_workers=2, llm=QwenAssistant(llm=model))
+
+    def plan(state: AgentState):
+        state.knowledge = 'k'
+        state.task_list = [TaskItem(index=1, task='alpha'), TaskItem(index=2, task='beta flaky'),
+                           TaskItem(index=3, task='gamma', depends=[2]), TaskItem(index=4, task='delta')]
+        return state
+
+    graph = (StateGraph(AgentState).add_node('plan', plan).add_node('execute', agent.run)
+             .add_edge(START, 'plan').add_edge('plan', 'execute').add_edge('execute', END)
+             .compile(checkpointer=SqliteCheckpointSaver(str(tmp_path / 'cp.sqlite'), prune_interval=0)))
+
+    state = graph.invoke(AgentState(user_task='t'), {'configurable': {'thread_id': 'r'}})
+    assert failed_subtasks(state['task_list']) == [2]
+    assert sorted(model.calls) == ['alpha', 'beta', 'delta', 'gamma']
+
+    model.calls.clear()
+    state = rerun_subtasks(graph, 'r')
+    assert sorted(model.calls) == ['beta', 'gamma']
+    assert [t.status for t in state['task_list']] == ['success'] * 4
+    assert sorted(state['executed_index']) == [1, 2, 3, 4]
+    assert state['knowledge'] == 'k'
+
+    model.calls.clear()
+    rerun_subtasks(graph, 'r')
+    assert model.calls == []
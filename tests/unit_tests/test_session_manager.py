@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from src.tools.session_manager import SessionLimitError, SessionManager
+
+
+def _gone(pid: int, timeout: float = 2) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                # 已结束但尚未被回收的僵尸进程
+                if f.read().rsplit(')', 1)[1].split()[0] == 'Z':
+                    return True
+        except FileNotFoundError:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_max_sessions_evicts_least_recently_used() -> None:
+    manager = SessionManager(max_sessions=2, reap_interval=0)
+    try:
+        first, second = manager.create(), manager.create()
+        second.run('true')
+        third = manager.create()
+        assert [s.sessionid for s in manager.list()] == [second.sessionid, third.sessionid]
+        assert not first.alive and manager.metrics()['evicted'] == 1
+
+        for session in manager.list():
+            session.start('sleep 30')
+        with pytest.raises(SessionLimitError):
+            manager.create()
+    finally:
+        manager.close_all()
+    assert manager.metrics()['live_sessions'] == 0
+
+
+def test_idle_sessions_and_orphans_are_reaped() -> None:
+    manager = SessionManager(ttl=0.3, reap_interval=0)
+    try:
+        busy, idle = manager.create(), manager.create()
+        busy.start('sleep 30')
+        # shell 退出后留在其进程组中的后台进程
+        orphan = int(idle.run('sleep 30 & echo $!')['output'])
+        idle.run('exit')
+        time.sleep(0.4)
+        assert manager.reap() == 1
+        assert [s.sessionid for s in manager.list()] == [busy.sessionid]
+        metrics = manager.metrics()
+        assert metrics['reaped'] == 1 and metrics['orphans_killed'] == 1 and metrics['running_sessions'] == 1
+        assert _gone(orphan)
+    finally:
+        manager.close_all()
+
+
+def test_output_quota() -> None:
+    manager = SessionManager(output_limit=8192, reap_interval=0)
+    try:
+        session = manager.create()
+        session.run('seq 1 100000')
+        stats = session.output.stats()
+        assert stats['bytes_total'] > 500_000 and stats['bytes_retained'] <= 8192
+        assert manager.metrics()['bytes_buffered'] == stats['bytes_retained']
+    finally:
+        manager.close_all()
@@ -0,0 +1,102 @@
+import os
+import time
+
+from src.tools import create_session, execute_command, list_sessions, read_output, wait_output
+from src.tools.output_buffer import OutputBuffer
+from src.tools.shell_session import ShellSession, descendants
+
+
+def test_state_persists_across_commands(tmp_path) -> None:
+    (tmp_path / 'sub').mkdir()
+    first = execute_command.invoke({'command': 'cd sub && export GREETING=hi', 'path': str(tmp_path)})
+    sessionid = first['sessionid']
+    assert first['exit_code'] == 0 and first['cwd'] == str(tmp_path / 'sub')
+
+    second = execute_command.invoke({'command': 'pwd; echo $GREETING; (exit 3)', 'sessionid': sessionid})
+    assert second['output'] == [str(tmp_path / 'sub'), 'hi'] and second['exit_code'] == 3
+    assert read_output.invoke({'sessionid': sessionid, 'lines': 1})['output'] == ['hi']
+
+    info = next(s for s in list_sessions.invoke({}) if s['sessionid'] == sessionid)
+    assert info['state'] == 'idle' and info['alive'] and info['commands'] == 2
+    os.kill(info['pid'], 0)
+
+
+def test_timeout_kills_only_the_command() -> None:
+    session = ShellSession()
+    try:
+        session.run('export KEEP=1')
+        started = time.monotonic()
+        result = session.run('echo start; sleep 30', timeout=0.5)
+        assert result['timeout'] and result['output'].startswith('start')
+        assert time.monotonic() - started < 5
+        assert descendants(session.pid) == []
+        assert session.run('echo $KEEP')['output'] == '1\n' and session.restarts == 0
+
+        # 超时后命令的其余部分不再执行
+        result = session.run('sleep 5; echo done', timeout=0.5)
+        assert result['timeout'] and result['exit_code'] != 0 and 'done' not in result['output']
+        assert session.run('echo $KEEP')['output'] == '1\n' and session.restarts == 0
+
+        # 等待其他命令结束的时间计入超时
+        session.start('sleep 2')
+        started = time.monotonic()
+        assert session.run('echo late', timeout=1)['timeout'] and time.monotonic() - started < 1.5
+
+        # exit 结束 shell 后，下一条命令重新启动
+        assert session.run('exit 4')['exit_code'] == 4 and session.state == 'exited'
+        assert session.run('echo again')['output'] == 'again\n' and session.restarts == 1
+    finally:
+        session.close()
+    assert not session.alive
+
+
+def test_create_session_reports_process() -> None:
+    info = create_session.invoke({'shell': 'sh'})
+    assert info['shell'] == 'sh' and info['state'] == 'idle' and info['pid'] > 0
+    result = execute_command.invoke({'command': 'echo 中文输出', 'sessionid': info['sessionid']})
+    assert result['output'] == ['中文输出']
+
+
+def test_page_through_large_output() -> None:
+    session = ShellSession()
+    session.output = OutputBuffer(memory_limit=4096, spill_limit=64 * 1024)
+    try:
+        result = session.run('seq 1 20000', max_output=1024)
+        assert result['exit_code'] == 0 and result['output'].startswith('[输出共 108894 字节')
+        assert result['output'].endswith('19999\n20000\n')
+
+        # 早期输出已被丢弃，从最早保留的位置按游标读取到末尾
+        page = session.read(offset=result['offset'], max_bytes=10000)
+        assert page['truncated'] and page['offset'] == session.output.start > 0
+        pages, cursor = [], page['offset']
+        while cursor < result['end']:
+            page = session.read(offset=cursor, max_bytes=10000)
+            pages.append(page['output'])
+            cursor = page['next_offset']
+        assert ''.join(pages).endswith('\n'.join(str(i) for i in range(19000, 20001)) + '\n')
+        assert session.output.stats()['memory_bytes'] <= 4096
+    finally:
+        session.close()
+
+
+def test_background_commands_stream_output() -> None:
+    script = 'for i in 1 2 3; do echo tick$i; sleep 0.2; done; echo ready; sleep 30'
+    started = time.monotonic()
+    handles = [execute_command.invoke({'command': script, 'background': True}) for _ in range(2)]
+    assert time.monotonic() - started < 1
+    assert all(h['state'] == 'running' and h['command_id'] == 1 for h in handles)
+    assert handles[0]['sessionid'] != handles[1]['sessionid']
+
+    first = wait_output.invoke({'sessionid': handles[0]['sessionid'], 'pattern': r'^ready$', 'timeout': 5})
+    assert first['matched'] and not first['finished'] and first['output'] == ['tick1', 'tick2', 'tick3', 'ready']
+    # 两条命令同时执行，第二条也已输出
+    assert 'tick3' in read_output.invoke({'sessionid': handles[1]['sessionid'], 'lines': 5})['output']
+
+    busy = execute_command.invoke({'command': 'echo x', 'sessionid': handles[0]['sessionid'], 'background': True})
+    assert 'error' in busy
+    for handle in handles:
+        stopped = wait_output.invoke({'sessionid': handle['sessionid'], 'timeout': 0.2, 'kill_on_timeout': True})
+        assert stopped['timeout'] and stopped['finished'] and stopped['exit_code'] == 137
+        after = execute_command.invoke({'command': 'echo $((1 + 1))', 'sessionid': handle['sessionid']})
+        assert after['output'] == ['2']
+    assert time.monotonic() - started < 10
@@ -0,0 +1,51 @@
+import random
+
+from langchain_core.messages import AIMessage
+
+from src.assistant.qwen_assistant import QwenAssistant
+from src.assistant.stream_parser import CONTENT, THINK, TOOL_CALL, StreamParser
+
+TEXT = ('<think>想一想 <tool_call> 不算</think>先查询\n'
+        '<tool_call>\n{"name": "search_web", "arguments": {"keyword": "a"}}\n</tool_call>\n'
+        '<tool_call>\n{"name": "query_url", "arguments": {"url": "b"}}\n</tool_call>尾部<thi')
+
+
+def _feed(parser: StreamParser, text: str, rng: random.Random):
+    events = []
+    i = 0
+    while i < len(text):
+        n = rng.randint(1, 7)
+        events.extend(parser.feed(text[i:i + n]))
+        i += n
+    return events + parser.close()
+
+
+def test_events_independent_of_chunking() -> None:
+    assistant = QwenAssistant(llm=None)
+    rng = random.Random(0)
+    for _ in range(50):
+        events = _feed(StreamParser(assistant._parse_tool_call), TEXT, rng)
+        assert "".join(e.text for e in events if e.type == THINK) == "想一想 <tool_call> 不算"
+        assert "".join(e.text for e in events if e.type == CONTENT) == "先查询\n\n尾部<thi"
+        calls = [e.tool_call for e in events if e.type == TOOL_CALL]
+        assert [c["name"] for c in calls] == ["search_web", "query_url"]
+        assert calls[0]["args"] == {"keyword": "a"}
+
+
+def test_tool_call_emitted_when_closed() -> None:
+    parser = StreamParser(QwenAssistant(llm=None)._parse_tool_call)
+    assert parser.feed('<tool_call>\n{"name": "list_dir", "arguments": {"path": "."}}') == []
+    events = parser.feed("\n</tool_call>")
+    assert [e.type for e in events] == [TOOL_CALL]
+
+
+def test_messages_match_postprocess() -> None:
+    assistant = QwenAssistant(llm=None)
+    # 与旧实现不同，think 中出现的 <tool_call> 不再被当作工具调用
+    for text in [TEXT.replace(" <tool_call> 不算", ""), "无工具调用", '<tool_call>{"name": "list_dir", "arguments": {"path": "."}', "<think>x</think>答"]:
+        parser = StreamParser(assistant._parse_tool_call)
+        _feed(parser, text, random.Random(1))
+        expected = assistant._postprocess_messages(AIMessage(content=text))
+        actual = parser.to_messages()
+        assert [m.content for m in actual] == [m.content for m in expected]
+        assert [m.tool_calls for m in actual] == [m.tool_calls for m in expected]
@@ -0,0 +1,48 @@
+import asyncio
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, START, StateGraph
+
+from src.agent import PlannerAgent
+from src.agent.agent_state import AgentState, ModelMode
+from src.agent.base_agent import Response
+from src.assistant.qwen_assistant import QwenAssistant
+
+PLAN = """<think>先拆分任务</think>
+```json
+{"finish": true, "taskItems": [{"index": 1, "task": "a"}]}
+```"""
+
+
+def _planner(stream: bool) -> PlannerAgent:
+    return PlannerAgent(mode=ModelMode.LOCAL_QWEN, stream=stream,
+                        llm=QwenAssistant(llm=FakeListChatModel(responses=[PLAN])))
+
+
+def test_stream_llm_yields_deltas() -> None:
+    deltas = list(_planner(stream=True).invoke_llm([], tools=[], use_tool=False))
+    assert len(deltas) > 1
+    assert any(d.think for d in deltas)
+    joined = Response.join(deltas)
+    expected = _planner(stream=False).invoke_llm([], tools=[], use_tool=False)
+    assert (joined.think, joined.content) == (expected.think, expected.content)
+
+
+def test_astream_llm_matches_stream_llm() -> None:
+    async def collect():
+        return [d async for d in _planner(stream=True).astream_llm([], tools=[], use_tool=False)]
+
+    assert Response.join(asyncio.run(collect())).content == Response.join(
+        _planner(stream=True).invoke_llm([], tools=[], use_tool=False)).content
+
+
+def test_tokens_reach_langgraph_messages_mode() -> None:
+    planner = _planner(stream=True)
+    graph = (StateGraph(AgentState)
+             .add_node("plan", RunnableLambda(planner.plan, name="plan"))
+             .add_edge(START, "plan").add_edge("plan", END)
+             .compile())
+    chunks = [chunk for chunk, meta in graph.stream(AgentState(user_task="t"), stream_mode="messages")]
+    assert len(chunks) > 1
+    assert "".join(c.content for c in chunks) == PLAN
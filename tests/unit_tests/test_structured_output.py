@@ -0,0 +1,88 @@
+from typing import Any, List
+
+from langchain_core.language_models import FakeListChatModel
+
+from src.agent import PlannerAgent
+from src.agent.agent_state import AgentState, ModelMode, TaskItem
+from src.agent.execute_agent import GeneralExecuteAgent
+from src.agent.schema import PLAN_SCHEMA, RESULT_SCHEMA, has_keys
+from src.assistant.qwen_assistant import QwenAssistant
+from src.utils.json_repair import parse_json
+
+
+class RecordingChatModel(FakeListChatModel):
+    """记录每次请求的生成参数"""
+    calls: List[dict] = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs: Any) -> str:
+        self.calls.append(kwargs)
+        return super()._call(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def test_parse_json_repairs_common_drift() -> None:
+    assert parse_json('```json\n{"a": 1}\n```') == {'a': 1}
+    assert parse_json('结果：{"status": "success", // 注释\n "result": "x",}') == {'status': 'success', 'result': 'x'}
+    assert parse_json("<think>{</think>{'finish': True, 'taskItems': [{'index': 1, 'task': 'it\\'s'},]}") == \
+        {'finish': True, 'taskItems': [{'index': 1, 'task': "it's"}]}
+    assert parse_json('```json\n{"status": "success", "result": "被截断') == {'status': 'success', 'result': '被截断'}
+    assert parse_json('没有 JSON') is None
+
+    # 说明文字中先出现的其他 JSON 不作为结果
+    text = '我调用了 list_dir {"path": "."}，结果如下：{"status": "success", "result": "3 个文件"}'
+    assert parse_json(text) == {'path': '.'}
+    assert parse_json(text, accept=has_keys('status')) == {'status': 'success', 'result': '3 个文件'}
+    assert parse_json('{"path": "."}', accept=has_keys('status')) is None
+
+
+def test_planner_sends_guided_json_and_keeps_llm_cfg() -> None:
+    model = RecordingChatModel(responses=['{"finish": true, "taskItems": [{"index": 1, "task": "a", "x": 1}]}'],
+                               calls=[])
+    assistant = QwenAssistant(llm=model)
+    assistant.extra_generate_cfg = {'top_p': 0.8, 'extra_body': {'chat_template_kwargs': {'enable_thinking': True}}}
+    planner = PlannerAgent(mode=ModelMode.LOCAL_QWEN, llm=assistant, structured_output=True)
+    state = planner.plan(AgentState(user_task='t'))
+    assert state.task_finish is True and state.task_list == [TaskItem(index=1, task='a')]
+    assert model.calls == [{'top_p': 0.8, 'extra_body': {'chat_template_kwargs': {'enable_thinking': True},
+                                                         'guided_json': PLAN_SCHEMA}}]
+
+
+def test_executor_formats_unparsable_result_once() -> None:
+    model = RecordingChatModel(responses=['已完成，共 3 个文件', '{"task_index": "1", "status": "success", "result": "3"}'],
+                               calls=[])
+    agent = GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN, llm=QwenAssistant(llm=model), structured_output=True)
+    task = TaskItem(index=1, task='统计文件')
+    agent.executeTask(AgentState(user_task='t'), task)
+    assert (task.status, task.result) == ('success', '3')
+    assert model.calls == [{}, {'extra_body': {'guided_json': RESULT_SCHEMA}}]
+
+    # 未开启结构化输出时不发起额外请求
+    model = RecordingChatModel(responses=['已完成'], calls=[])
+    task = TaskItem(index=1, task='统计文件')
+    GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN, llm=QwenAssistant(llm=model)).executeTask(AgentState(user_task='t'),
+                                                                                              task)
+    assert task.status is None and len(model.calls) == 1
+
+
+def test_executor_skips_earlier_json_in_prose() -> None:
+    model = RecordingChatModel(responses=['我调用了 list_dir {"path": "."}，结果如下：'
+                                          '{"task_index": "1", "status": "success", "result": "3 个文件"}'], calls=[])
+    agent = GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN, llm=QwenAssistant(llm=model), structured_output=True)
+    task = TaskItem(index=1, task='统计文件')
+    agent.executeTask(AgentState(user_task='t'), task)
+    assert (task.status, task.result) == ('success', '3 个文件') and len(model.calls) == 1
+
+    # 只有不含 status 的 JSON 时视为无法解析，以约束解码整理结果
+    model = RecordingChatModel(responses=['我调用了 list_dir {"path": "."}',
+                                          '{"task_index": "1", "status": "success", "result": "3"}'], calls=[])
+    agent = GeneralExecuteAgent(mode=ModelMode.LOCAL_QWEN, llm=QwenAssistant(llm=model), structured_output=True)
+    task = TaskItem(index=1, task='统计文件')
+    agent.executeTask(AgentState(user_task='t'), task)
+    assert (task.status, task.result) == ('success', '3') and len(model.calls) == 2
+
+
+def test_planner_requires_task_items() -> None:
+    model = RecordingChatModel(responses=['先看目录 {"path": "."}，计划：'
+                                          '{"finish": false, "taskItems": [{"index": 1, "task": "a"}]}'], calls=[])
+    planner = PlannerAgent(mode=ModelMode.LOCAL_QWEN, llm=QwenAssistant(llm=model))
+    state = planner.plan(AgentState(user_task='t'))
+    assert state.task_list == [TaskItem(index=1, task='a')]
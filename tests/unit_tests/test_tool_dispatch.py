@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, ToolMessage
+from qwen_agent.tools.base import BaseTool
+
+from src.assistant.qwen_assistant import QwenAssistant
+
+CALL = '<tool_call>\n{"name": "slow_tool", "arguments": {"n": %d}}\n</tool_call>'
+
+
+class SlowTool(BaseTool):
+    name = 'slow_tool'
+    description = 'sleep and echo'
+    parameters = [{'name': 'n', 'type': 'integer', 'description': 'n', 'required': True}]
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.started = []
+
+    def call(self, params, **kwargs):
+        self.started.append(time.monotonic())
+        time.sleep(self.delay)
+        return f"done-{params['n']}"
+
+
+def _assistant(tool: SlowTool) -> QwenAssistant:
+    # 第一轮：两个工具调用后还有 60 个字符的生成（每个字符 3ms）
+    first = CALL % 1 + CALL % 2 + "x" * 60
+    return QwenAssistant(function_list=[tool], llm=FakeListChatModel(responses=[first, "ok"], sleep=0.003))
+
+
+def _check(batches, tool: SlowTool, stream_end: float) -> None:
+    results = [m.artifact for batch in batches for m in batch if isinstance(m, ToolMessage)]
+    assert results == ["done-1", "done-2"]
+    assert len(tool.started) == 2
+    assert max(tool.started) < stream_end
+
+
+def test_tools_start_before_generation_finishes() -> None:
+    tool = SlowTool(delay=0.2)
+    batches, stream_end = [], None
+    for batch in _assistant(tool).run([HumanMessage("q")], stream=True, usetool=True):
+        batches.append(batch)
+        if stream_end is None and any(getattr(m, "tool_calls", None) for m in batch):
+            stream_end = time.monotonic()
+    _check(batches, tool, stream_end)
+
+
+def test_async_tools_start_before_generation_finishes() -> None:
+    tool = SlowTool(delay=0.2)
+
+    async def collect():
+        batches, stream_end = [], None
+        async for batch in _assistant(tool).arun([HumanMessage("q")], stream=True, usetool=True):
+            batches.append(batch)
+            if stream_end is None and any(getattr(m, "tool_calls", None) for m in batch):
+                stream_end = time.monotonic()
+        return batches, stream_end
+
+    batches, stream_end = asyncio.run(collect())
+    _check(batches, tool, stream_end)
+
+
+def test_multiple_tool_calls_run_concurrently_in_order() -> None:
+    tool = SlowTool(delay=0.3)
+    response = "".join(CALL % i for i in range(3))
+    assistant = QwenAssistant(function_list=[tool], llm=FakeListChatModel(responses=[response, "ok"]))
+    start = time.monotonic()
+    batches = list(assistant.run([HumanMessage("q")], usetool=True))
+    assert time.monotonic() - start < 0.6
+    assert [m.artifact for b in batches for m in b if isinstance(m, ToolMessage)] == ["done-0", "done-1", "done-2"]
+
+
+def test_per_tool_concurrency_limit() -> None:
+    tool = SlowTool(delay=0.1)
+    response = "".join(CALL % i for i in range(4))
+    assistant = QwenAssistant(function_list=[tool], llm=FakeListChatModel(responses=[response, "ok"]),
+                              tool_concurrency={"slow_tool": 1})
+    batches = list(assistant.run([HumanMessage("q")], usetool=True))
+    started = sorted(tool.started)
+    assert all(b - a >= 0.09 for a, b in zip(started, started[1:]))
+    assert [m.artifact for b in batches for m in b if isinstance(m, ToolMessage)] == [f"done-{i}" for i in range(4)]
+
+
+class FastTool(SlowTool):
+    name = 'fast_tool'
+
+
+def test_queued_calls_do_not_hold_pool_workers() -> None:
+    slow, fast = SlowTool(delay=0.2), FastTool(delay=0)
+    assistant = QwenAssistant(function_list=[slow, fast], llm=FakeListChatModel(responses=["ok"]),
+                              max_tool_workers=2, tool_concurrency={"slow_tool": 1})
+    start = time.monotonic()
+    queued = [assistant._submit_tool("slow_tool", {"n": i}) for i in range(3)]
+    assert assistant._submit_tool("fast_tool", {"n": 9}).result() == "done-9"
+    assert time.monotonic() - start < 0.15
+    assert [f.result() for f in queued] == ["done-0", "done-1", "done-2"]
+
+    # 相同配置的 Assistant 共享并发上限
+    other = QwenAssistant(function_list=[SlowTool(delay=0)], llm=FakeListChatModel(responses=["ok"]),
+                          tool_concurrency={"slow_tool": 1})
+    assert other._tool_limiters["slow_tool"] is assistant._tool_limiters["slow_tool"]
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from src.agent import PlannerAgent
+from src.agent.agent_state import AgentState, ModelMode
+from src.assistant.cache import LLMCache
+from src.assistant.qwen_assistant import QwenAssistant
+from src.tools import list_dir
+from src.trace import AGENT, LLM, NODE, TOOL, traced, tracing
+
+PLAN = """```json
+{"finish": true, "taskItems": [{"index": 1, "task": "a"}]}
+```"""
+
+
+def test_spans_for_llm_tool_and_cache_hit(tmp_path) -> None:
+    call = json.dumps({'name': 'list_dir', 'arguments': {'path': str(tmp_path)}})
+    llm = FakeListChatModel(responses=[f'<tool_call>\n{call}\n</tool_call>', '完成了'])
+    assistant = QwenAssistant(function_list=[list_dir], llm=llm, cache=LLMCache())
+    with tracing('t') as tracer:
+        list(assistant.run([HumanMessage('ls')], usetool=True, stream=True, seed=1))
+        list(assistant.run([HumanMessage('ls')], usetool=True, seed=1))
+
+    llm_spans = [s for s in tracer.spans if s.kind == LLM]
+    tool_spans = [s for s in tracer.spans if s.kind == TOOL]
+    assert len(llm_spans) == 4 and len(tool_spans) == 2
+    assert [s.attrs.get('cache_hit', False) for s in llm_spans] == [False, False, True, True]
+    first = llm_spans[0]
+    assert first.end is not None and 'ttft_ms' in first.attrs
+    assert first.attrs['prompt_tokens'] > 0 and first.attrs['completion_tokens'] > 0 and first.attrs['estimated']
+    assert llm_spans[1].attrs['completion_tokens'] == 3
+
+    summary = tracer.summary()
+    assert summary['llm_calls'] == 4 and summary['cache_hits'] == 2
+    assert summary[TOOL]['list_dir']['calls'] == 2
+    assert summary['errors'] == 0
+
+
+def test_traced_node_nests_agent_spans_and_exports(tmp_path) -> None:
+    planner = PlannerAgent(mode=ModelMode.LOCAL_QWEN, stream=True,
+                           llm=QwenAssistant(llm=FakeListChatModel(responses=[PLAN])))
+
+    @traced('plan')
+    async def plan_node(state: AgentState):
+        return await planner.aplan(state)
+
+    with tracing('run') as tracer:
+        state = asyncio.run(plan_node(AgentState(user_task='t')))
+
+    node = next(s for s in tracer.spans if s.kind == NODE)
+    agent = next(s for s in tracer.spans if s.kind == AGENT)
+    llm = next(s for s in tracer.spans if s.kind == LLM)
+    assert agent.name == 'PlannerAgent' and agent.parent_id == node.id and llm.parent_id == agent.id
+    assert state.trace_summary[NODE]['plan']['calls'] == 1
+    assert state.trace_summary['llm_calls'] == 1
+
+    tracer.export_chrome(str(tmp_path / 'trace.json'))
+    tracer.export_jsonl(str(tmp_path / 'trace.jsonl'))
+    events = json.loads((tmp_path / 'trace.json').read_text(encoding='utf-8'))['traceEvents']
+    assert {e['cat'] for e in events} == {NODE, AGENT, LLM}
+    assert all(e['ph'] == 'X' and e['dur'] >= 0 for e in events)
+    records = [json.loads(line) for line in (tmp_path / 'trace.jsonl').read_text(encoding='utf-8').splitlines()]
+    assert [r['kind'] for r in records] == [NODE, AGENT, LLM]
+
+
+def test_no_spans_without_tracing() -> None:
+    assistant = QwenAssistant(llm=FakeListChatModel(responses=['x']))
+    assert [m.content for b in assistant.run([HumanMessage('q')]) for m in b] == ['x']
+    assert traced('n')(lambda: 1)() == 1
+
+
+def test_sync_stream_nests_llm_spans_under_agent() -> None:
+    planner = PlannerAgent(mode=ModelMode.LOCAL_QWEN, stream=True,
+                           llm=QwenAssistant(llm=FakeListChatModel(responses=[PLAN])))
+
+    @traced('plan')
+    def plan_node(state: AgentState):
+        return planner.plan(state)
+
+    with tracing('run') as tracer:
+        plan_node(AgentState(user_task='t'))
+
+    node = next(s for s in tracer.spans if s.kind == NODE)
+    agent = next(s for s in tracer.spans if s.kind == AGENT)
+    llm = next(s for s in tracer.spans if s.kind == LLM)
+    assert agent.parent_id == node.id and llm.parent_id == agent.id